@@ -0,0 +1,250 @@
+"""
+Run time and peak memory of the cleaner primitives on synthetic tables of different shapes.
+
+Fits and produces each primitive on wide, tall, high cardinality and missing heavy tables, and prints the seconds and
+the peak memory of fit and produce. --save writes the measurements to a JSON baseline, and --compare checks the run
+against a baseline and exits with status 1 when a measurement grew by more than the tolerance, so that regressions
+are caught before they reach the cluster. A primitive that fails is an error of the harness, not a measurement: the
+run exits with status 2 and writes no baseline.
+
+    python benchmarks/cleaner_primitives.py --save baseline.json
+    python benchmarks/cleaner_primitives.py --compare baseline.json --tolerance 1.5
+    python benchmarks/cleaner_primitives.py --shapes wide tall --primitives MeanImputation IQRScaler --scale 0.1
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+import tracemalloc
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from d3m import container
+
+from dsbox.datapreprocessing.cleaner import (
+    CleaningFeaturizer, CleaningFeaturizerHyperparameter, Encoder, EncHyperparameter, FoldColumns, FoldHyperparameter,
+    GreedyImputation, GreedyHyperparameter, IQRScaler, IQRHyperparams, IterativeRegressionImputation,
+    IterativeRegressionHyperparameter, Labler, LablerHyperparams, MeanImputation, MeanHyperparameter, Profiler,
+    ProfilerHyperparams, UnaryEncoder, UEncHyperparameter)
+from dsbox.common.metadata_batch import MetadataBatch
+
+_logger = logging.getLogger(__name__)
+
+ATTRIBUTE = 'https://metadata.datadrivendiscovery.org/types/Attribute'
+CATEGORICAL = 'https://metadata.datadrivendiscovery.org/types/CategoricalData'
+FLOAT = 'http://schema.org/Float'
+INTEGER = 'http://schema.org/Integer'
+TEXT = 'http://schema.org/Text'
+PRIMARY_KEY = 'https://metadata.datadrivendiscovery.org/types/PrimaryKey'
+TARGET = 'https://metadata.datadrivendiscovery.org/types/TrueTarget'
+
+# rows, numeric columns, categorical columns, distinct values per categorical column, ratio of missing values
+SHAPES = {
+    'wide': dict(rows=2000, numeric=500, categorical=50, cardinality=10, missing=0.05),
+    'tall': dict(rows=200000, numeric=10, categorical=5, cardinality=20, missing=0.05),
+    'high_cardinality': dict(rows=50000, numeric=5, categorical=10, cardinality=20000, missing=0.05),
+    'missing_heavy': dict(rows=20000, numeric=40, categorical=10, cardinality=20, missing=0.6),
+}
+
+# numeric attributes of the table FoldColumns folds, every row becomes one row per folded column
+FOLDED_COLUMNS = 4
+
+METRICS = ['fit_seconds', 'fit_peak_mib', 'produce_seconds', 'produce_peak_mib']
+# growth below these is noise, whatever the ratio
+MIN_SECONDS = 0.05
+MIN_MIB = 1.0
+
+
+def with_semantic_types(frame, semantic_types):
+    """
+    container.DataFrame of frame, with the semantic types of each column added to the generated metadata.
+    """
+    data = container.DataFrame(frame, generate_metadata=True)
+    batch = MetadataBatch(data.metadata)
+    for col, types in enumerate(semantic_types):
+        batch.add_semantic_types(col, *types)
+    data.metadata = batch.apply()
+    return data
+
+
+def make_table(rows, numeric, categorical, cardinality, missing, seed=0):
+    """
+    Attributes and target of a synthetic table: a d3mIndex, numeric attributes that share a name prefix (so that
+    FoldColumns has work to do) and Zipf distributed categorical attributes, with missing values in both, as NaN and
+    as empty strings. The target is a binary label that depends on the first numeric attribute.
+    """
+    rng = np.random.RandomState(seed)
+    values = rng.randn(rows, numeric)
+    label = (np.nan_to_num(values[:, 0]) + rng.randn(rows) > 0).astype(int)
+    values[rng.rand(rows, numeric) < missing] = np.nan
+    frame = pd.DataFrame(values, columns=['reading_{}'.format(i) for i in range(numeric)])
+    words = np.array(['value{}'.format(i) for i in range(cardinality)], dtype=object)
+    for i in range(categorical):
+        column = words[(rng.zipf(1.5, rows) - 1) % cardinality]
+        column[rng.rand(rows) < missing] = ''
+        # letters, not numbers, so that these are not folded
+        frame['category{}'.format(chr(ord('a') + i % 26) * (i // 26 + 1))] = column
+    frame.insert(0, 'd3mIndex', np.arange(rows))
+
+    semantic_types = ([(INTEGER, PRIMARY_KEY)] + [(FLOAT, ATTRIBUTE)] * numeric +
+                      [(TEXT, CATEGORICAL, ATTRIBUTE)] * categorical)
+    inputs = with_semantic_types(frame, semantic_types)
+    outputs = with_semantic_types(pd.DataFrame({'label': label}), [(INTEGER, CATEGORICAL, TARGET)])
+    return inputs, outputs
+
+
+def numeric_table(inputs):
+    """
+    The d3mIndex and the numeric attributes, as the imputers get them in pipelines, after the encoders.
+    """
+    return inputs.select_columns([col for col in range(inputs.shape[1])
+                                  if CATEGORICAL not in inputs.metadata.query_column(col).get('semantic_types', ())])
+
+
+def fold_table(inputs):
+    """
+    The d3mIndex, FOLDED_COLUMNS numeric attributes and the categorical attributes, all as strings with '' for the
+    missing values, as DatasetToDataFrame gives the columns of a dataset. FoldColumns assigns the folded columns to an
+    empty copy of its input, which only pandas 0.25 frames of a single dtype accept.
+    """
+    semantic_types = [inputs.metadata.query_column(col)['semantic_types'] for col in range(inputs.shape[1])]
+    columns = [col for col, types in enumerate(semantic_types)
+               if FLOAT not in types or col <= FOLDED_COLUMNS]
+    frame = pd.DataFrame(inputs).iloc[:, columns]
+    text = frame.astype(str).where(frame.notnull(), '')
+    return with_semantic_types(text, [[t for t in semantic_types[col] if t not in (FLOAT, INTEGER, TEXT)] + [TEXT]
+                                      for col in columns])
+
+
+# name, primitive class, hyperparams class, whether fit takes the target, function of the table giving its inputs
+PRIMITIVES = [
+    ('Profiler', Profiler, ProfilerHyperparams, None, None),
+    ('CleaningFeaturizer', CleaningFeaturizer, CleaningFeaturizerHyperparameter, False, None),
+    ('Encoder', Encoder, EncHyperparameter, False, None),
+    ('UnaryEncoder', UnaryEncoder, UEncHyperparameter, False, None),
+    ('MeanImputation', MeanImputation, MeanHyperparameter, False, None),
+    ('GreedyImputation', GreedyImputation, GreedyHyperparameter, True, numeric_table),
+    ('IterativeRegressionImputation', IterativeRegressionImputation, IterativeRegressionHyperparameter, False, None),
+    ('IQRScaler', IQRScaler, IQRHyperparams, False, None),
+    ('Labler', Labler, LablerHyperparams, False, None),
+    ('FoldColumns', FoldColumns, FoldHyperparameter, False, fold_table),
+]
+
+
+def measure(function):
+    """
+    Run time and peak memory, from two runs since tracemalloc slows down the allocations.
+    """
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def run_primitive(primitive_class, hyperparams_class, supervised, inputs, outputs):
+    """
+    Measurements of fit and produce. Transformers, with supervised None, have no fit.
+    """
+    hyperparams = hyperparams_class.defaults()
+    result = {}
+    if supervised is None:
+        primitive = primitive_class(hyperparams=hyperparams)
+    else:
+        def fit():
+            primitive = primitive_class(hyperparams=hyperparams)
+            if supervised:
+                primitive.set_training_data(inputs=inputs, outputs=outputs)
+            else:
+                primitive.set_training_data(inputs=inputs)
+            primitive.fit()
+            return primitive
+
+        primitive, result['fit_seconds'], result['fit_peak_mib'] = measure(fit)
+    _, result['produce_seconds'], result['produce_peak_mib'] = measure(lambda: primitive.produce(inputs=inputs))
+    return result
+
+
+def regressions(baseline, measurements, tolerance):
+    """
+    Descriptions of the measurements that grew by more than tolerance times their baseline, or that failed in the run
+    or in the baseline, which has nothing to compare with then.
+    """
+    found = []
+    for key, reference in sorted(baseline.items()):
+        if key not in measurements:
+            continue
+        current = measurements[key]
+        if reference is None or current is None:
+            found.append('{}: failed in the {}'.format(key, 'baseline' if reference is None else 'run'))
+            continue
+        for metric in METRICS:
+            if metric not in reference:
+                continue
+            noise = MIN_SECONDS if metric.endswith('seconds') else MIN_MIB
+            if current[metric] > reference[metric] * tolerance and current[metric] - reference[metric] > noise:
+                found.append('{} {}: {:.3f} -> {:.3f}'.format(key, metric, reference[metric], current[metric]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--shapes', nargs='+', choices=sorted(SHAPES), default=sorted(SHAPES))
+    parser.add_argument('--primitives', nargs='+', choices=[p[0] for p in PRIMITIVES],
+                        default=[p[0] for p in PRIMITIVES])
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplies the number of rows of every shape')
+    parser.add_argument('--save', help='write the measurements to this JSON file')
+    parser.add_argument('--compare', help='JSON file of baseline measurements to check the run against')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='largest accepted ratio of a measurement to its baseline')
+    args = parser.parse_args()
+
+    measurements = {}
+    header = '{:<18}{:<32}{:>12}{:>12}{:>12}{:>12}'
+    row = '{:<18}{:<32}{:>12}{:>12}{:>12}{:>12}'
+    print(header.format('shape', 'primitive', 'fit s', 'fit MiB', 'produce s', 'produce MiB'))
+    for shape in args.shapes:
+        sizes = dict(SHAPES[shape], rows=max(10, int(SHAPES[shape]['rows'] * args.scale)))
+        inputs, outputs = make_table(**sizes)
+        for name, primitive_class, hyperparams_class, supervised, select in PRIMITIVES:
+            if name not in args.primitives:
+                continue
+            key = '{}/{}'.format(shape, name)
+            try:
+                result = run_primitive(primitive_class, hyperparams_class, supervised,
+                                       select(inputs) if select else inputs, outputs)
+            except Exception:
+                _logger.exception('%s failed', key)
+                measurements[key] = None
+                print(row.format(shape, name, 'failed', '', '', ''))
+                continue
+            measurements[key] = result
+            print(row.format(shape, name, *['{:.3f}'.format(result[metric]) if metric in result else '-'
+                                            for metric in METRICS]))
+
+    failed = sorted(key for key, result in measurements.items() if result is None)
+    if failed:
+        print('failed ' + ' '.join(failed))
+        sys.exit(2)
+
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(measurements, out, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            found = regressions(json.load(baseline_file), measurements, args.tolerance)
+        for regression in found:
+            print('regression ' + regression)
+        if found:
+            sys.exit(1)
+        print('no regression over {}x the baseline'.format(args.tolerance))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Latency of MeanImputation.produce on online scoring batches.
+
+Fits the imputer on a synthetic table of numeric attributes and one text attribute with missing values, then times
+produce on batches of a few rows, as scoring requests send them. The first call on a schema builds the column layout
+and the output metadata; the following calls reuse them. Exits with status 1 when the median warm call exceeds the
+budget.
+
+    python benchmarks/mean_imputation_latency.py --columns 50 --budget-ms 1
+"""
+import argparse
+import sys
+import time
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from d3m import container
+
+from dsbox.datapreprocessing.cleaner import MeanImputation, MeanHyperparameter
+from dsbox.common.metadata_batch import MetadataBatch
+
+BATCH_SIZES = [1, 10, 100]
+MISSING_RATIO = 0.1
+
+
+def make_frame(rows, columns, seed=0):
+    """
+    columns float attributes and a text attribute, with missing values and empty strings.
+    """
+    rng = np.random.RandomState(seed)
+    values = rng.randn(rows, columns)
+    values[rng.rand(rows, columns) < MISSING_RATIO] = np.nan
+    frame = pd.DataFrame(values, columns=['x{}'.format(i) for i in range(columns)])
+    text = np.array(['a', 'b', 'c', '', None], dtype=object)
+    frame['category'] = text[rng.choice(len(text), rows, p=[0.4, 0.3, 0.2, 0.05, 0.05])]
+
+    data = container.DataFrame(frame, generate_metadata=True)
+    batch = MetadataBatch(data.metadata)
+    for col in range(data.shape[1]):
+        batch.add_semantic_types(col, 'https://metadata.datadrivendiscovery.org/types/Attribute')
+    for col in range(columns):
+        batch.add_semantic_types(col, 'http://schema.org/Float')
+    data.metadata = batch.apply()
+    return data
+
+
+def time_calls(function, calls):
+    """
+    Seconds of each call.
+    """
+    seconds = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return np.array(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--train-rows', type=int, default=10000)
+    parser.add_argument('--columns', type=int, default=50)
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--budget-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    imputer = MeanImputation(hyperparams=MeanHyperparameter.defaults())
+    imputer.set_training_data(inputs=make_frame(args.train_rows, args.columns))
+    imputer.fit()
+
+    # a scoring service loads the fitted parameters into a new primitive
+    scorer = MeanImputation(hyperparams=MeanHyperparameter.defaults())
+    scorer.set_params(params=imputer.get_params())
+
+    requests = make_frame(max(BATCH_SIZES), args.columns, seed=1)
+    print('{} columns, produce with timeout=None, {} calls per batch size'.format(requests.shape[1], args.calls))
+    header = '{:<8}{:>12}{:>12}{:>12}{:>12}'
+    row = '{:<8}{:>12.3f}{:>12.3f}{:>12.3f}{:>12.3f}'
+    print(header.format('rows', 'first ms', 'median ms', 'p99 ms', 'max ms'))
+
+    slowest = 0.0
+    for rows in BATCH_SIZES:
+        batch = requests.iloc[:rows]
+        batch.metadata = requests.metadata.update((), {'dimension': {'length': rows}})
+        first = time_calls(lambda: scorer.produce(inputs=batch), 1)[0]
+        result = scorer.produce(inputs=batch).value
+        assert not pd.isnull(result.iloc[:, :args.columns]).values.any()
+        assert not (result['category'].isnull() | (result['category'] == '')).any()
+
+        seconds = time_calls(lambda: scorer.produce(inputs=batch), args.calls) * 1000
+        median = float(np.median(seconds))
+        slowest = max(slowest, median)
+        print(row.format(rows, first * 1000, median, np.percentile(seconds, 99), seconds.max()))
+
+    if slowest > args.budget_ms:
+        print('median produce {:.3f} ms is over the {} ms budget'.format(slowest, args.budget_ms))
+        sys.exit(1)
+    print('median produce under {} ms for all batch sizes'.format(args.budget_ms))
+
+
+if __name__ == '__main__':
+    main()
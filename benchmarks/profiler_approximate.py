@@ -0,0 +1,110 @@
+"""
+Exact vs approximate profiling of high cardinality text columns.
+
+Profiles the same synthetic columns with the exact kernel (feature_compute_fused) and with the bounded memory
+sketches (feature_compute_stream) at a few error bounds, and reports the metafeatures, the run time and the peak
+memory side by side.
+
+    python benchmarks/profiler_approximate.py --rows 1000000
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_fused as fc_fused
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_stream as fc_stream
+from dsbox.datapreprocessing.cleaner.dependencies.sketches import HyperLogLog, SpaceSaving
+
+FEATURES = ['number_of_distinct_values', 'ratio_of_distinct_values', 'number_of_distinct_tokens',
+            'ratio_of_distinct_tokens', 'most_common_tokens', 'most_common_raw_values']
+TOP_K = 10
+# (distinct_count_error, top_k_error)
+ERROR_BOUNDS = [(0.05, 0.01), (0.01, 0.001), (0.005, 0.0001)]
+
+
+def make_column(rows, vocabulary, seed=0):
+    """
+    Two-token cells: a Zipf distributed token, so there are heavy hitters, and a uniform one, so most cells are
+    distinct.
+    """
+    rng = np.random.RandomState(seed)
+    words = np.array(['w{}'.format(i) for i in range(vocabulary)], dtype=object)
+    heavy = words[rng.zipf(1.3, rows) % vocabulary]
+    uniform = words[rng.randint(0, vocabulary, rows)]
+    return pd.Series(heavy + ' ' + uniform)
+
+
+def measure(function):
+    """
+    Run time and peak memory, from two runs since tracemalloc slows down the allocations.
+    """
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def exact(column):
+    feature = dict()
+    fc_fused.compute_text_features(column, feature, FEATURES, TOP_K)
+    return feature
+
+
+def approximate(column, chunk_size, distinct_count_error, top_k_error):
+    chunks = (column.iloc[start:start + chunk_size].to_frame() for start in range(0, column.size, chunk_size))
+    return fc_stream.profile_chunks(chunks, FEATURES, TOP_K,
+                                    precision=HyperLogLog.precision_for(distinct_count_error),
+                                    capacity=SpaceSaving.capacity_for(top_k_error))[0]
+
+
+def compare_top(exact_top, approximate_top):
+    """
+    Share of the exact top k found by the approximation, and the largest count error relative to the exact count.
+    """
+    exact_counts = {e['name']: e['count'] for e in exact_top}
+    found = [e for e in approximate_top if e['name'] in exact_counts]
+    recall = len(found) / float(len(exact_top))
+    error = max([abs(e['count'] - exact_counts[e['name']]) / float(exact_counts[e['name']]) for e in found] or [0])
+    return recall, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--vocabulary', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+
+    column = make_column(args.rows, args.vocabulary)
+    reference, seconds, peak = measure(lambda: exact(column))
+    print('{} rows, {} distinct values, {} distinct tokens'.format(
+        args.rows, reference['number_of_distinct_values'], reference['number_of_distinct_tokens']))
+
+    header = '{:<22}{:>10}{:>10}{:>14}{:>10}{:>14}{:>10}{:>12}{:>10}'
+    row = '{:<22}{:>10.2f}{:>10.1f}{:>14}{:>10.4f}{:>14}{:>10.4f}{:>12.2f}{:>10.4f}'
+    print(header.format('mode', 'seconds', 'peak MiB', 'distinct val', 'rel err', 'distinct tok', 'rel err',
+                        'top recall', 'top err'))
+    print(row.format('exact', seconds, peak, reference['number_of_distinct_values'], 0,
+                     reference['number_of_distinct_tokens'], 0, 1, 0))
+    for distinct_count_error, top_k_error in ERROR_BOUNDS:
+        result, seconds, peak = measure(
+            lambda: approximate(column, args.chunk_size, distinct_count_error, top_k_error))
+        recall, error = compare_top(reference['most_common_tokens'], result['most_common_tokens'])
+        print(row.format(
+            'approx {}/{}'.format(distinct_count_error, top_k_error), seconds, peak,
+            result['number_of_distinct_values'],
+            abs(result['number_of_distinct_values'] / reference['number_of_distinct_values'] - 1),
+            result['number_of_distinct_tokens'],
+            abs(result['number_of_distinct_tokens'] / reference['number_of_distinct_tokens'] - 1),
+            recall, error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Batched metadata updates.
+
+Every ``metadata.update`` call builds a new metadata object, and the primitives used to query and update the metadata
+of each column several times in turn, so annotating a wide table cost several copies per column. MetadataBatch
+collects the changes, answers queries from the pending changes, and merges the changes to the same selector, so that
+applying them takes a single public ``update`` per selector.
+
+    batch = MetadataBatch(inputs.metadata)
+    for col in columns:
+        batch.add_semantic_types(col, 'http://schema.org/Integer')
+        batch.update_column(col, {'structural_type': int})
+    inputs.metadata = batch.apply()
+"""
+import collections
+import logging
+import typing
+
+from d3m.metadata import base as mbase
+
+_logger = logging.getLogger(__name__)
+
+Selector = typing.Tuple[typing.Any, ...]
+
+
+class MetadataBatch:
+    """
+    Pending changes to a metadata object. Changes to the same selector are merged in order, the later values win.
+    """
+
+    def __init__(self, metadata: mbase.DataMetadata) -> None:
+        self.metadata = metadata
+        self._pending: typing.Dict[Selector, typing.Dict[str, typing.Any]] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def query(self, selector: Selector) -> typing.Dict[str, typing.Any]:
+        """
+        Metadata at selector with the pending changes for the same selector applied. Unlike DataMetadata.query the
+        result is a plain dict the caller may modify.
+        """
+        selector = tuple(selector)
+        result = dict(self.metadata.query(selector))
+        for key, value in self._pending.get(selector, {}).items():
+            if value is mbase.NO_VALUE:
+                result.pop(key, None)
+            else:
+                result[key] = value
+        return result
+
+    def query_column(self, column_index: int) -> typing.Dict[str, typing.Any]:
+        return self.query((mbase.ALL_ELEMENTS, column_index))
+
+    def update(self, selector: Selector, changes: typing.Mapping[str, typing.Any]) -> None:
+        selector = tuple(selector)
+        self._pending.setdefault(selector, {}).update(changes)
+
+    def update_column(self, column_index: int, changes: typing.Mapping[str, typing.Any]) -> None:
+        self.update((mbase.ALL_ELEMENTS, column_index), changes)
+
+    def add_semantic_types(self, column_index: int, *semantic_types: str) -> None:
+        """
+        Append the semantic types the column does not have yet.
+        """
+        current = tuple(self.query_column(column_index).get('semantic_types', ()))
+        added = tuple(t for t in semantic_types if t not in current)
+        if added:
+            self.update_column(column_index, {'semantic_types': current + added})
+
+    def remove_semantic_types(self, column_index: int, *semantic_types: str) -> None:
+        current = tuple(self.query_column(column_index).get('semantic_types', ()))
+        kept = tuple(t for t in current if t not in semantic_types)
+        if len(kept) != len(current):
+            self.update_column(column_index, {'semantic_types': kept})
+
+    def apply(self) -> mbase.DataMetadata:
+        """
+        The metadata with all the pending changes, which are then cleared. The original metadata is not modified.
+        """
+        metadata = self.metadata
+        for selector, change in self._pending.items():
+            metadata = metadata.update(selector, change)
+        _logger.debug('Applied metadata changes to %d selectors', len(self._pending))
+        self._pending.clear()
+        self.metadata = metadata
+        return metadata
@@ -10,6 +10,7 @@ from d3m.primitive_interfaces.base import CallResult, MultiCallResult
 from d3m.metadata.base import ALL_ELEMENTS
 from copy import copy
 
+from dsbox.common.metadata_batch import MetadataBatch
 from dsbox.datapreprocessing.cleaner import config
 
 __all__ = ('HorizontalConcat',)
@@ -83,12 +84,12 @@ class HorizontalConcat(TransformerPrimitiveBase[Inputs, Outputs, HorizontalConca
             columns={inputs2.columns[-1]: str(self.hyperparams["column_name"]+1)})
         new_df = common_utils.horizontal_concat(left, right)
 
+        batch = MetadataBatch(new_df.metadata)
         for i, column in enumerate(new_df.columns):
-            column_metadata = dict(new_df.metadata.query((ALL_ELEMENTS, i)))
+            column_metadata = new_df.metadata.query((ALL_ELEMENTS, i))
             if 'https://metadata.datadrivendiscovery.org/types/PrimaryKey' not in column_metadata["semantic_types"]:
-                column_metadata["semantic_types"] = self.hyperparams["to_semantic_types"]
-                new_df.metadata = new_df.metadata.update(
-                    (ALL_ELEMENTS, i), column_metadata)
+                batch.update_column(i, {"semantic_types": self.hyperparams["to_semantic_types"]})
+        new_df.metadata = batch.apply()
         return CallResult(new_df)
 
 # functions to fit in devel branch of d3m (2019-1-17)
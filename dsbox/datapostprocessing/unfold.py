@@ -1,6 +1,7 @@
 from d3m import container
 from d3m.primitive_interfaces.transformer import TransformerPrimitiveBase
 from d3m.metadata import hyperparams
+from dsbox.common.metadata_batch import MetadataBatch
 from dsbox.datapreprocessing.cleaner import config
 from d3m.primitive_interfaces.base import CallResult
 import common_primitives.utils as common_utils
@@ -156,9 +157,10 @@ class Unfold(TransformerPrimitiveBase[Inputs, Outputs, UnfoldHyperparams]):
             df = common_utils.horizontal_concat(left=df, right=extends)
             origin_metadata = dict(df.metadata.query((mbase.ALL_ELEMENTS, df.columns.get_loc(col_name))))
 
+            batch = MetadataBatch(df.metadata)
             for name in extend_col_names:
                 col_idx = df.columns.get_loc(name)
-                origin_metadata["name"] = name
-                df.metadata = df.metadata.update((mbase.ALL_ELEMENTS, col_idx), origin_metadata)
+                batch.update_column(col_idx, dict(origin_metadata, name=name))
+            df.metadata = batch.apply()
 
         return df
@@ -1,6 +1,7 @@
 import typing
 import pandas as pd
 import d3m.metadata.base as mbase
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 import logging
 # from d3m.primitive_interfaces.featurization import FeaturizationLearnerPrimitiveBase, FeaturizationTransformerPrimitiveBase
@@ -149,7 +150,7 @@ class IQRScaler(UnsupervisedLearnerPrimitiveBase[Inputs, Outputs, Params, IQRHyp
         self._s_cols = list(set(all_attributes).intersection(numerical_attributes))
         # print(" %d columns scaled" % (len(self._s_cols)))
         if len(self._s_cols) > 0:
-            self._model.fit(self._training_data.iloc[:, self._s_cols])
+            self._model.fit(self._scaled_columns(self._training_data))
             self._fitted = True
         else:
             self._fitted = False
@@ -161,7 +162,7 @@ class IQRScaler(UnsupervisedLearnerPrimitiveBase[Inputs, Outputs, Params, IQRHyp
             return CallResult(inputs, True, 1)
         # If `inputs` has index, then this statement will cause the for loop to introduce blank rows
         # temp = pd.DataFrame(self._model.transform(inputs.iloc[:, self._s_cols]))
-        temp = pd.DataFrame(self._model.transform(inputs.iloc[:, self._s_cols]), index=inputs.index)
+        temp = pd.DataFrame(self._model.transform(self._scaled_columns(inputs)), index=inputs.index)
         outputs = inputs.copy()
         for id_index, od_index in zip(self._s_cols, range(temp.shape[1])):
             outputs.iloc[:, id_index] = temp.iloc[:, od_index]
@@ -174,25 +175,30 @@ class IQRScaler(UnsupervisedLearnerPrimitiveBase[Inputs, Outputs, Params, IQRHyp
                     'https://metadata.datadrivendiscovery.org/types/Attribute')
         }
 
+        batch = MetadataBatch(outputs.metadata)
         for d, index in zip(new_dtype, self._s_cols):
-            # print("old metadata : ", outputs.metadata.query((mbase.ALL_ELEMENTS, index)))
-            old_metadata = dict(outputs.metadata.query((mbase.ALL_ELEMENTS, index)))
             if d == np.dtype(np.float16) or d == np.dtype(np.float32) or \
                     d == np.dtype(np.float64) or d == np.dtype(np.float128):
-                old_metadata["semantic_types"] = lookup["float"]
-                old_metadata["structural_type"] = type(10.0)
+                batch.update_column(index, {"semantic_types": lookup["float"], "structural_type": type(10.0)})
             else:
-                old_metadata["semantic_types"] = lookup["int"]
-                old_metadata["structural_type"] = type(10)
-            outputs.metadata = outputs.metadata.update((mbase.ALL_ELEMENTS, index), old_metadata)
-            # print("updated dict : ",old_metadata)
-            # print("check again : ", outputs.metadata.query((mbase.ALL_ELEMENTS, index)))
+                batch.update_column(index, {"semantic_types": lookup["int"], "structural_type": type(10)})
+        outputs.metadata = batch.apply()
 
         if outputs.shape == inputs.shape:
             return CallResult(d3m_DataFrame(outputs), True, 1)
         else:
             return CallResult(inputs, True, 1)
 
+    def _scaled_columns(self, inputs: Inputs) -> pd.DataFrame:
+        """
+        The columns to scale. sklearn reads a frame of only sparse columns (such as the sparse output of the encoders)
+        as a sparse matrix, which RobustScaler cannot center, so those are made dense as the mixed frames are.
+        """
+        columns = inputs.iloc[:, self._s_cols]
+        if all(isinstance(dtype, pd.SparseDtype) for dtype in columns.dtypes):
+            columns = columns.sparse.to_dense()
+        return columns
+
     @classmethod
     def _get_columns_to_fit(cls, inputs: Inputs, hyperparams: IQRHyperparams):
         if not hyperparams['use_semantic_types']:
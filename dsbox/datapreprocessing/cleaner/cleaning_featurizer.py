@@ -1,4 +1,5 @@
 import logging
+import sys
 import pandas as pd
 import numpy as np
 
@@ -14,6 +15,8 @@ import common_primitives.utils as common_utils
 from dsbox.datapreprocessing.cleaner.dependencies.date_featurizer_org import DateFeaturizerOrg
 from dsbox.datapreprocessing.cleaner.dependencies.spliter import PhoneParser, PunctuationParser, NumAlphaParser
 from dsbox.datapreprocessing.cleaner.dependencies.helper_funcs import HelperFunction
+from dsbox.common.metadata_batch import MetadataBatch
+from dsbox.datapreprocessing.cleaner.dependencies import profile_cache
 
 from . import config
 
@@ -95,6 +98,27 @@ class CleaningFeaturizerHyperparameter(hyperparams.Hyperparams):
         description="Also include primary index columns if input data has them. Applicable only if \"return_result\" is set to \"new\".",
     )
 
+    cache = hyperparams.Enumeration(
+        values=profile_cache.CACHE_MODES,
+        default='none',
+        description='Reuse the columns detected on a table already fitted on, found by a hash of its content and '
+                    'metadata. "memory" keeps the results in this process, "disk" also stores them in cache_directory.',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    cache_directory = hyperparams.Hyperparameter[Union[str, None]](
+        None,
+        description='Directory of the disk cache, which must belong to the user and not be writable by others. '
+                    'Defaults to dsbox/profile_cache in the cache directory of the user (~/.cache).',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    cache_size = hyperparams.UniformInt(
+        lower=1,
+        upper=sys.maxsize,
+        default=256 * 2 ** 20,
+        description='Size cap in bytes of the memory cache, and of the disk cache. The least recently used results '
+                    'are evicted first.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
 
 # class Params(params.Params):
 #     components_: typing.Any
@@ -149,6 +173,8 @@ class CleaningFeaturizer(UnsupervisedLearnerPrimitiveBase[Input, Output, Cleanin
         self._col_index = None
 
         self._clean_operations = Clean_operations
+        self._cache = profile_cache.get_cache(hyperparams['cache'], hyperparams['cache_size'],
+                                              hyperparams['cache_directory'])
 
     def get_params(self) -> CleaningFeaturizerParams:
         if not self._fitted:
@@ -171,6 +197,17 @@ class CleaningFeaturizer(UnsupervisedLearnerPrimitiveBase[Input, Output, Cleanin
         if self._input_data is None:
             raise ValueError('Missing training(fitting) data.')
 
+        cache_key = None
+        if self._cache is not None:
+            cache_key = profile_cache.table_fingerprint(
+                self._input_data, self._input_data.metadata, 'cleaning_featurizer', config.VERSION,
+                self.hyperparams['split_on_column_with_avg_len'], sorted(self._clean_operations.items()))
+            mapping = self._cache.get(cache_key)
+            if mapping is not None:
+                self._mapping = mapping
+                self._fitted = True
+                return CallResult(None, has_finished=True, iterations_done=1)
+
         if self._clean_operations:
             data = self._input_data.copy()
             mapping = dict()
@@ -205,6 +242,8 @@ class CleaningFeaturizer(UnsupervisedLearnerPrimitiveBase[Input, Output, Cleanin
 
             self._mapping = mapping
 
+        if cache_key is not None:
+            self._cache.put(cache_key, self._mapping)
         self._fitted = True
         return CallResult(None, has_finished=True, iterations_done=1)
 
@@ -341,8 +380,9 @@ class CleaningFeaturizer(UnsupervisedLearnerPrimitiveBase[Input, Output, Cleanin
         return range(df.shape[1])
 
     def _update_structural_type(self):
+        batch = MetadataBatch(self._input_data_copy.metadata)
         for col in range(self._input_data_copy.shape[1]):
-            old_metadata = dict(self._input_data_copy.metadata.query((mbase.ALL_ELEMENTS, col)))
+            old_metadata = batch.query_column(col)
             semantic_type = old_metadata.get('semantic_types', None)
             if not semantic_type:
                 numerics = pd.to_numeric(self._input_data_copy.iloc[:, col], errors='coerce')
@@ -378,5 +418,5 @@ class CleaningFeaturizer(UnsupervisedLearnerPrimitiveBase[Input, Output, Cleanin
                                                                        errors='coerce')
                     old_metadata['structural_type'] = type(10.2)
 
-            self._input_data_copy.metadata = self._input_data_copy.metadata.update((mbase.ALL_ELEMENTS, col),
-                                                                                   old_metadata)
+            batch.update_column(col, old_metadata)
+        self._input_data_copy.metadata = batch.apply()
@@ -6,6 +6,7 @@ import logging
 import d3m.metadata.base as mbase
 from common_primitives import utils
 from d3m.container import DataFrame as d3m_DataFrame
+from dsbox.common.metadata_batch import MetadataBatch
 from dsbox.datapreprocessing.cleaner.dependencies.helper_funcs import HelperFunction
 
 from typing import Dict
@@ -303,8 +304,9 @@ class FoldColumns(UnsupervisedLearnerPrimitiveBase[Input, Output, FoldParams, Fo
         for key in added_cols:
             indices.append(df.columns.get_loc(key))
 
+        batch = MetadataBatch(df.metadata)
         for idx in indices:
-            old_metadata = dict(df.metadata.query((mbase.ALL_ELEMENTS, idx)))
+            old_metadata = batch.query_column(idx)
 
             numerics = pd.to_numeric(df.iloc[:, idx], errors='coerce')
             length = numerics.shape[0]
@@ -328,6 +330,7 @@ class FoldColumns(UnsupervisedLearnerPrimitiveBase[Input, Output, FoldParams, Fo
 
             old_metadata['semantic_types'] += ("https://metadata.datadrivendiscovery.org/types/Attribute",)
 
-            df.metadata = df.metadata.update((mbase.ALL_ELEMENTS, idx), old_metadata)
+            batch.update_column(idx, old_metadata)
 
+        df.metadata = batch.apply()
         return df
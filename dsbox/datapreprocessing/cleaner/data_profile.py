@@ -1,12 +1,13 @@
 import json
-
-from collections import defaultdict
+import multiprocessing
 
 import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 import pytypes  # type: ignore
 import logging
+import sys
 import traceback
+import typing
 
 from d3m import container, types
 from d3m.metadata import hyperparams
@@ -18,8 +19,10 @@ from d3m.primitive_interfaces.transformer import TransformerPrimitiveBase
 from dsbox.datapreprocessing.cleaner.dependencies.date_featurizer_org import DateFeaturizerOrg
 from dsbox.datapreprocessing.cleaner.dependencies.spliter import PhoneParser, PunctuationParser, NumAlphaParser
 from dsbox.datapreprocessing.cleaner.dependencies.helper_funcs import HelperFunction
+from dsbox.common.metadata_batch import MetadataBatch
 from dsbox.datapreprocessing.cleaner.dependencies import category_detection, dtype_detector, \
-    feature_compute_hih as fc_hih, feature_compute_lfh as fc_lfh
+    feature_compute_hih as fc_hih, feature_compute_fused as fc_fused, feature_compute_stream as fc_stream, \
+    sketches, profile_cache
 from . import config
 
 # from . import date_detector
@@ -55,12 +58,60 @@ default_metafeatures = [
     'ratio_of_values_containing_numeric_char', 'ratio_of_numeric_values',
     'number_of_outlier_numeric_values', 'num_filename', 'number_of_tokens_containing_numeric_char', 'semantic_types']
 
+# rows per chunk of the approximate mode, when chunk_size is not set
+APPROXIMATE_CHUNK_SIZE = 100000
+
 metafeature_hyperparam = hyperparams.Enumeration(
     computable_metafeatures,
     computable_metafeatures[0],
     semantic_types=['https://metadata.datadrivendiscovery.org/types/MetafeatureParameter'])
 
 
+def _profile_column(col, specified_features, topk, punctuation_outlier_weight):
+    """
+    Compute the column-level metafeatures of one column. Module level and returning a plain dict, so it can run in a
+    worker process.
+    """
+    # dict: map feature name to content
+    each_res = dict()
+
+    if col.dtype.kind in np.typecodes['AllInteger'] + 'uMmf':
+        if ("number_of_missing_values" in specified_features):
+            each_res["number_of_missing_values"] = pd.isnull(col).sum()
+        if ("ratio_of_missing_values" in specified_features):
+            each_res["ratio_of_missing_values"] = pd.isnull(col).sum() / col.size
+        if ("number_of_distinct_values" in specified_features):
+            each_res["number_of_distinct_values"] = col.nunique()
+        if ("ratio_of_distinct_values" in specified_features):
+            each_res["ratio_of_distinct_values"] = col.nunique() / float(col.size)
+
+    if col.dtype.kind == 'b':
+        if ("most_common_raw_values" in specified_features):
+            fc_hih.compute_common_values(col.dropna().astype(str), each_res, topk)
+
+    elif col.dtype.kind in np.typecodes['AllInteger'] + 'uf':
+        fc_hih.compute_numerics(col, each_res,
+                                specified_features)  # TODO: do the checks inside the function
+        if ("most_common_raw_values" in specified_features):
+            fc_hih.compute_common_values(col.dropna().astype(str), each_res, topk)
+
+    else:
+
+        # Need to compute str missing values before fillna
+        if "number_of_missing_values" in specified_features:
+            each_res["number_of_missing_values"] = pd.isnull(col).sum()
+        if "ratio_of_missing_values" in specified_features:
+            each_res["ratio_of_missing_values"] = pd.isnull(col).sum() / col.size
+
+        col = col.astype(object).fillna('').astype(str)
+
+        # single pass over the column: tokenized once, intermediates shared by all the requested features
+        fc_fused.compute_text_features(col, each_res, specified_features, topk,
+                                       punctuation_outlier_weight=punctuation_outlier_weight)
+
+    return each_res
+
+
 class Hyperparams(hyperparams.Hyperparams):
     split_on_column_with_avg_len = hyperparams.Uniform(
         default=30,
@@ -75,6 +126,68 @@ class Hyperparams(hyperparams.Hyperparams):
         description="Compute metadata descriptions of the dataset",
         semantic_types=['https://metadata.datadrivendiscovery.org/types/MetafeatureParameter'])
 
+    n_jobs = hyperparams.UniformInt(
+        lower=1,
+        upper=sys.maxsize,
+        default=1,
+        description='Specify number of processes used to profile the columns. Default is no multiprocessing.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    chunk_size = hyperparams.UniformInt(
+        lower=0,
+        upper=sys.maxsize,
+        default=0,
+        description='Number of rows profiled at a time. When set, the column metafeatures are computed chunk by chunk '
+                    'with mergeable sketches, in bounded memory; distinct counts, most common values and quantiles may '
+                    'then be approximate on large columns. Default 0 profiles the whole table at once.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    approximate = hyperparams.UniformBool(
+        default=False,
+        description='Compute the column metafeatures with bounded memory sketches, within the distinct_count_error and '
+                    'top_k_error bounds, instead of exactly. The table is profiled chunk_size rows at a time, or '
+                    '{} rows when chunk_size is 0.'.format(APPROXIMATE_CHUNK_SIZE),
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    distinct_count_error = hyperparams.Uniform(
+        default=0.01,
+        lower=0.001,
+        upper=0.2,
+        upper_inclusive=True,
+        description='Relative standard error of the approximate number of distinct values and tokens',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    top_k_error = hyperparams.Uniform(
+        default=0.001,
+        lower=0.0001,
+        upper=0.1,
+        upper_inclusive=True,
+        description='Largest over estimation of an approximate most_common_* count, as a fraction of the number of '
+                    'values of the column',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    cache = hyperparams.Enumeration(
+        values=profile_cache.CACHE_MODES,
+        default='none',
+        description='Reuse the profile of a table already profiled with the same metafeatures, found by a hash of its '
+                    'content and metadata. "memory" keeps the profiles in this process, "disk" also stores them in '
+                    'cache_directory.',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    cache_directory = hyperparams.Hyperparameter[typing.Union[str, None]](
+        None,
+        description='Directory of the disk cache, which must belong to the user and not be writable by others. '
+                    'Defaults to dsbox/profile_cache in the cache directory of the user (~/.cache).',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
+    cache_size = hyperparams.UniformInt(
+        lower=1,
+        upper=sys.maxsize,
+        default=256 * 2 ** 20,
+        description='Size cap in bytes of the memory cache, and of the disk cache. The least recently used profiles '
+                    'are evicted first.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+
 
 class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
     """
@@ -112,7 +225,6 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
         self.hyperparams = hyperparams
         self._punctuation_outlier_weight = 3
         self._numerical_outlier_weight = 3
-        self._token_delimiter = " "
         self._detect_language = False
         self._topk = 10
         self._verbose = VERBOSE
@@ -120,6 +232,18 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
         self._DateFeaturizer: DateFeaturizerOrg = None
         # list of specified features to compute
         self._specified_features = hyperparams["metafeatures"] if hyperparams else default_metafeatures
+        self._n_jobs = min(hyperparams["n_jobs"], multiprocessing.cpu_count()) if hyperparams else 1
+        self._chunk_size = hyperparams["chunk_size"] if hyperparams else 0
+        self._approximate = hyperparams["approximate"] if hyperparams else False
+        if self._approximate and not self._chunk_size:
+            self._chunk_size = APPROXIMATE_CHUNK_SIZE
+        self._sketch_args = dict()
+        if self._approximate:
+            self._sketch_args = {
+                'precision': sketches.HyperLogLog.precision_for(hyperparams["distinct_count_error"]),
+                'capacity': sketches.SpaceSaving.capacity_for(hyperparams["top_k_error"])}
+        self._cache = profile_cache.get_cache(hyperparams["cache"], hyperparams["cache_size"],
+                                              hyperparams["cache_directory"]) if hyperparams else None
 
     def produce(self, *, inputs: Input, timeout: float = None, iterations: int = None) -> CallResult[Output]:
         """
@@ -145,6 +269,14 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
                 # Nothing to do, since cannot store the computed metadata.
                 return CallResult(inputs)
 
+        cache_key = None
+        if self._cache is not None and isinstance(inputs, container.DataFrame):
+            cache_key = profile_cache.table_fingerprint(inputs, inputs.metadata, *self._cache_key_parts())
+            metadata = self._cache.get(cache_key)
+            if metadata is not None:
+                inputs.metadata = metadata
+                return CallResult(inputs)
+
         # calling the utility to detect integer and float datatype columns
         # inputs = dtype_detector.detector(inputs)
 
@@ -166,37 +298,12 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
         except Exception:
             _logger.error("Detect date failed", exec_info=True)
             cols = list()
+        batch = MetadataBatch(inputs.metadata)
         if cols:
             indices = [inputs.columns.get_loc(c) for c in cols if c in inputs.columns]
             for i in indices:
-                old_metadata = dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i)))
-                temp_value = list(old_metadata["semantic_types"])
-                if len(temp_value) >= 1:
-                    # if 'https://metadata.datadrivendiscovery.org/types/CategoricalData' not in old_metadata.get(
-                    #         "semantic_types", []):
-                    #     old_metadata["semantic_types"] = (
-                    #         'https://metadata.datadrivendiscovery.org/types/CategoricalData',
-                    #         'https://metadata.datadrivendiscovery.org/types/Attribute')
-                    if 'https://metadata.datadrivendiscovery.org/types/Time' not in old_metadata.get("semantic_types",
-                                                                                                     []):
-                        old_metadata["semantic_types"] += ('https://metadata.datadrivendiscovery.org/types/Time',)
-                # if isinstance(self._sample_df.iloc[:, i].head(1).values[0], str):
-                #     old_metadata["structural_type"] = type("str")
-                # elif isinstance(self._sample_df.iloc[:, i].head(1).values[0], int):
-                #     old_metadata["structural_type"] = type(10)
-                # else:
-                #     old_metadata["structural_type"] = type(10.2)
-
-                _logger.info(
-                    "Date detector. 'column_index': '%(column_index)d', 'old_metadata': '%(old_metadata)s', 'new_metadata': '%(new_metadata)s'",
-                    {
-                        'column_index': i,
-                        'old_metadata': dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i))),
-                        'new_metadata': old_metadata,
-                    },
-                )
-
-                inputs.metadata = inputs.metadata.update((mbase.ALL_ELEMENTS, i), old_metadata)
+                if batch.query_column(i).get("semantic_types"):
+                    self._annotate(batch, i, 'https://metadata.datadrivendiscovery.org/types/Time', "Date detector")
 
         # calling the PhoneParser detector
 
@@ -205,31 +312,9 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
         except Exception:
             _logger.error("Phone parser failed", exc_info=True)
             PhoneParser_indices = dict()
-        if PhoneParser_indices.get("columns_to_perform"):
-            for i in PhoneParser_indices["columns_to_perform"]:
-                old_metadata = dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i)))
-                # print("old metadata", old_metadata)
-                if 'https://metadata.datadrivendiscovery.org/types/isAmericanPhoneNumber' not in old_metadata.get(
-                        "semantic_types", []):
-                    old_metadata["semantic_types"] += (
-                        'https://metadata.datadrivendiscovery.org/types/isAmericanPhoneNumber',)
-
-                # if isinstance(self._sample_df.iloc[:, i].head(1).values[0], str):
-                #     old_metadata["structural_type"] = type("str")
-                # elif isinstance(self._sample_df.iloc[:, i].head(1).values[0], int):
-                #     old_metadata["structural_type"] = type(10)
-                # else:
-                #     old_metadata["structural_type"] = type(10.2)
-
-                _logger.info(
-                    "Phone detector. 'column_index': '%(column_index)d', 'old_metadata': '%(old_metadata)s', 'new_metadata': '%(new_metadata)s'",
-                    {
-                        'column_index': i,
-                        'old_metadata': dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i))),
-                        'new_metadata': old_metadata,
-                    },
-                )
-                inputs.metadata = inputs.metadata.update((mbase.ALL_ELEMENTS, i), old_metadata)
+        for i in PhoneParser_indices.get("columns_to_perform", []):
+            self._annotate(batch, i, 'https://metadata.datadrivendiscovery.org/types/isAmericanPhoneNumber',
+                           "Phone detector")
 
         # calling the PunctuationSplitter detector
 
@@ -239,30 +324,9 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
         except Exception:
             _logger.error("Punctuation parser failed", exc_info=True)
             PunctuationSplitter_indices = dict()
-        if PunctuationSplitter_indices.get("columns_to_perform"):
-            for i in PunctuationSplitter_indices["columns_to_perform"]:
-                old_metadata = dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i)))
-                if 'https://metadata.datadrivendiscovery.org/types/TokenizableByPunctuation' not in old_metadata.get(
-                        "semantic_types", []):
-                    old_metadata["semantic_types"] += (
-                        'https://metadata.datadrivendiscovery.org/types/TokenizableByPunctuation',)
-
-                # if isinstance(self._sample_df.iloc[:, i].head(1).values[0], str):
-                #     old_metadata["structural_type"] = type("str")
-                # elif isinstance(self._sample_df.iloc[:, i].head(1).values[0], int):
-                #     old_metadata["structural_type"] = type(10)
-                # else:
-                #     old_metadata["structural_type"] = type(10.2)
-
-                _logger.info(
-                    "Punctuation detector. 'column_index': '%(column_index)d', 'old_metadata': '%(old_metadata)s', 'new_metadata': '%(new_metadata)s'",
-                    {
-                        'column_index': i,
-                        'old_metadata': dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i))),
-                        'new_metadata': old_metadata,
-                    },
-                )
-                inputs.metadata = inputs.metadata.update((mbase.ALL_ELEMENTS, i), old_metadata)
+        for i in PunctuationSplitter_indices.get("columns_to_perform", []):
+            self._annotate(batch, i, 'https://metadata.datadrivendiscovery.org/types/TokenizableByPunctuation',
+                           "Punctuation detector")
 
         # calling the NumAlphaSplitter detector
 
@@ -272,70 +336,60 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
         except Exception:
             _logger.error("Num alpha parser failed", exc_info=True)
             NumAlphaSplitter_indices = dict()
-
-        if NumAlphaSplitter_indices.get("columns_to_perform"):
-            for i in NumAlphaSplitter_indices["columns_to_perform"]:
-                old_metadata = dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i)))
-                if 'https://metadata.datadrivendiscovery.org/types/TokenizableIntoNumericAndAlphaTokens' not in old_metadata.get(
-                        "semantic_types", []):
-                    old_metadata["semantic_types"] += (
-                        'https://metadata.datadrivendiscovery.org/types/TokenizableIntoNumericAndAlphaTokens',)
-
-                # if isinstance(self._sample_df.iloc[:, i].head(1).values[0], str):
-                #     old_metadata["structural_type"] = type("str")
-                # elif isinstance(self._sample_df.iloc[:, i].head(1).values[0], int):
-                #     old_metadata["structural_type"] = type(10)
-                # else:
-                #     old_metadata["structural_type"] = type(10.2)
-
-                _logger.info(
-                    "NumAlpha detector. 'column_index': '%(column_index)d', 'old_metadata': '%(old_metadata)s', 'new_metadata': '%(new_metadata)s'",
-                    {
-                        'column_index': i,
-                        'old_metadata': dict(inputs.metadata.query((mbase.ALL_ELEMENTS, i))),
-                        'new_metadata': old_metadata,
-                    },
-                )
-                inputs.metadata = inputs.metadata.update((mbase.ALL_ELEMENTS, i), old_metadata)
-
-        inputs = self._relabel_categorical(inputs)
+        for i in NumAlphaSplitter_indices.get("columns_to_perform", []):
+            self._annotate(batch, i,
+                           'https://metadata.datadrivendiscovery.org/types/TokenizableIntoNumericAndAlphaTokens',
+                           "NumAlpha detector")
+
+        self._relabel_categorical(inputs, batch)
+        inputs.metadata = batch.apply()
+        if cache_key is not None:
+            self._cache.put(cache_key, inputs.metadata)
         return CallResult(inputs)
 
     @staticmethod
-    def _relabel_categorical(inputs: Input) -> Output:
+    def _annotate(batch: MetadataBatch, column_index: int, semantic_type: str, detector: str) -> None:
+        old_metadata = batch.query_column(column_index)
+        batch.add_semantic_types(column_index, semantic_type)
+        _logger.info(
+            "%(detector)s. 'column_index': '%(column_index)d', 'old_metadata': '%(old_metadata)s', 'new_metadata': '%(new_metadata)s'",
+            {
+                'detector': detector,
+                'column_index': column_index,
+                'old_metadata': old_metadata,
+                'new_metadata': batch.query_column(column_index),
+            },
+        )
+
+    def _cache_key_parts(self):
+        """
+        Everything besides the table the profile depends on.
+        """
+        return ('profiler', config.VERSION, sorted(self._specified_features),
+                self.hyperparams['split_on_column_with_avg_len'], self._chunk_size, self._approximate,
+                sorted(self._sketch_args.items()))
+
+    @staticmethod
+    def _relabel_categorical(inputs: Input, batch: MetadataBatch) -> None:
         for col in range(inputs.shape[1]):
-            old_metadata = dict(inputs.metadata.query((mbase.ALL_ELEMENTS, col)))
-            semantic_type = old_metadata.get('semantic_types', [])
+            semantic_type = batch.query_column(col).get('semantic_types', [])
 
             if 'https://metadata.datadrivendiscovery.org/types/CategoricalData' in semantic_type:
                 if not HelperFunction.is_categorical(inputs.iloc[:, col]):
-                    old_metadata['semantic_types'] = tuple(i for i in old_metadata['semantic_types'] if
-                                                           i != 'https://metadata.datadrivendiscovery.org/types/CategoricalData')
+                    batch.remove_semantic_types(col, 'https://metadata.datadrivendiscovery.org/types/CategoricalData')
 
                     numerics = pd.to_numeric(inputs.iloc[:, col], errors='coerce')
                     length = numerics.shape[0]
                     nans = numerics.isnull().sum()
 
                     if nans / length > 0.9:
-                        if "http://schema.org/Text" not in old_metadata['semantic_types']:
-                            old_metadata['semantic_types'] += ("http://schema.org/Text",)
-
+                        batch.add_semantic_types(col, "http://schema.org/Text")
                     else:
                         intcheck = (numerics % 1) == 0
                         if np.sum(intcheck) / length > 0.9:
-                            if "http://schema.org/Integer" not in old_metadata['semantic_types']:
-                                old_metadata['semantic_types'] += ("http://schema.org/Integer",)
-                                # old_metadata['structural_type'] = type(10)
-                                # inputs.iloc[:, col] = numerics
+                            batch.add_semantic_types(col, "http://schema.org/Integer")
                         else:
-                            if "http://schema.org/Float" not in old_metadata['semantic_types']:
-                                old_metadata['semantic_types'] += ("http://schema.org/Float",)
-                                # old_metadata['structural_type'] = type(10.2)
-                                # inputs.iloc[:, col] = numerics
-
-            inputs.metadata = inputs.metadata.update((mbase.ALL_ELEMENTS, col), old_metadata)
-
-        return inputs
+                            batch.add_semantic_types(col, "http://schema.org/Float")
 
     def _produce(self, inputs: Input, metadata: DataMetadata = None, prefix: Selector = None) -> DataMetadata:
         """
@@ -403,13 +457,22 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
 
         is_category = category_detection.category_detect(data)
 
-        # STEP 2: column-level calculations
-        column_counter = -1
-        for column_name in data:
-            column_counter += 1
-            col = data[column_name]
+        # STEP 2: column-level calculations, independent of each other until the metadata update
+        column_args = [(data.iloc[:, i], self._specified_features, self._topk, self._punctuation_outlier_weight)
+                       for i in range(data.shape[1])]
+        if self._approximate or 0 < self._chunk_size < data.shape[0]:
+            column_results = self._profile_chunks(
+                data.iloc[start:start + self._chunk_size] for start in range(0, data.shape[0], self._chunk_size))
+        elif self._n_jobs == 1 or len(column_args) < 2:
+            column_results = [_profile_column(*args) for args in column_args]
+        else:
+            with multiprocessing.Pool(min(self._n_jobs, len(column_args))) as p:
+                column_results = p.starmap(_profile_column, column_args)
+
+        all_res = []
+        for column_counter, column_name in enumerate(data):
             # dict: map feature name to content
-            each_res = defaultdict(lambda: defaultdict())
+            each_res = dict()
 
             # 17 Feb 2019: Disabling automatic detection of category data. This dangerous
             # because the data profiler may gave different labels on different partitons
@@ -451,62 +514,8 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
                                                                'median': stats_pr['50%'],
                                                                'std': stats_pr['std']}
 
-            if col.dtype.kind in np.typecodes['AllInteger'] + 'uMmf':
-                if ("number_of_missing_values" in self._specified_features):
-                    each_res["number_of_missing_values"] = pd.isnull(col).sum()
-                if ("ratio_of_missing_values" in self._specified_features):
-                    each_res["ratio_of_missing_values"] = pd.isnull(col).sum() / col.size
-                if ("number_of_distinct_values" in self._specified_features):
-                    each_res["number_of_distinct_values"] = col.nunique()
-                if ("ratio_of_distinct_values" in self._specified_features):
-                    each_res["ratio_of_distinct_values"] = col.nunique() / float(col.size)
-
-            if col.dtype.kind == 'b':
-                if ("most_common_raw_values" in self._specified_features):
-                    fc_hih.compute_common_values(col.dropna().astype(str), each_res, self._topk)
-
-            elif col.dtype.kind in np.typecodes['AllInteger'] + 'uf':
-                fc_hih.compute_numerics(col, each_res,
-                                        self._specified_features)  # TODO: do the checks inside the function
-                if ("most_common_raw_values" in self._specified_features):
-                    fc_hih.compute_common_values(col.dropna().astype(str), each_res, self._topk)
-
-            else:
-
-                # Need to compute str missing values before fillna
-                if "number_of_missing_values" in self._specified_features:
-                    each_res["number_of_missing_values"] = pd.isnull(col).sum()
-                if "ratio_of_missing_values" in self._specified_features:
-                    each_res["ratio_of_missing_values"] = pd.isnull(col).sum() / col.size
-
-                col = col.astype(object).fillna('').astype(str)
-
-                # compute_missing_space Must be put as the first one because it may change the data content, see function def for details
-                fc_lfh.compute_missing_space(col, each_res, self._specified_features)
-                # fc_lfh.compute_filename(col, each_res)
-                fc_lfh.compute_length_distinct(col, each_res, delimiter=self._token_delimiter,
-                                               feature_list=self._specified_features)
-                if ("natural_language_of_feature" in self._specified_features):
-                    fc_lfh.compute_lang(col, each_res)
-                if ("most_common_punctuations" in self._specified_features):
-                    fc_lfh.compute_punctuation(col, each_res, weight_outlier=self._punctuation_outlier_weight)
-
-                fc_hih.compute_numerics(col, each_res, self._specified_features)
-                if ("most_common_numeric_tokens" in self._specified_features):
-                    fc_hih.compute_common_numeric_tokens(col, each_res, self._topk)
-                if ("most_common_alphanumeric_tokens" in self._specified_features):
-                    fc_hih.compute_common_alphanumeric_tokens(col, each_res, self._topk)
-                if ("most_common_raw_values" in self._specified_features):
-                    fc_hih.compute_common_values(col, each_res, self._topk)
-                fc_hih.compute_common_tokens(col, each_res, self._topk, self._specified_features)
-                if ("numeric_char_density" in self._specified_features):
-                    fc_hih.compute_numeric_density(col, each_res)
-                fc_hih.compute_contain_numeric_values(col, each_res, self._specified_features)
-                fc_hih.compute_common_tokens_by_puncs(col, each_res, self._topk, self._specified_features)
-
-            # update metadata for a specific column
-
-            metadata = metadata.update(prefix + [ALL_ELEMENTS, column_counter], each_res)
+            each_res.update(column_results[column_counter])
+            all_res.append(each_res)
 
             # _logger.info(
             #     "category detector. 'column_index': '%(column_index)d', 'old_metadata': '%(old_metadata)s', 'new_metadata': '%(new_metadata)s'",
@@ -516,7 +525,33 @@ class Profiler(TransformerPrimitiveBase[Input, Output, Hyperparams]):
             #         'new_metadata': dict(data.metadata.query((mbase.ALL_ELEMENTS, column_counter))),
             #     },
             # )
-        return metadata
+
+        # update metadata for all the columns in one pass
+        batch = MetadataBatch(metadata)
+        for column_counter, each_res in enumerate(all_res):
+            batch.update(prefix + [ALL_ELEMENTS, column_counter], each_res)
+
+        return batch.apply()
+
+    def _profile_chunks_metadata(self, chunks: typing.Iterable[pd.DataFrame], metadata: DataMetadata,
+                                 prefix: Selector = None) -> DataMetadata:
+        """
+        Profile a table given as an iterable of row chunks, e.g. pandas.read_csv(..., chunksize=...), holding only
+        one chunk in memory at a time. The column metafeatures are stored into metadata, as by produce. The
+        correlation metafeatures need the whole table and are not computed.
+
+        Private: d3m only allows keyword arguments of container types on the public methods of a primitive.
+        """
+        prefix = prefix if prefix is not None else []
+        batch = MetadataBatch(metadata)
+        for column_counter, each_res in enumerate(self._profile_chunks(chunks)):
+            batch.update(prefix + [ALL_ELEMENTS, column_counter], each_res)
+        return batch.apply()
+
+    def _profile_chunks(self, chunks):
+        return fc_stream.profile_chunks(chunks, self._specified_features, self._topk,
+                                        punctuation_outlier_weight=self._punctuation_outlier_weight,
+                                        **self._sketch_args)
 
 
 class MyEncoder(json.JSONEncoder):
@@ -2,11 +2,13 @@ import os
 import typing
 import logging
 
+import numpy  # type: ignore
 import pandas  # type: ignore
 
 from d3m import container, utils
 from d3m.metadata import base as metadata_base, hyperparams
 from d3m.primitive_interfaces import base, transformer
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 
 __all__ = ('DenormalizePrimitive',)
@@ -15,6 +17,31 @@ Inputs = container.Dataset
 Outputs = container.Dataset
 _logger = logging.getLogger(__name__)
 
+
+def _join_positions(keys: pandas.Series, foreign_keys: pandas.Series) -> numpy.ndarray:
+    """
+    Row position in foreign_keys of each value of keys, the last one when a foreign key is repeated. Raises KeyError
+    with the first value of keys not in foreign_keys.
+    """
+    last = numpy.flatnonzero(~foreign_keys.duplicated(keep='last').values)
+    positions = pandas.Index(foreign_keys.values[last]).get_indexer(keys.values)
+    missing = positions < 0
+    if missing.any():
+        raise KeyError(keys.values[numpy.argmax(missing)])
+    return last[positions]
+
+
+class _PlannedColumn(typing.NamedTuple):
+    """
+    A column of the denormalized table: a column of a resource, the rows of that column to take, None to take them all
+    in order, and the metadata of the column in the denormalized table.
+    """
+    resource_id: str
+    column_index: int
+    positions: typing.Optional[numpy.ndarray]
+    metadata: typing.Dict
+
+
 class DenormalizeHyperparams(hyperparams.Hyperparams):
     starting_resource = hyperparams.Hyperparameter[typing.Union[str, None]](
         None,
@@ -31,6 +58,19 @@ class DenormalizeHyperparams(hyperparams.Hyperparams):
         semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
         description="Denormalize also many-to-many relations?",
     )
+    columnar = hyperparams.Hyperparameter[bool](
+        False,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Plan all the joins first, then assemble the output table in one allocation, instead of "
+                    "concatenating the table so far with every joined resource.",
+    )
+    keep_semantic_types = hyperparams.Set(
+        elements=hyperparams.Hyperparameter[str](""),
+        default=(),
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="In the columnar mode, only materialize the columns with at least one of these semantic types, "
+                    "the ones the column selection after this primitive keeps. Empty keeps all the columns.",
+    )
 
 
 class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, DenormalizeHyperparams]):
@@ -38,6 +78,9 @@ class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, Denormal
     A primitive which converts a dataset with multiple tabular resources into a dataset with only one tabular resource,
     based on known relations between tabular resources. Any resource which can be joined is joined, and other resources
     are discarded.
+
+    In the columnar mode the joins are planned before any data is copied, the columns that the downstream column
+    selection drops (see keep_semantic_types) are never materialized, and the output is written in one allocation.
     """
     metadata = hyperparams.base.PrimitiveMetadata({
         "id": "dsbox-denormalize(from d3m)",
@@ -105,29 +148,47 @@ class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, Denormal
         ]
         metadata = metadata.update((main_resource_id,), entry_point_metadata, source=self)
 
-        data = None
+        if self.hyperparams['columnar']:
+            # the planned columns replace all the column metadata of the main resource
+            metadata = metadata.remove((main_resource_id, metadata_base.ALL_ELEMENTS), recursive=True)
+            columns, index, labels = self._plan(main_resource_id, inputs)
+            if self.hyperparams['keep_semantic_types']:
+                keep = set(self.hyperparams['keep_semantic_types'])
+                kept = [i for i, column in enumerate(columns) if keep.intersection(column.metadata.get('semantic_types', ()))]
+                columns = [columns[i] for i in kept]
+                labels = [labels[i] for i in kept]
+            data = self._assemble(inputs, columns, index, labels)
+            batch = MetadataBatch(metadata)
+            for column_index, column in enumerate(columns):
+                batch.update((main_resource_id, metadata_base.ALL_ELEMENTS, column_index), column.metadata)
+        else:
+            data = None
+            # the column metadata is collected and applied in one copy at the end
+            batch = MetadataBatch(metadata)
 
-        for column_index in range(main_columns_length):
-            column_metadata = inputs.metadata.query((main_resource_id, metadata_base.ALL_ELEMENTS, column_index))
+            for column_index in range(main_columns_length):
+                column_metadata = inputs.metadata.query((main_resource_id, metadata_base.ALL_ELEMENTS, column_index))
 
-            if 'foreign_key' not in column_metadata:
-                # We just copy over data and metadata.
-                data, metadata = self._add_column(main_resource_id, data, metadata, self._get_column(main_data, column_index), column_metadata)
-            else:
-                assert column_metadata['foreign_key']['type'] == 'COLUMN', column_metadata
-
-                if 'column_index' in column_metadata['foreign_key']:
-                    data, metadata = self._join_by_index(
-                        main_resource_id, inputs, column_index, data, metadata, column_metadata['foreign_key']['resource_id'],
-                        column_metadata['foreign_key']['column_index'],
-                    )
-                elif 'column_name' in column_metadata['foreign_key']:
-                    data, metadata = self._join_by_name(
-                        main_resource_id, inputs, column_index, data, metadata, column_metadata['foreign_key']['resource_id'],
-                        column_metadata['foreign_key']['column_name'],
-                    )
+                if 'foreign_key' not in column_metadata:
+                    # We just copy over data and metadata.
+                    data = self._add_column(main_resource_id, data, batch, self._get_column(main_data, column_index), column_metadata)
                 else:
-                    assert False, column_metadata
+                    assert column_metadata['foreign_key']['type'] == 'COLUMN', column_metadata
+
+                    if 'column_index' in column_metadata['foreign_key']:
+                        data = self._join_by_index(
+                            main_resource_id, inputs, column_index, data, batch, column_metadata['foreign_key']['resource_id'],
+                            column_metadata['foreign_key']['column_index'],
+                        )
+                    elif 'column_name' in column_metadata['foreign_key']:
+                        data = self._join_by_name(
+                            main_resource_id, inputs, column_index, data, batch, column_metadata['foreign_key']['resource_id'],
+                            column_metadata['foreign_key']['column_name'],
+                        )
+                    else:
+                        assert False, column_metadata
+
+        metadata = batch.apply()
 
         resources = {}
         resources[main_resource_id] = data
@@ -165,11 +226,79 @@ class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, Denormal
         
 
 
-    def _join_by_name(self, main_resource_id: str, inputs: Inputs, inputs_column_index: int, data: typing.Optional[pandas.DataFrame],
-                      metadata: metadata_base.DataMetadata, foreign_resource_id: str, foreign_column_name: str) -> typing.Tuple[pandas.DataFrame, metadata_base.DataMetadata]:
+    def _plan(self, main_resource_id: str, inputs: Inputs) -> typing.Tuple[typing.List[_PlannedColumn], pandas.Index, typing.List]:
+        """
+        The columns of the denormalized table, in order, with its index and column labels, without copying any data.
+        The index and the labels are the ones the table concatenated join by join gets.
+        """
+        main_data = inputs[main_resource_id]
+        main_columns_length = inputs.metadata.query((main_resource_id, metadata_base.ALL_ELEMENTS))['dimension']['length']
+
+        columns: typing.List[_PlannedColumn] = []
+        labels: typing.List = []
+        index = main_data.index
+        for column_index in range(main_columns_length):
+            column_metadata = inputs.metadata.query((main_resource_id, metadata_base.ALL_ELEMENTS, column_index))
+
+            if 'foreign_key' not in column_metadata:
+                columns.append(_PlannedColumn(main_resource_id, column_index, None, dict(column_metadata)))
+                labels.append(main_data.columns[column_index])
+                continue
+
+            foreign_key = column_metadata['foreign_key']
+            assert foreign_key['type'] == 'COLUMN', column_metadata
+            foreign_resource_id = foreign_key['resource_id']
+            if 'column_index' in foreign_key:
+                foreign_column_index = foreign_key['column_index']
+            elif 'column_name' in foreign_key:
+                foreign_column_index = self._foreign_column_index(inputs, foreign_resource_id, foreign_key['column_name'])
+            else:
+                assert False, column_metadata
+
+            positions = _join_positions(main_data.iloc[:, column_index],
+                                        inputs[foreign_resource_id].iloc[:, foreign_column_index])
+            foreign_data_columns_length = inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS))['dimension']['length']
+            for foreign_index in range(foreign_data_columns_length):
+                foreign_column_metadata = inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS, foreign_index))
+                columns.append(_PlannedColumn(foreign_resource_id, foreign_index, positions,
+                                              self._joined_column_metadata(column_metadata, foreign_column_metadata)))
+            # a join renumbers the columns, and gives a range index if it makes the first column
+            if column_index == 0:
+                index = pandas.RangeIndex(main_data.shape[0])
+            labels = list(range(len(labels) + foreign_data_columns_length))
+
+        return columns, index, labels
+
+    def _assemble(self, inputs: Inputs, columns: typing.List[_PlannedColumn], index: pandas.Index,
+                  labels: typing.List) -> container.DataFrame:
+        """
+        The planned columns as one table. When they all have the same dtype, as the text columns of a loaded dataset
+        do, they are written into a single array which the table uses without a copy. The table is a container
+        DataFrame, as the resources of a Dataset are, and its metadata is the one of the output Dataset.
+        """
+        sources = [inputs[column.resource_id].iloc[:, column.column_index].values for column in columns]
+        dtypes = set(source.dtype for source in sources if isinstance(source, numpy.ndarray))
+        if len(dtypes) == 1 and all(isinstance(source, numpy.ndarray) for source in sources):
+            # column major, so that every column is contiguous and the array is the block of the table
+            values = numpy.empty((len(index), len(columns)), dtype=dtypes.pop(), order='F')
+            for column_index, (column, source) in enumerate(zip(columns, sources)):
+                if column.positions is None:
+                    values[:, column_index] = source
+                else:
+                    numpy.take(source, column.positions, out=values[:, column_index])
+            return container.DataFrame(values, index=index, columns=labels, copy=False, generate_metadata=False)
+
+        data = container.DataFrame({
+            column_index: source if column.positions is None else source.take(column.positions)
+            for column_index, (column, source) in enumerate(zip(columns, sources))
+        }, index=index, columns=range(len(columns)), generate_metadata=False)
+        data.columns = labels
+        return data
+
+    def _foreign_column_index(self, inputs: Inputs, foreign_resource_id: str, foreign_column_name: str) -> int:
         for column_index in range(inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS))['dimension']['length']):
             if inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS, column_index)).get('name', None) == foreign_column_name:
-                return self._join_by_index(main_resource_id, inputs, inputs_column_index, data, metadata, foreign_resource_id, column_index)
+                return column_index
 
         raise ValueError(
             "Cannot resolve foreign key with column name '{column_name}' in resource with ID '{resource_id}'.".format(
@@ -178,20 +307,27 @@ class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, Denormal
             ),
         )
 
+    def _join_by_name(self, main_resource_id: str, inputs: Inputs, inputs_column_index: int, data: typing.Optional[pandas.DataFrame],
+                      batch: MetadataBatch, foreign_resource_id: str, foreign_column_name: str) -> pandas.DataFrame:
+        column_index = self._foreign_column_index(inputs, foreign_resource_id, foreign_column_name)
+        return self._join_by_index(main_resource_id, inputs, inputs_column_index, data, batch, foreign_resource_id, column_index)
+
     def _join_by_index(self, main_resource_id: str, inputs: Inputs, inputs_column_index: int, data: typing.Optional[pandas.DataFrame],
-                       metadata: metadata_base.DataMetadata, foreign_resource_id: str, foreign_column_index: int) -> typing.Tuple[pandas.DataFrame, metadata_base.DataMetadata]:
+                       batch: MetadataBatch, foreign_resource_id: str, foreign_column_index: int) -> pandas.DataFrame:
+        """
+        Hash join: the position of each foreign key value in the foreign key column of the foreign resource is looked up
+        through a pandas index, and all the foreign columns are gathered with a single take.
+        """
         main_column_metadata = inputs.metadata.query((main_resource_id, metadata_base.ALL_ELEMENTS, inputs_column_index))
 
         main_data = inputs[main_resource_id]
         foreign_data = inputs[foreign_resource_id]
 
-        value_to_index = {}
-        for value_index, value in enumerate(foreign_data.iloc[:, foreign_column_index]):
-            # TODO: Check if values are not unique.
-            value_to_index[value] = value_index
-        rows = []
-        for value in main_data.iloc[:, inputs_column_index]:
-            rows.append([foreign_data.iloc[value_to_index[value], j] for j in range(len(foreign_data.columns))])
+        # TODO: Check if values are not unique.
+        positions = _join_positions(main_data.iloc[:, inputs_column_index], foreign_data.iloc[:, foreign_column_index])
+        selected_data = pandas.DataFrame(foreign_data).take(positions)
+        selected_data.columns = pandas.RangeIndex(selected_data.shape[1])
+
         if data is None:
             data_columns_length = 0
         else:
@@ -200,44 +336,47 @@ class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, Denormal
         # Copy over metadata.
         foreign_data_columns_length = inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS))['dimension']['length']
         for column_index in range(foreign_data_columns_length):
-            column_metadata = dict(inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS, column_index)))
-
-            # Foreign keys can reference same foreign row multiple times, so values in this column might not be even
-            # unique anymore, nor they are a primary key at all. Sso we remove the semantic type marking a column as such.
-            if 'https://metadata.datadrivendiscovery.org/types/PrimaryKey' in column_metadata.get('semantic_types', []):
-                column_metadata['semantic_types'] = [
-                    semantic_type for semantic_type in column_metadata['semantic_types'] if semantic_type != 'https://metadata.datadrivendiscovery.org/types/PrimaryKey'
-                ]
+            column_metadata = inputs.metadata.query((foreign_resource_id, metadata_base.ALL_ELEMENTS, column_index))
+            batch.update((main_resource_id, metadata_base.ALL_ELEMENTS, data_columns_length + column_index),
+                         self._joined_column_metadata(main_column_metadata, column_metadata))
 
-            # If the original index column was an attribute, make sure the new index column is as well.
-            if 'https://metadata.datadrivendiscovery.org/types/Attribute' in main_column_metadata.get('semantic_types', []):
-                if 'https://metadata.datadrivendiscovery.org/types/Attribute' not in column_metadata['semantic_types']:
-                    column_metadata['semantic_types'].append('https://metadata.datadrivendiscovery.org/types/Attribute')
-
-            # If the original index column was a suggested target, make sure the new index column is as well.
-            if 'https://metadata.datadrivendiscovery.org/types/SuggestedTarget' in main_column_metadata.get('semantic_types', []):
-                if 'https://metadata.datadrivendiscovery.org/types/SuggestedTarget' not in column_metadata['semantic_types']:
-                    column_metadata['semantic_types'].append('https://metadata.datadrivendiscovery.org/types/SuggestedTarget')
-
-            metadata = metadata.update((main_resource_id, metadata_base.ALL_ELEMENTS, data_columns_length + column_index), column_metadata, source=self)
-
-        selected_data = pandas.DataFrame(rows)
         if data is None:
-            data = selected_data
+            data = selected_data.reset_index(drop=True)
         else:
-            #import pdb
-            #pdb.set_trace()
-            #data = data.reset_index().drop(columns=['index'])
             selected_data = selected_data.set_index(data.index)
-            #selected_data = selected_data.reset_index().drop(columns=['index'])
             data = pandas.concat([data, selected_data], axis=1, ignore_index=True)
-        return data, metadata
+        return data
+
+    def _joined_column_metadata(self, main_column_metadata: typing.Dict, column_metadata: typing.Dict) -> typing.Dict:
+        """
+        Metadata of a foreign column joined through the main column with main_column_metadata.
+        """
+        column_metadata = dict(column_metadata)
+        semantic_types = list(column_metadata.get('semantic_types', []))
+
+        # Foreign keys can reference same foreign row multiple times, so values in this column might not be even
+        # unique anymore, nor they are a primary key at all. Sso we remove the semantic type marking a column as such.
+        if 'https://metadata.datadrivendiscovery.org/types/PrimaryKey' in semantic_types:
+            semantic_types.remove('https://metadata.datadrivendiscovery.org/types/PrimaryKey')
+
+        # If the original index column was an attribute, make sure the new index column is as well.
+        if 'https://metadata.datadrivendiscovery.org/types/Attribute' in main_column_metadata.get('semantic_types', []):
+            if 'https://metadata.datadrivendiscovery.org/types/Attribute' not in semantic_types:
+                semantic_types.append('https://metadata.datadrivendiscovery.org/types/Attribute')
+
+        # If the original index column was a suggested target, make sure the new index column is as well.
+        if 'https://metadata.datadrivendiscovery.org/types/SuggestedTarget' in main_column_metadata.get('semantic_types', []):
+            if 'https://metadata.datadrivendiscovery.org/types/SuggestedTarget' not in semantic_types:
+                semantic_types.append('https://metadata.datadrivendiscovery.org/types/SuggestedTarget')
+
+        column_metadata['semantic_types'] = semantic_types
+        return column_metadata
 
     def _get_column(self, data: pandas.DataFrame, column_index: int) -> pandas.DataFrame:
         return data.iloc[:, [column_index]]
 
-    def _add_column(self, main_resource_id: str, data: pandas.DataFrame, metadata: metadata_base.DataMetadata, column_data: pandas.DataFrame,
-                    column_metadata: typing.Dict) -> typing.Tuple[pandas.DataFrame, metadata_base.DataMetadata]:
+    def _add_column(self, main_resource_id: str, data: pandas.DataFrame, batch: MetadataBatch, column_data: pandas.DataFrame,
+                    column_metadata: typing.Dict) -> pandas.DataFrame:
 
         assert column_data.shape[1] == 1
 
@@ -256,6 +395,6 @@ class Denormalize(transformer.TransformerPrimitiveBase[Inputs, Outputs, Denormal
             for each_key in selected_data_key:
                 data[each_key] = column_data[each_key]
             '''
-        metadata = metadata.update((main_resource_id, metadata_base.ALL_ELEMENTS, data.shape[1] - 1), column_metadata, source=self)
+        batch.update((main_resource_id, metadata_base.ALL_ELEMENTS, data.shape[1] - 1), column_metadata)
 
-        return data, metadata
+        return data
@@ -1,14 +1,59 @@
+import typing
+
 import pandas as pd
 import numpy as np
 from sklearn.utils import shuffle
 
-
-def __shuffle_dict(col, seed):
-    key = col.unique()
-    shuffled = np.array(key, copy=True)
-    shuffled = shuffle(shuffled, random_state=seed)
-    adict = dict(zip(key, shuffled))
-    return col.apply(lambda x: adict[x])
+TABLE_COLUMNS = ['col_name', 'nunique', 'nunique_ratio', 'H', 'M', 'L', 'ratio_H', 'ratio_M',
+                 'ratio_L', 'dropMean', 'dropMedian', 'dropMax', 'dropMin', 'dtype', '95%in10']
+
+FLOAT_TYPES = [float, np.float64, np.float32, np.float16]
+INT_TYPES = [int, np.int64, np.int32, np.int16, np.int8]
+
+
+class ColumnCategory(typing.NamedTuple):
+    """
+    Category detection result of one column, with the statistics the decision is based on.
+    """
+    name: typing.Hashable
+    is_categorical: bool
+    nunique: int
+    nunique_ratio: float
+    drop_max: float
+    high_correlations: int
+    medium_correlations: int
+
+
+def __shuffled_ranks(col, seeds):
+    """
+    Ranks (average method, like spearman) of the column once its distinct values are relabelled by a random
+    permutation of themselves, one column per seed. Only the distinct values are shuffled and ranked, the cells then
+    pick up the rank of their value.
+    """
+    codes, key = pd.factorize(col)
+    counts = np.bincount(codes, minlength=len(key))
+    ranks = np.empty((len(col), len(seeds)))
+    for i, seed in enumerate(seeds):
+        shuffled = shuffle(np.array(key, copy=True), random_state=seed)
+        order = np.argsort(shuffled, kind='mergesort')
+        # rank of the first cell holding each value, ties share the average rank
+        first = np.empty(len(key))
+        first[order] = np.cumsum(counts[order]) - counts[order] + 1
+        ranks[:, i] = (first + (counts - 1) / 2.0)[codes]
+    return ranks
+
+
+def __shuffled_corr(centered, norms, index, shuffled):
+    """
+    Same as ndata.corr(method='spearman')[name].fillna(0) once column index is replaced by each of the shuffled
+    columns, given the centered ranks of ndata and their norms. One column of result per shuffle.
+    """
+    shuffled = shuffled - shuffled.mean(axis=0)
+    shuffled_norms = np.sqrt((shuffled ** 2).sum(axis=0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = centered.T.dot(shuffled) / np.outer(norms, shuffled_norms)
+        corr[index] = np.where(shuffled_norms > 0, 1.0, 0.0)
+    return np.clip(np.nan_to_num(corr), -1, 1)
 
 
 def __label(x):
@@ -26,11 +71,16 @@ def __safe_div(x):
 
 
 def __tableGen(data):
-    nlist = []
-    table = pd.DataFrame(columns=[
-        'col_name', 'nunique', 'nunique_ratio', 'H', 'M', 'L', 'ratio_H', 'ratio_M',
-        'ratio_L', 'dropMean', 'dropMedian', 'dropMax', 'dropMin', 'dtype', '95%in10'])
+    """
+    One row of statistics per column. The rows are collected column-wise and the table built once at the end.
+    """
+    records = {key: [] for key in TABLE_COLUMNS}
 
+    def add(**row):
+        for key in TABLE_COLUMNS:
+            records[key].append(row[key])
+
+    nlist = []
     for name in data:
         col = data[name]
         if col.dtype.kind in np.typecodes['AllInteger'] + 'uf' and col.nunique() > 2:
@@ -39,86 +89,91 @@ def __tableGen(data):
     if len(nlist) > 1:
         ndata = data[nlist]  # New DataFrame
         origCorr = ndata.corr(method='spearman').fillna(0)  # New DataFrame
-        ncol = len(nlist)
+        # ranks of the filled columns, computed once and shared by every shuffle of every column
+        centered = ndata.fillna(0).rank().values
+        centered = centered - centered.mean(axis=0)
+        norms = np.sqrt((centered ** 2).sum(axis=0))
     else:
         nlist = []
+    nindex = {name: index for index, name in enumerate(nlist)}
 
     for name in data:
         col = data[name]
         # for empty column
         if col.count() == 0:
-            table = table.append({'col_name': name, 'nunique': 0, 'nunique_ratio': 0,
-                                  'H': 0, 'M': 0, 'L': 0,
-                                  'ratio_H': 0, 'ratio_M': 0, 'ratio_L': 0,
-                                  'dropMean': 0, 'dropMedian': 0, 'dropMax': 0, 'dropMin': 0,
-                                  'dtype': -1, '95%in10': False}, ignore_index=True)
+            add(col_name=name, nunique=0, nunique_ratio=0,
+                H=0, M=0, L=0,
+                ratio_H=0, ratio_M=0, ratio_L=0,
+                dropMean=0, dropMedian=0, dropMax=0, dropMin=0,
+                dtype=-1, **{'95%in10': False})
 
         # for numbers w/ nunique > 2 (when there are more then 1 such columns)
-        elif name in nlist:
-            in10 = col.value_counts().head(10).sum() / float(col.count()) > .95
+        elif name in nindex:
+            counts = col.value_counts()
+            in10 = counts.head(10).sum() / float(col.count()) > .95
             orig = abs(origCorr[name])
-            temp = [1] * ncol
             level = list(orig.map(__label))
             lvl = (max(0, level.count('H') - 1), level.count('M'), level.count('L'))
             lvl_ratio = tuple(map(lambda x: round(float(x) / (len(level) - 1), 4), lvl))
 
-            for i in range(5):
-                ndatacopy = ndata.copy().fillna(0)  # New DataFrame
-                ndatacopy[name] = __shuffle_dict(ndatacopy[name], i)
-                corr = ndatacopy.corr(method='spearman')[name].fillna(0)  # New DataFrame
-                shuf = abs(corr)
-                temp = [min(x) for x in zip(shuf, temp)]
+            # the 5 shuffles in one go, against the cached ranks
+            shuffled = __shuffled_ranks(col.fillna(0), range(5))
+            shuf = np.abs(__shuffled_corr(centered, norms, nindex[name], shuffled))
+            temp = np.minimum(shuf.min(axis=1), 1)
 
             p = orig - temp
 
-            table = table.append({'col_name': name, 'nunique': col.nunique(),
-                                  'nunique_ratio': round(float(col.nunique()), 4) / col.count(),
-                                  'H': lvl[0], 'M': lvl[1], 'L': lvl[2],
-                                  'ratio_H': lvl_ratio[0], 'ratio_M': lvl_ratio[1], 'ratio_L': lvl_ratio[2],
-                                  'dropMean': round(np.mean(p), 4), 'dropMedian': round(np.median(p), 4),
-                                  'dropMax': round(np.max(p), 4), 'dropMin': round(np.min(p), 4),
-                                  'dtype': col.dtype, '95%in10': in10}, ignore_index=True)
+            add(col_name=name, nunique=len(counts),
+                nunique_ratio=round(float(len(counts)), 4) / col.count(),
+                H=lvl[0], M=lvl[1], L=lvl[2],
+                ratio_H=lvl_ratio[0], ratio_M=lvl_ratio[1], ratio_L=lvl_ratio[2],
+                dropMean=round(np.mean(p), 4), dropMedian=round(np.median(p), 4),
+                dropMax=round(np.max(p), 4), dropMin=round(np.min(p), 4),
+                dtype=col.dtype, **{'95%in10': in10})
 
         # for objects (and numbers when there are few numerical column)
         else:
-            in10 = col.value_counts().head(10).sum() / float(col.count()) > .95
-            table = table.append({'col_name': name, 'nunique': col.nunique(),
-                                  'nunique_ratio': round(float(col.nunique()), 4) / col.count(),
-                                  'H': 0, 'M': 0, 'L': 0,
-                                  'ratio_H': 0, 'ratio_M': 0, 'ratio_L': 0,
-                                  'dropMean': 0, 'dropMedian': 0,
-                                  'dropMax': 0, 'dropMin': 0,
-                                  'dtype': col.dtype, '95%in10': in10}, ignore_index=True)
-    return table
+            counts = col.value_counts()
+            in10 = counts.head(10).sum() / float(col.count()) > .95
+            add(col_name=name, nunique=len(counts),
+                nunique_ratio=round(float(len(counts)), 4) / col.count(),
+                H=0, M=0, L=0,
+                ratio_H=0, ratio_M=0, ratio_L=0,
+                dropMean=0, dropMedian=0,
+                dropMax=0, dropMin=0,
+                dtype=col.dtype, **{'95%in10': in10})
+    # object column: mixes numpy dtypes and -1 for the empty columns
+    records['dtype'] = pd.Series(records['dtype'], dtype=object)
+    return pd.DataFrame(records, columns=TABLE_COLUMNS)
 
 
 def __column_detect(dtype, nunique, nunique_ratio, dropMax, H, M):
-    if dtype in [float, np.float64, np.float32, np.float16]:
-        return False
-    elif dtype in [int, np.int64, np.int32, np.int16, np.int8]:
-        if nunique < 50 and nunique_ratio < 0.7:
-            return True
-        else:
-            return False
-    else:
-        if nunique > 16:
-            return False
-        else:
-            if dropMax <= 0.05:
-                return True
-            else:
-                if H + M < 1:
-                    return True
-                else:
-                    if nunique <= 10:
-                        return True
-                    return False
+    """
+    Vectorized decision rules, one entry per column of the table.
+    """
+    nunique = np.asarray(nunique, dtype=float)
+    is_float = np.array([d in FLOAT_TYPES for d in dtype], dtype=bool)
+    is_int = np.array([d in INT_TYPES for d in dtype], dtype=bool)
+    int_rule = (nunique < 50) & (np.asarray(nunique_ratio, dtype=float) < 0.7)
+    other_rule = (nunique <= 16) & ((np.asarray(dropMax, dtype=float) <= 0.05) |
+                                    (np.asarray(H, dtype=float) + np.asarray(M, dtype=float) < 1) |
+                                    (nunique <= 10))
+    return np.where(is_float, False, np.where(is_int, int_rule, other_rule))
+
+
+def detect_categories(data: pd.DataFrame) -> typing.List[ColumnCategory]:
+    """
+    Detect which columns of data hold categorical values. Returns one ColumnCategory per column, in column order.
+    """
+    table = __tableGen(data)
+    is_categorical = __column_detect(table['dtype'].values, table['nunique'].values, table['nunique_ratio'].values,
+                                     table['dropMax'].values, table['H'].values, table['M'].values)
+    return [ColumnCategory(name, bool(categorical), int(nunique), float(nunique_ratio), float(drop_max), int(high),
+                           int(medium))
+            for name, categorical, nunique, nunique_ratio, drop_max, high, medium in zip(
+                table['col_name'], is_categorical, table['nunique'], table['nunique_ratio'], table['dropMax'],
+                table['H'], table['M'])]
 
 
 def category_detect(data):
-    table = __tableGen(data)
-    res_dict = {}
-    for index, row in table.iterrows():
-        res = __column_detect(row['dtype'], row['nunique'], row['nunique_ratio'], row['dropMax'], row['H'], row['M'])
-        res_dict[row['col_name']] = res
-    return res_dict
+    return {column.name: column.is_categorical for column in detect_categories(data)}
@@ -11,6 +11,7 @@ from d3m.primitive_interfaces.base import CallResult
 from d3m.primitive_interfaces.base import CallResult
 from d3m.primitive_interfaces.transformer import TransformerPrimitiveBase
 
+from dsbox.common.metadata_batch import MetadataBatch
 from dsbox.datapreprocessing.cleaner import config
 import logging
 import traceback
@@ -35,9 +36,10 @@ def detector(inputs):
 
     _logger = logging.getLogger(__name__)
 
+    batch = MetadataBatch(inputs.metadata)
     for col in range(inputs.shape[1]):
         temp = inputs.iloc[:, col]
-        old_metadata = dict(inputs.metadata.query((mbase.ALL_ELEMENTS, col)))
+        old_metadata = batch.query_column(col)
         dtype = pd.DataFrame(temp.dropna().str.isnumeric().value_counts())
         ## if there is already a data type, see if that is equal to what we identified, else update
         ## corner case : Integer type, could be a categorical Arrtribute
@@ -113,6 +115,7 @@ def detector(inputs):
         #     },
         # )
 
-        inputs.metadata = inputs.metadata.update((mbase.ALL_ELEMENTS, col), old_metadata)
+        batch.update_column(col, old_metadata)
 
+    inputs.metadata = batch.apply()
     return inputs
@@ -0,0 +1,274 @@
+"""
+Fused profiling kernel for text columns.
+
+The functions in feature_compute_hih and feature_compute_lfh each re-split and re-scan the column. Here the column is
+tokenized once (by whitespace and by punctuation) and the per-cell and per-token arrays are shared by every requested
+metafeature. Token level predicates (numeric, alphanumeric, contains digit) are evaluated on the distinct tokens only.
+The reported values are the same as the ones computed by the original functions.
+"""
+import itertools
+import re
+import string
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_hih as fc_hih
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_lfh as fc_lfh
+
+SPACE_FEATURES = (
+    "number_of_values_with_leading_spaces", "ratio_of_values_with_leading_spaces",
+    "number_of_values_with_trailing_spaces", "ratio_of_values_with_trailing_spaces")
+
+DISTINCT_VALUE_FEATURES = ("number_of_distinct_values", "ratio_of_distinct_values")
+
+DISTINCT_TOKEN_FEATURES = ("number_of_distinct_tokens", "ratio_of_distinct_tokens")
+
+NUMERIC_FEATURES = (
+    "number_of_numeric_values", "ratio_of_numeric_values", "number_std", "number_of_outlier_numeric_values",
+    "number_of_negative_numeric_values", "number_of_positive_numeric_values", "number_of_numeric_values_equal_0",
+    "number_of_numeric_values_equal_1", "number_of_numeric_values_equal_-1", "target_values")
+
+TOKEN_FEATURES = (
+    "most_common_tokens", "number_of_tokens_containing_numeric_char", "ratio_of_tokens_containing_numeric_char")
+
+PUNCTUATION_TOKEN_FEATURES = (
+    "most_common_tokens_split_by_punctuation", "number_of_distinct_tokens_split_by_punctuation",
+    "ratio_of_distinct_tokens_split_by_punctuation", "number_of_tokens_split_by_punctuation_containing_numeric_char",
+    "ratio_of_tokens_split_by_punctuation_containing_numeric_char")
+
+CONTAIN_NUMERIC_FEATURES = ("number_of_values_containing_numeric_char", "ratio_of_values_containing_numeric_char")
+
+# runs of str.isalnum() characters, i.e. what is left after replacing every other character with a blank
+ALNUM_RUN = r"[^\W_]+"
+_PUNCTUATION_CLASS = "[" + re.escape(string.punctuation) + "]"
+_PUNCTUATION_INDEX = {c: i for i, c in enumerate(string.punctuation)}
+# float() may accept values with these, pd.to_numeric does not: '1_000', non-ascii digits, 'nan', and the numbers that
+# overflow to inf such as '1e321' or very long integers
+_FLOAT_RETRY = r"\d_\d|nan|[^\x00-\x7f]|\de|\d{309}"
+
+
+def _requested(feature_list, names):
+    return any(name in feature_list for name in names)
+
+
+def parse_decimal(values):
+    """
+    Vectorized equivalent of HelperFunction.is_Decimal_Number / tryConvert on a Series of strings.
+
+    Returns a float array of the parsed numbers (NaN where the value is not a number) and a boolean mask of the values
+    float() accepts. pd.to_numeric does the bulk of the work; only the values it rejects but float() may still accept
+    (e.g. '1_000', non-ascii digits, 'nan', '1e321') are retried one by one. pd.to_numeric may differ from float() in
+    the last digits, so the values it accepts are parsed again by float() in one numpy cast.
+    """
+    numbers = np.asarray(pd.to_numeric(values, errors='coerce'), dtype=float)
+    is_decimal = ~np.isnan(numbers)
+    numbers[is_decimal] = values.values[is_decimal].astype(float)
+    retry = ~is_decimal & values.str.contains(_FLOAT_RETRY, case=False, regex=True).fillna(False).values.astype(bool)
+    for i in np.flatnonzero(retry):
+        try:
+            numbers[i] = float(values.iat[i])
+        except ValueError:
+            continue
+        is_decimal[i] = True
+    return numbers, is_decimal
+
+
+def strip_spaces(column, feature):
+    """
+    Vectorized compute_missing_space. Returns the trimmed column instead of modifying it in place: cells which are empty
+    after trimming become NaN.
+    """
+    present = column.dropna()
+    trimmed, leading, trailing, is_empty = trim_spaces(present)
+
+    feature["number_of_values_with_leading_spaces"] = int(leading.sum())
+    feature["ratio_of_values_with_leading_spaces"] = int(leading.sum()) / column.size
+    feature["number_of_values_with_trailing_spaces"] = int(trailing.sum())
+    feature["ratio_of_values_with_trailing_spaces"] = int(trailing.sum()) / column.size
+
+    column = column.copy()
+    column[present.index] = trimmed.mask(is_empty, np.nan)
+    return column
+
+
+def trim_spaces(present):
+    """
+    Trim the leading and trailing white space of the non missing cells. Returns the trimmed cells and the masks of the
+    cells with leading spaces, with trailing spaces and empty after trimming (which also count as trailing spaces).
+    """
+    trim_leading = present.str.lstrip()
+    trimmed = trim_leading.str.rstrip()
+    is_empty = trimmed.str.len() == 0
+    leading = trim_leading != present
+    trailing = (trimmed != trim_leading) | is_empty
+    return trimmed, leading, trailing, is_empty
+
+
+def count_tokens(tokens):
+    """
+    Count the distinct values of a token array in one hash pass. Returns the code of each token, the uniques (in order of
+    first appearance) and their counts.
+    """
+    codes, uniques = pd.factorize(tokens)
+    counts = np.bincount(codes, minlength=len(uniques))
+    return codes, np.asarray(uniques, dtype=object), counts
+
+
+def top_k(uniques, counts, k, ties_by_name=True):
+    """
+    Top k (name, count) pairs. Ties are ordered by name, like ordered_dict2, or by first appearance, like the
+    Counter used in compute_common_tokens.
+    """
+    if ties_by_name:
+        by_name = np.argsort(uniques, kind='mergesort')
+        uniques, counts = uniques[by_name], counts[by_name]
+    order = np.argsort(-counts, kind='mergesort')[:k]
+    return [{'name': uniques[i], 'count': counts[i]} for i in order]
+
+
+def flatten(lists):
+    """
+    Flatten a Series of lists into a Series of their items, also returning the length of each list.
+    """
+    lengths = lists.str.len().values.astype(int)
+    flat = pd.Series(list(itertools.chain.from_iterable(lists.values)), dtype=object)
+    return flat, lengths
+
+
+def punctuation_counts(present, skip):
+    """
+    The (number_of_cell * number_of_puncs) count matrix of compute_punctuation, filled from one regex pass collecting
+    every punctuation character. Rows of the cells flagged in skip (numbers) are left empty.
+    """
+    puncs, puncs_per_cell = flatten(present.str.findall(_PUNCTUATION_CLASS))
+    cell_ids = np.repeat(np.arange(present.size), puncs_per_cell)
+    punc_ids = puncs.map(_PUNCTUATION_INDEX).values.astype(int)
+    keep = ~skip[cell_ids]
+    flat_index = cell_ids[keep] * len(string.punctuation) + punc_ids[keep]
+    return np.bincount(flat_index, minlength=present.size * len(string.punctuation)).reshape(
+        [present.size, len(string.punctuation)])
+
+
+def _compute_punctuation(present, lengths, skip, feature, weight_outlier):
+    """
+    Vectorized compute_punctuation.
+    """
+    puncs_cell = punctuation_counts(present, skip)
+
+    number_of_chars = lengths.sum()
+    counts_column_punc = puncs_cell.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cell_density_array = puncs_cell / lengths.reshape([present.size, 1])
+    puncs_density_average = cell_density_array.sum(axis=0) / present.size
+
+    most_common_punctuations = list()
+    for i in np.flatnonzero(counts_column_punc):
+        outlier_array = fc_lfh.helper_outlier_calcu(cell_density_array[:, i], weight_outlier)
+        most_common_punctuations.append({
+            "punctuation": string.punctuation[i],
+            "count": counts_column_punc[i],
+            "ratio": counts_column_punc[i] / float(number_of_chars),
+            "punctuation_density_aggregate": {"mean": puncs_density_average[i]},
+            "punctuation_density_outliers": [{"n": weight_outlier, "count": sum(outlier_array)}]
+        })
+    feature["most_common_punctuations"] = sorted(most_common_punctuations, key=lambda k: k['count'], reverse=True)
+
+
+def compute_text_features(column, feature, feature_list, k, punctuation_outlier_weight=3):
+    """
+    Compute all the requested metafeatures of a text column in one go.
+
+    column: pandas.Series of str, missing values already filled with ''
+    feature: dict to store the result
+    feature_list: list of metafeature names to compute
+    k: number of entries kept in the most_common_* lists
+    """
+    if column.size == 0:
+        return
+
+    # must run first, trimming may turn cells into missing values
+    if _requested(feature_list, SPACE_FEATURES):
+        column = strip_spaces(column, feature)
+
+    present = column.dropna()
+    if present.size == 0:
+        return
+
+    if _requested(feature_list, DISTINCT_VALUE_FEATURES):
+        feature["number_of_distinct_values"] = present.nunique()
+        feature["ratio_of_distinct_values"] = feature["number_of_distinct_values"] / float(present.size)
+
+    if "natural_language_of_feature" in feature_list:
+        fc_lfh.compute_lang(present, feature)
+
+    need_numbers = _requested(feature_list, NUMERIC_FEATURES) or "most_common_punctuations" in feature_list
+    if need_numbers:
+        numbers, is_decimal = parse_decimal(present)
+
+    lengths = present.str.len().values
+    if _requested(feature_list, CONTAIN_NUMERIC_FEATURES) or "numeric_char_density" in feature_list:
+        digits = present.str.count(r"\d").values
+        if "numeric_char_density" in feature_list:
+            feature["numeric_char_density"] = {'mean': float(digits.sum()) / lengths.sum()}
+        cnt = int(np.count_nonzero(digits))
+        if _requested(feature_list, CONTAIN_NUMERIC_FEATURES) and cnt > 0:
+            feature["number_of_values_containing_numeric_char"] = cnt
+            feature["ratio_of_values_containing_numeric_char"] = float(cnt) / present.size
+
+    if "most_common_punctuations" in feature_list:
+        skip = is_decimal | present.str.isdigit().values.astype(bool)
+        _compute_punctuation(present, lengths, skip, feature, punctuation_outlier_weight)
+
+    if _requested(feature_list, NUMERIC_FEATURES):
+        col_num = pd.Series(numbers[is_decimal]).dropna()
+        if col_num.count() > 0:
+            fc_hih.numerical_stats(feature, col_num, present.size, feature_list)
+
+    # tokens separated by white space
+    if (_requested(feature_list, TOKEN_FEATURES + DISTINCT_TOKEN_FEATURES) or
+            "most_common_numeric_tokens" in feature_list or "most_common_alphanumeric_tokens" in feature_list):
+        tokens, tokens_per_cell = flatten(present.str.split())
+        codes, uniques, counts = count_tokens(tokens)
+        distinct = pd.Series(uniques, dtype=object)
+
+        if _requested(feature_list, DISTINCT_TOKEN_FEATURES) and tokens.size:
+            feature["number_of_distinct_tokens"] = len(uniques)
+            feature["ratio_of_distinct_tokens"] = len(uniques) / float(tokens.size)
+
+        if "most_common_numeric_tokens" in feature_list:
+            is_numeric_token = parse_decimal(distinct)[1]
+            if is_numeric_token.any():
+                feature["most_common_numeric_tokens"] = top_k(uniques[is_numeric_token], counts[is_numeric_token], k)
+
+        if "most_common_alphanumeric_tokens" in feature_list:
+            is_alnum_token = distinct.str.isalnum().values.astype(bool)
+            if is_alnum_token.any():
+                feature["most_common_alphanumeric_tokens"] = top_k(uniques[is_alnum_token], counts[is_alnum_token], k)
+
+        if _requested(feature_list, TOKEN_FEATURES) and tokens.size:
+            feature["most_common_tokens"] = top_k(uniques, counts, k, ties_by_name=False)
+            # same definition as compute_common_tokens: cells holding at least one all-digit token
+            is_digit_token = distinct.str.isdigit().values.astype(bool)
+            cell_ids = np.repeat(np.arange(present.size), tokens_per_cell)
+            cnt = np.unique(cell_ids[is_digit_token[codes]]).size
+            if cnt > 0:
+                feature["number_of_tokens_containing_numeric_char"] = cnt
+                feature["ratio_of_tokens_containing_numeric_char"] = float(cnt) / present.size
+
+    if "most_common_raw_values" in feature_list:
+        fc_hih.compute_common_values(present, feature, k)
+
+    # tokens separated by punctuation and white space
+    if _requested(feature_list, PUNCTUATION_TOKEN_FEATURES):
+        tokens, _ = flatten(present.str.findall(ALNUM_RUN))
+        if tokens.size:
+            _, uniques, counts = count_tokens(tokens)
+            has_digit = pd.Series(uniques, dtype=object).str.contains(r"\d").values.astype(bool)
+            feature["most_common_tokens_split_by_punctuation"] = top_k(uniques, counts, k)
+            feature["number_of_distinct_tokens_split_by_punctuation"] = len(uniques)
+            feature["ratio_of_distinct_tokens_split_by_punctuation"] = float(len(uniques)) / tokens.size
+            cnt = int(counts[has_digit].sum())
+            if cnt > 0:
+                feature["number_of_tokens_split_by_punctuation_containing_numeric_char"] = cnt
+                feature["ratio_of_tokens_split_by_punctuation_containing_numeric_char"] = float(cnt) / tokens.size
@@ -0,0 +1,460 @@
+"""
+Chunked profiling: the column metafeatures computed from row chunks within bounded memory.
+
+Each column is summarized by a ColumnSketch, made of additive counters and of the mergeable summaries in sketches
+(HyperLogLog for the distinct counts, space-saving for the most_common_* lists, t-digest for the quantiles and the
+outliers). The metafeatures have the same names and meaning as the ones of feature_compute_fused. Counts, ratios and
+means are exact; the distinct counts and the most_common_* lists are exact until the sketch capacity is exceeded; the
+quantiles and the outlier counts are estimates once a column holds more than a few hundred numbers.
+
+A column whose chunks hold values of different kinds (e.g. numbers, then text) is profiled as text, as pandas reads it
+when reading the whole table at once: the values of the earlier chunks are replayed as strings.
+"""
+import copy
+import logging
+import string
+from collections import Counter
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_fused as fc_fused
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_lfh as fc_lfh
+from dsbox.datapreprocessing.cleaner.dependencies import sketches
+from dsbox.datapreprocessing.cleaner.dependencies.feature_compute_fused import (
+    SPACE_FEATURES, DISTINCT_VALUE_FEATURES, DISTINCT_TOKEN_FEATURES, NUMERIC_FEATURES, TOKEN_FEATURES,
+    PUNCTUATION_TOKEN_FEATURES, CONTAIN_NUMERIC_FEATURES)
+
+_logger = logging.getLogger(__name__)
+
+# column kinds, as dispatched by the in-memory profiler
+BOOL = 'bool'
+NUMERIC = 'numeric'
+TEXT = 'text'
+
+# sigma of the numeric outliers, see feature_compute_hih.numerical_stats
+_NUMERIC_OUTLIER_SIGMA = 3
+
+# number of rows replayed at a time when a column turns out to be text
+_REPLAY_BLOCK_SIZE = 100000
+
+
+def column_kind(column):
+    if column.dtype.kind == 'b':
+        return BOOL
+    if column.dtype.kind in np.typecodes['AllInteger'] + 'uf':
+        return NUMERIC
+    return TEXT
+
+
+class ColumnSketch:
+    """
+    Mergeable summary of one column, updated chunk by chunk.
+
+    capacity: number of counters of each space-saving summary
+    precision: HyperLogLog precision, the registers take 2 ** precision bytes
+    compression: t-digest compression, about the number of centroids kept
+    """
+
+    def __init__(self, feature_list, k, punctuation_outlier_weight=3, capacity=1000, precision=14, compression=100):
+        self.feature_list = feature_list
+        self.k = k
+        self.punctuation_outlier_weight = punctuation_outlier_weight
+        self.capacity = capacity
+        self.precision = precision
+        self.compression = compression
+        self.kind = None
+        self._counts = Counter()
+        self._sketches = dict()
+        self._languages = Counter()
+        self._punctuation = None
+
+    def update(self, column):
+        """
+        Add a chunk (pandas.Series) of the column.
+        """
+        kind = column_kind(column)
+        if self.kind is None:
+            self.kind = kind
+        elif kind != self.kind and self.kind != TEXT:
+            _logger.debug('Column "%s" changed from %s to %s values between chunks', column.name, self.kind, kind)
+            self._promote()
+
+        self._counts['rows'] += column.size
+        self._counts['missing'] += int(pd.isnull(column).sum())
+        if self.kind == BOOL:
+            self._update_bool(column)
+        elif self.kind == NUMERIC:
+            self._update_numeric(column)
+        else:
+            self._update_text(column)
+
+    def merge(self, other):
+        """
+        Add the summary of another part of the same column.
+        """
+        if other.kind is None:
+            return
+        if self.kind is None:
+            self.kind = other.kind
+        elif other.kind != self.kind:
+            if self.kind != TEXT:
+                self._promote()
+            if other.kind != TEXT:
+                other = copy.deepcopy(other)
+                other._promote()
+        # a punctuation density only kept by one side misses the zeros of the cells of the other side
+        for name in set(self._sketches).symmetric_difference(other._sketches):
+            if name.startswith('punctuation_density_'):
+                if name in self._sketches:
+                    self._sketches[name].update_weighted(np.zeros(1), np.full(1, other._counts['present']))
+                else:
+                    self._sketch(name).update_weighted(np.zeros(1), np.full(1, self._counts['present']))
+        self._counts.update(other._counts)
+        self._languages.update(other._languages)
+        for name, sketch in other._sketches.items():
+            if name in self._sketches:
+                self._sketches[name].merge(sketch)
+            else:
+                self._sketches[name] = sketch
+        if other._punctuation is not None:
+            if self._punctuation is None:
+                self._punctuation = {'count': np.zeros(len(string.punctuation), dtype=np.int64),
+                                     'density_sum': np.zeros(len(string.punctuation)),
+                                     'density_sum_squares': np.zeros(len(string.punctuation))}
+            for name, value in other._punctuation.items():
+                self._punctuation[name] = self._punctuation[name] + value
+
+    def features(self):
+        """
+        The metafeatures of the column seen so far, as a plain dict.
+        """
+        feature = dict()
+        rows = self._counts['rows']
+        if rows == 0:
+            return feature
+
+        feature_list = self.feature_list
+        if self.kind in (BOOL, NUMERIC):
+            if "number_of_missing_values" in feature_list:
+                feature["number_of_missing_values"] = self._counts['missing']
+            if "ratio_of_missing_values" in feature_list:
+                feature["ratio_of_missing_values"] = self._counts['missing'] / rows
+            if "number_of_distinct_values" in feature_list:
+                feature["number_of_distinct_values"] = self._sketch('values').count()
+            if "ratio_of_distinct_values" in feature_list:
+                feature["ratio_of_distinct_values"] = self._sketch('values').count() / float(rows)
+            if self.kind == NUMERIC and _requested(feature_list, NUMERIC_FEATURES):
+                self._numeric_features(feature, rows - self._counts['missing'])
+        elif self.kind == TEXT:
+            if "number_of_missing_values" in feature_list:
+                feature["number_of_missing_values"] = self._counts['missing']
+            if "ratio_of_missing_values" in feature_list:
+                feature["ratio_of_missing_values"] = self._counts['missing'] / rows
+            self._text_features(feature, rows)
+
+        if "most_common_raw_values" in feature_list and 'raw_values' in self._sketches:
+            top = self._sketch('raw_values').top(self.k)
+            if top:
+                feature["most_common_raw_values"] = top
+        return feature
+
+    def _sketch(self, name):
+        if name not in self._sketches:
+            if name in ('values', 'tokens', 'punctuation_tokens'):
+                self._sketches[name] = sketches.HyperLogLog(self.precision)
+            elif name in ('numbers',) or name.startswith('punctuation_density_'):
+                self._sketches[name] = sketches.TDigest(self.compression)
+            elif name == 'moments':
+                self._sketches[name] = sketches.Moments()
+            else:
+                self._sketches[name] = sketches.SpaceSaving(self.capacity)
+        return self._sketches[name]
+
+    def _promote(self):
+        """
+        Turn the sketch of a bool or numeric column into the sketch of a text column, replaying the values seen so far
+        as strings. The replay is exact as long as the column held no more than capacity distinct values.
+        """
+        replay = self._sketches.get('replay')
+        if replay is not None and not replay.is_exact():
+            _logger.warning('Column turned to text after more than %d distinct %s values, the text metafeatures of '
+                            'the earlier values are approximate', self.capacity, self.kind)
+        self.kind = TEXT
+        self._counts = Counter(rows=self._counts['rows'], missing=self._counts['missing'])
+        self._sketches = dict()
+        self._languages = Counter()
+        self._punctuation = None
+        if replay is None or len(replay.counts()) == 0:
+            return
+        counts = replay.counts()
+        values = np.asarray(pd.Series(counts.index.values).astype(str), dtype=object)
+        ends = np.cumsum(counts.values)
+        for start in range(0, int(ends[-1]), _REPLAY_BLOCK_SIZE):
+            rows = np.arange(start, min(start + _REPLAY_BLOCK_SIZE, int(ends[-1])))
+            self._update_text(pd.Series(values[np.searchsorted(ends, rows, side='right')], dtype=object))
+
+    def _update_bool(self, column):
+        present = column.dropna()
+        # the values, in case a later chunk turns the column to text
+        self._sketch('replay').update(present.values)
+        present = present.astype(str)
+        if _requested(self.feature_list, DISTINCT_VALUE_FEATURES):
+            self._sketch('values').update(present.values)
+        if "most_common_raw_values" in self.feature_list:
+            self._sketch('raw_values').update(present)
+
+    def _update_numeric(self, column):
+        feature_list = self.feature_list
+        present = column.dropna()
+        self._sketch('replay').update(present.values)
+        if _requested(feature_list, DISTINCT_VALUE_FEATURES):
+            self._sketch('values').update(present.values)
+        if _requested(feature_list, NUMERIC_FEATURES):
+            self._update_numbers(present.values.astype(float))
+        if "most_common_raw_values" in feature_list:
+            self._sketch('raw_values').update(present.astype(str))
+
+    def _update_numbers(self, numbers):
+        numbers = numbers[~np.isnan(numbers)]
+        self._counts['numbers'] += numbers.size
+        self._counts['positive_numbers'] += int(np.count_nonzero(numbers > 0))
+        self._counts['negative_numbers'] += int(np.count_nonzero(numbers < 0))
+        self._counts['numbers_equal_0'] += int(np.count_nonzero(numbers == 0))
+        self._counts['numbers_equal_1'] += int(np.count_nonzero(numbers == 1))
+        self._counts['numbers_equal_-1'] += int(np.count_nonzero(numbers == -1))
+        self._sketch('moments').update(numbers)
+        self._sketch('numbers').update(numbers)
+
+    def _update_text(self, column):
+        feature_list = self.feature_list
+        present = column.astype(object).fillna('').astype(str)
+
+        # same as strip_spaces: trimming may turn cells into missing values
+        if _requested(feature_list, SPACE_FEATURES):
+            trimmed, leading, trailing, is_empty = fc_fused.trim_spaces(present)
+            self._counts['leading_spaces'] += int(leading.sum())
+            self._counts['trailing_spaces'] += int(trailing.sum())
+            present = trimmed[~is_empty.values]
+        if present.size == 0:
+            return
+        self._counts['present'] += present.size
+
+        if _requested(feature_list, DISTINCT_VALUE_FEATURES):
+            self._sketch('values').update(present.values)
+
+        if "natural_language_of_feature" in feature_list:
+            languages = dict()
+            fc_lfh.compute_lang(present, languages)
+            for language in languages.get("natural_language_of_feature", []):
+                self._languages[language['name']] += language['count']
+
+        if _requested(feature_list, NUMERIC_FEATURES) or "most_common_punctuations" in feature_list:
+            numbers, is_decimal = fc_fused.parse_decimal(present)
+
+        lengths = present.str.len().values
+        self._counts['chars'] += int(lengths.sum())
+        if _requested(feature_list, CONTAIN_NUMERIC_FEATURES) or "numeric_char_density" in feature_list:
+            digits = present.str.count(r"\d").values
+            self._counts['digits'] += int(digits.sum())
+            self._counts['values_containing_digits'] += int(np.count_nonzero(digits))
+
+        if "most_common_punctuations" in feature_list:
+            self._update_punctuation(present, lengths, is_decimal | present.str.isdigit().values.astype(bool))
+
+        if _requested(feature_list, NUMERIC_FEATURES):
+            self._update_numbers(numbers[is_decimal])
+
+        if (_requested(feature_list, TOKEN_FEATURES + DISTINCT_TOKEN_FEATURES) or
+                "most_common_numeric_tokens" in feature_list or "most_common_alphanumeric_tokens" in feature_list):
+            tokens, tokens_per_cell = fc_fused.flatten(present.str.split())
+            codes, uniques, counts = fc_fused.count_tokens(tokens)
+            distinct = pd.Series(uniques, dtype=object)
+            self._counts['tokens'] += tokens.size
+            if _requested(feature_list, DISTINCT_TOKEN_FEATURES):
+                self._sketch('tokens').update(uniques)
+            if "most_common_numeric_tokens" in feature_list:
+                is_numeric_token = fc_fused.parse_decimal(distinct)[1]
+                self._sketch('numeric_tokens').update_counts(uniques[is_numeric_token], counts[is_numeric_token])
+            if "most_common_alphanumeric_tokens" in feature_list:
+                is_alnum_token = distinct.str.isalnum().values.astype(bool)
+                self._sketch('alphanumeric_tokens').update_counts(uniques[is_alnum_token], counts[is_alnum_token])
+            if _requested(feature_list, TOKEN_FEATURES):
+                self._sketch('common_tokens').update_counts(uniques, counts)
+                is_digit_token = distinct.str.isdigit().values.astype(bool)
+                cell_ids = np.repeat(np.arange(present.size), tokens_per_cell)
+                self._counts['cells_with_digit_token'] += np.unique(cell_ids[is_digit_token[codes]]).size
+
+        if "most_common_raw_values" in feature_list:
+            self._sketch('raw_values').update(present)
+
+        if _requested(feature_list, PUNCTUATION_TOKEN_FEATURES):
+            tokens, _ = fc_fused.flatten(present.str.findall(fc_fused.ALNUM_RUN))
+            if tokens.size:
+                _, uniques, counts = fc_fused.count_tokens(tokens)
+                has_digit = pd.Series(uniques, dtype=object).str.contains(r"\d").values.astype(bool)
+                self._counts['punctuation_tokens'] += tokens.size
+                self._counts['punctuation_tokens_with_digit'] += int(counts[has_digit].sum())
+                self._sketch('punctuation_tokens').update(uniques)
+                self._sketch('common_punctuation_tokens').update_counts(uniques, counts)
+
+    def _update_punctuation(self, present, lengths, skip):
+        puncs_cell = fc_fused.punctuation_counts(present, skip)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            density = puncs_cell / lengths.reshape([present.size, 1])
+        chunk = {'count': puncs_cell.sum(axis=0),
+                 'density_sum': density.sum(axis=0),
+                 'density_sum_squares': (density ** 2).sum(axis=0)}
+        if self._punctuation is None:
+            self._punctuation = chunk
+        else:
+            for name, value in chunk.items():
+                self._punctuation[name] = self._punctuation[name] + value
+
+        # the densities of a punctuation are only kept once it shows up, the cells before it are all zeros
+        seen_before = self._counts['present'] - present.size
+        for i in np.flatnonzero(self._punctuation['count']):
+            name = 'punctuation_density_{}'.format(i)
+            if name not in self._sketches and seen_before:
+                self._sketch(name).update_weighted(np.zeros(1), np.full(1, seen_before))
+            self._sketch(name).update(density[:, i])
+
+    def _numeric_features(self, feature, num_nonblank):
+        feature_list = self.feature_list
+        count = self._counts['numbers']
+        if count == 0:
+            return
+        moments = self._sketch('moments')
+        digest = self._sketch('numbers')
+        if "number_of_numeric_values" in feature_list:
+            feature["number_of_numeric_values"] = count
+        if "ratio_of_numeric_values" in feature_list:
+            feature["ratio_of_numeric_values"] = count / num_nonblank
+        if count == 1:
+            feature["number_std"] = 0
+        if "number_of_outlier_numeric_values" in feature_list:
+            bound = _NUMERIC_OUTLIER_SIGMA * moments.std()
+            feature["number_of_outlier_numeric_values"] = digest.count_outside(moments.mean - bound,
+                                                                               moments.mean + bound)
+        if "number_of_positive_numeric_values" in feature_list:
+            feature["number_of_positive_numeric_values"] = self._counts['positive_numbers']
+        if "number_of_negative_numeric_values" in feature_list:
+            feature["number_of_negative_numeric_values"] = self._counts['negative_numbers']
+        if "number_of_numeric_values_equal_0" in feature_list:
+            feature["number_of_numeric_values_equal_0"] = self._counts['numbers_equal_0']
+        if "number_of_numeric_values_equal_1" in feature_list:
+            feature["number_of_numeric_values_equal_1"] = self._counts['numbers_equal_1']
+        if "number_of_numeric_values_equal_-1" in feature_list:
+            feature["number_of_numeric_values_equal_-1"] = self._counts['numbers_equal_-1']
+        if "target_values" in feature_list:
+            feature["target_values"] = {'mean': moments.mean,
+                                        'std': moments.std(),
+                                        'median': digest.quantile(0.5),
+                                        'quartile_1': digest.quantile(0.25),
+                                        'quartile_3': digest.quantile(0.75)}
+
+    def _text_features(self, feature, rows):
+        feature_list = self.feature_list
+        counts = self._counts
+        if _requested(feature_list, SPACE_FEATURES):
+            feature["number_of_values_with_leading_spaces"] = counts['leading_spaces']
+            feature["ratio_of_values_with_leading_spaces"] = counts['leading_spaces'] / rows
+            feature["number_of_values_with_trailing_spaces"] = counts['trailing_spaces']
+            feature["ratio_of_values_with_trailing_spaces"] = counts['trailing_spaces'] / rows
+
+        present = counts['present']
+        if present == 0:
+            return
+
+        if _requested(feature_list, DISTINCT_VALUE_FEATURES):
+            feature["number_of_distinct_values"] = self._sketch('values').count()
+            feature["ratio_of_distinct_values"] = feature["number_of_distinct_values"] / float(present)
+
+        if "natural_language_of_feature" in feature_list:
+            feature["natural_language_of_feature"] = [{'name': name, 'count': count}
+                                                      for name, count in self._languages.most_common()]
+
+        if "numeric_char_density" in feature_list:
+            feature["numeric_char_density"] = {'mean': float(counts['digits']) / counts['chars']}
+        if _requested(feature_list, CONTAIN_NUMERIC_FEATURES) and counts['values_containing_digits'] > 0:
+            feature["number_of_values_containing_numeric_char"] = counts['values_containing_digits']
+            feature["ratio_of_values_containing_numeric_char"] = float(counts['values_containing_digits']) / present
+
+        if "most_common_punctuations" in feature_list and self._punctuation is not None:
+            self._punctuation_features(feature, present)
+
+        if _requested(feature_list, NUMERIC_FEATURES):
+            self._numeric_features(feature, present)
+
+        tokens = counts['tokens']
+        if _requested(feature_list, DISTINCT_TOKEN_FEATURES) and tokens:
+            feature["number_of_distinct_tokens"] = self._sketch('tokens').count()
+            feature["ratio_of_distinct_tokens"] = feature["number_of_distinct_tokens"] / float(tokens)
+        for name, sketch in (("most_common_numeric_tokens", 'numeric_tokens'),
+                             ("most_common_alphanumeric_tokens", 'alphanumeric_tokens')):
+            if name in feature_list:
+                top = self._sketch(sketch).top(self.k)
+                if top:
+                    feature[name] = top
+        if _requested(feature_list, TOKEN_FEATURES) and tokens:
+            feature["most_common_tokens"] = self._sketch('common_tokens').top(self.k)
+            if counts['cells_with_digit_token'] > 0:
+                feature["number_of_tokens_containing_numeric_char"] = counts['cells_with_digit_token']
+                feature["ratio_of_tokens_containing_numeric_char"] = float(counts['cells_with_digit_token']) / present
+
+        tokens = counts['punctuation_tokens']
+        if _requested(feature_list, PUNCTUATION_TOKEN_FEATURES) and tokens:
+            distinct = self._sketch('punctuation_tokens').count()
+            feature["most_common_tokens_split_by_punctuation"] = self._sketch('common_punctuation_tokens').top(self.k)
+            feature["number_of_distinct_tokens_split_by_punctuation"] = distinct
+            feature["ratio_of_distinct_tokens_split_by_punctuation"] = float(distinct) / tokens
+            if counts['punctuation_tokens_with_digit'] > 0:
+                feature["number_of_tokens_split_by_punctuation_containing_numeric_char"] = \
+                    counts['punctuation_tokens_with_digit']
+                feature["ratio_of_tokens_split_by_punctuation_containing_numeric_char"] = \
+                    float(counts['punctuation_tokens_with_digit']) / tokens
+
+    def _punctuation_features(self, feature, present):
+        weight = self.punctuation_outlier_weight
+        punctuation = self._punctuation
+        most_common_punctuations = list()
+        for i in np.flatnonzero(punctuation['count']):
+            # population std, like np.std in helper_outlier_calcu
+            mean = punctuation['density_sum'][i] / present
+            std = np.sqrt(max(punctuation['density_sum_squares'][i] / present - mean ** 2, 0))
+            digest = self._sketch('punctuation_density_{}'.format(i))
+            most_common_punctuations.append({
+                "punctuation": string.punctuation[i],
+                "count": punctuation['count'][i],
+                "ratio": punctuation['count'][i] / float(self._counts['chars']),
+                "punctuation_density_aggregate": {"mean": mean},
+                "punctuation_density_outliers": [{"n": weight,
+                                                  "count": digest.count_outside(mean - weight * std,
+                                                                                mean + weight * std)}]
+            })
+        feature["most_common_punctuations"] = sorted(most_common_punctuations, key=lambda k: k['count'], reverse=True)
+
+
+def profile_chunks(chunks, feature_list, k, punctuation_outlier_weight=3, **sketch_args):
+    """
+    Profile a table given as an iterable of row chunks (pandas.DataFrame with the same columns, e.g. from
+    pandas.read_csv(..., chunksize=...)). Only one chunk is held in memory at a time.
+
+    Returns the list of the metafeatures dict of each column, in column order.
+    """
+    columns = None
+    for chunk in chunks:
+        if columns is None:
+            columns = [ColumnSketch(feature_list, k, punctuation_outlier_weight, **sketch_args)
+                       for _ in range(chunk.shape[1])]
+        elif chunk.shape[1] != len(columns):
+            raise ValueError("Chunk has {} columns, expected {}".format(chunk.shape[1], len(columns)))
+        for index, sketch in enumerate(columns):
+            sketch.update(chunk.iloc[:, index])
+    if columns is None:
+        return []
+    return [sketch.features() for sketch in columns]
+
+
+def _requested(feature_list, names):
+    return any(name in feature_list for name in names)
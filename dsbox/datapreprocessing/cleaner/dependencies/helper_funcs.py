@@ -1,7 +1,9 @@
 import re
 from dateutil.parser import parse
 import d3m.metadata.base as mbase
+import numpy as np
 import pandas as pd
+import scipy.sparse
 
 """
 this script contains all the helper functions that apply to a input string
@@ -11,6 +13,8 @@ most refer from: https://github.com/usc-isi-i2/dptk
 UNIQUE_VALUE_TO_BE_CATEGORICAL = 20
 RATIO_TO_BE_CATEGORICAL = 0.3
 
+ENCODER_OUTPUT_TYPES = ['dense', 'sparse']
+
 NEGATIVE_SEMANTIC_TYPES = set(["https://metadata.datadrivendiscovery.org/types/FileName",
                                "https://metadata.datadrivendiscovery.org/types/CategoricalData",
                                "https://metadata.datadrivendiscovery.org/types/OrdinalData",
@@ -125,3 +129,34 @@ class HelperFunction:
         elif pd.isnull(x):
             return True
         return False
+
+    @staticmethod
+    def indicator_frame(rows, columns, column_names, index, sparse=False, dtype=np.uint8):
+        """
+        DataFrame of 0/1 indicators that are 1 at the (rows[i], columns[i]) positions. With sparse, the columns are
+        pandas sparse columns of uint8 with fill value 0, built without allocating the dense array.
+        """
+        shape = (len(index), len(column_names))
+        if sparse:
+            matrix = scipy.sparse.csc_matrix((np.ones(len(rows), dtype=np.uint8), (rows, columns)), shape=shape)
+            # from_spmatrix gives an int fill value, with a uint8 one every cell reads as numpy.uint8
+            dtype = pd.SparseDtype(np.uint8, np.uint8(0))
+            frame = pd.DataFrame({
+                i: pd.arrays.SparseArray(pd.arrays.SparseArray.from_spmatrix(matrix[:, i]), dtype=dtype)
+                for i in range(shape[1])
+            }, index=index, columns=range(shape[1]))
+            frame.columns = column_names
+            return frame
+        values = np.zeros(shape, dtype=dtype)
+        values[rows, columns] = 1
+        return pd.DataFrame(values, index=index, columns=column_names)
+
+    @staticmethod
+    def indicator_structural_type(dtype):
+        """
+        structural type for the metadata of an indicator column of dtype: int for the dense columns, the numpy type of
+        the values (numpy.uint8) for the pandas sparse columns.
+        """
+        if isinstance(dtype, pd.SparseDtype):
+            return dtype.subtype.type
+        return int
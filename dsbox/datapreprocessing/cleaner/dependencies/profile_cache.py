@@ -0,0 +1,205 @@
+"""
+Cache of profiling results, keyed by a content hash of the input table.
+
+Pipeline search profiles the same training table many times. The results are kept in memory and optionally on disk,
+both with least recently used eviction under a size cap in bytes. Entries are stored pickled, so callers always get
+their own copy back. Unpickling runs code, so the disk level is only used in a directory that only the current user can
+write to: by default a directory of the user's cache directory, created with mode 0700, and any directory owned by
+another user or writable by others is refused.
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import pickle
+import stat
+import threading
+
+import pandas as pd  # type: ignore
+
+_logger = logging.getLogger(__name__)
+
+CACHE_MODES = ['none', 'memory', 'disk']
+DEFAULT_DIRECTORY = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                 'dsbox', 'profile_cache')
+
+_caches = dict()
+_caches_lock = threading.Lock()
+
+
+def table_fingerprint(data, metadata=None, *key_parts):
+    """
+    Hash of the content of a DataFrame: column names, dtypes and values, plus its metadata and any other parts of the
+    key (e.g. the hyperparameters the result depends on). The index is ignored.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((data.shape, [str(name) for name in data.columns],
+                        [str(dtype) for dtype in data.dtypes])).encode())
+    for index in range(data.shape[1]):
+        column = data.iloc[:, index]
+        try:
+            hashes = pd.util.hash_pandas_object(column, index=False)
+        except TypeError:
+            # unhashable cells, e.g. lists
+            hashes = pd.util.hash_pandas_object(column.astype(str), index=False)
+        digest.update(hashes.values.tobytes())
+    if metadata is not None:
+        digest.update(json.dumps(metadata.to_json_structure(), sort_keys=True, default=str).encode())
+    digest.update(repr(key_parts).encode())
+    return digest.hexdigest()
+
+
+def private_directory(directory):
+    """
+    Whether directory, created with mode 0700 when missing, is a directory (not a link) owned by the current user and
+    that no other user can write to, so that the files read from it were written by this user.
+    """
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.lstat(directory)
+    except OSError:
+        _logger.warning('Cannot create the profile cache directory %s', directory, exc_info=True)
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        _logger.warning('The profile cache directory %s is not a directory, not using it', directory)
+        return False
+    # no owners on Windows, where the directory is in the profile of the user by default
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        _logger.warning('The profile cache directory %s belongs to another user, not using it', directory)
+        return False
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        _logger.warning('The profile cache directory %s can be written by other users, not using it', directory)
+        return False
+    return True
+
+
+class ProfileCache:
+    """
+    Two level LRU cache: in memory, and on disk when directory is given and private_directory() accepts it.
+    max_bytes caps each level.
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory if directory and private_directory(directory) else None
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        The cached value, or None.
+        """
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+            elif self.directory:
+                blob = self._read(key)
+                if blob is not None:
+                    self._put_memory(key, blob)
+        if blob is None:
+            return None
+        _logger.debug('Profile cache hit %s', key)
+        return pickle.loads(blob)
+
+    def put(self, key, value):
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            _logger.warning('Cannot cache the profile, it cannot be pickled', exc_info=True)
+            return
+        with self._lock:
+            self._put_memory(key, blob)
+            if self.directory:
+                self._write(key, blob)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for path, _, _ in self._files():
+                os.remove(path)
+
+    def _put_memory(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            # the modification time orders the files for eviction
+            os.utime(path)
+            return blob
+        except OSError:
+            return None
+
+    def _write(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(temp_path, path)
+        except OSError:
+            _logger.warning('Cannot write the profile cache file %s', path, exc_info=True)
+            return
+        files = sorted(self._files(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _files(self):
+        if not self.directory:
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+
+def get_cache(mode, max_bytes, directory=None):
+    """
+    The cache shared by all the primitives using the same mode and directory, or None when mode is 'none'.
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError('Unknown cache mode {}, expected one of {}'.format(mode, CACHE_MODES))
+    if mode == 'none':
+        return None
+    if mode == 'disk':
+        directory = directory or DEFAULT_DIRECTORY
+    else:
+        directory = None
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = _caches[directory] = ProfileCache(max_bytes, directory)
+        cache.max_bytes = max_bytes
+        return cache
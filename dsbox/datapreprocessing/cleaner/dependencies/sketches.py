@@ -0,0 +1,300 @@
+"""
+Mergeable, bounded memory summaries used by the chunked profiling mode.
+
+Every summary can be updated with a chunk of values and merged with another summary of the same kind, so a column can
+be profiled chunk by chunk (or by several workers) and the partial results combined at the end.
+"""
+import math
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+
+def hash_values(values):
+    """
+    Deterministic 64 bit hash of each value. Numbers are hashed as float64 so an int and a float chunk of the same
+    column agree.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'biuf':
+        values = values.astype(np.float64)
+    elif values.dtype.kind != 'O':
+        values = values.astype(str).astype(object)
+    return pd.util.hash_array(values)
+
+
+class Moments:
+    """
+    Count, mean and sum of squared deviations, merged with Chan's parallel formula.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        other = Moments()
+        other.count = values.size
+        if values.size:
+            other.mean = float(values.mean())
+            other.m2 = float(((values - other.mean) ** 2).sum())
+        self.merge(other)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+
+    def std(self):
+        """
+        Sample standard deviation (ddof=1), like pandas.
+        """
+        if self.count < 2:
+            return np.nan
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2 ** precision registers.
+
+    Like HyperLogLog++, the hashes are kept as an exact sorted set while they fit in the memory of the registers
+    (2 ** precision bytes), so the count is exact on low cardinality columns.
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+        self.precision = precision
+        self._num_registers = 1 << precision
+        self._sparse_limit = self._num_registers // 8
+        self._sparse = np.empty(0, dtype=np.uint64)
+        self._registers = None
+
+    @staticmethod
+    def precision_for(relative_error):
+        """
+        Smallest precision whose standard error, 1.04 / sqrt(2 ** precision), is within relative_error.
+        """
+        precision = int(math.ceil(math.log2((1.04 / relative_error) ** 2)))
+        return min(max(precision, 4), 18)
+
+    def update(self, values):
+        self._add_hashes(hash_values(values))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog of different precision")
+        if other._registers is None:
+            self._add_hashes(other._sparse)
+        else:
+            self._densify()
+            np.maximum(self._registers, other._registers, out=self._registers)
+
+    def count(self):
+        if self._registers is None:
+            return int(self._sparse.size)
+        m = self._num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self._registers.astype(int)).sum()
+        zeros = int(np.count_nonzero(self._registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # linear counting for the small range
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def _add_hashes(self, hashes):
+        if self._registers is None:
+            self._sparse = np.union1d(self._sparse, hashes)
+            if self._sparse.size > self._sparse_limit:
+                self._densify()
+        elif hashes.size:
+            self._add_to_registers(hashes)
+
+    def _densify(self):
+        if self._registers is None:
+            self._registers = np.zeros(self._num_registers, dtype=np.uint8)
+            self._add_to_registers(self._sparse)
+            self._sparse = np.empty(0, dtype=np.uint64)
+
+    def _add_to_registers(self, hashes):
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes << np.uint64(p)
+        # rank = position of the first 1 bit in the remaining 64 - p bits
+        rank = np.full(hashes.size, 64 - p + 1, dtype=np.uint8)
+        nonzero = rest != 0
+        rank[nonzero] = 64 - _bit_length(rest[nonzero]) + 1
+        np.maximum.at(self._registers, index, rank)
+
+
+def _bit_length(values):
+    """
+    int.bit_length of an array of non zero uint64.
+    """
+    length = np.floor(np.log2(values.astype(float))).astype(np.int64)
+    # the float conversion may round up to the next power of two
+    length[(values >> length.astype(np.uint64)) == 0] -= 1
+    return length + 1
+
+
+class SpaceSaving:
+    """
+    Space-saving heavy hitter summary keeping at most capacity counters.
+
+    The counts are exact as long as no more than capacity distinct values were seen. Afterwards a count may be over
+    estimated by at most `floor`, which also bounds the count of any value not in the summary.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.floor = 0
+        self._counts = pd.Series([], dtype=np.int64)
+
+    @staticmethod
+    def capacity_for(error):
+        """
+        Capacity keeping the over estimation of any count within error * (number of values seen).
+        """
+        return int(math.ceil(1 / error))
+
+    def update(self, values):
+        counts = pd.Series(values).value_counts(sort=False)
+        self._merge(counts.astype(np.int64), 0)
+
+    def update_counts(self, values, counts):
+        """
+        Add values already counted, e.g. the uniques and counts of a chunk.
+        """
+        self._merge(pd.Series(np.asarray(counts, dtype=np.int64), index=pd.Index(values, dtype=object)), 0)
+
+    def merge(self, other):
+        self._merge(other._counts, other._full_floor())
+
+    def counts(self):
+        """
+        The counts kept, a pandas.Series indexed by value.
+        """
+        return self._counts
+
+    def is_exact(self):
+        """
+        Whether the counts are exact, i.e. no more than capacity distinct values were seen.
+        """
+        return self.floor == 0
+
+    def top(self, k):
+        """
+        The k heaviest (value, count) pairs, ties ordered by value.
+        """
+        counts = self._counts.iloc[np.argsort(self._counts.index.values.astype(str), kind='mergesort')]
+        counts = counts.iloc[np.argsort(-counts.values, kind='mergesort')[:k]]
+        return [{'name': name, 'count': count} for name, count in counts.items()]
+
+    def _full_floor(self):
+        return self.floor if len(self._counts) < self.capacity else max(self.floor, int(self._counts.min()))
+
+    def _merge(self, counts, floor):
+        own_floor = self._full_floor()
+        index = self._counts.index.append(counts.index).unique()
+        merged = (self._counts.reindex(index, fill_value=own_floor) +
+                  counts.reindex(index, fill_value=floor))
+        if len(merged) > self.capacity:
+            order = np.argsort(-merged.values, kind='mergesort')
+            self.floor = max(own_floor + floor, int(merged.values[order[self.capacity]]))
+            merged = merged.iloc[order[:self.capacity]]
+        elif own_floor + floor:
+            self.floor = own_floor + floor
+        self._counts = merged
+
+
+class TDigest:
+    """
+    Merging t-digest for quantiles and cdf, with at most about compression centroids.
+
+    Equal values share a centroid, so until there are more than 2 * compression distinct values the quantiles (linear
+    interpolation, like pandas) and the counts are exact.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.count = 0
+        self._means = np.empty(0)
+        self._weights = np.empty(0)
+        self._compressed = False
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self._merge(values, np.ones(values.size))
+
+    def update_weighted(self, values, weights):
+        """
+        Add each value weights times.
+        """
+        self._merge(np.asarray(values, dtype=float), np.asarray(weights, dtype=float))
+
+    def merge(self, other):
+        self._compressed = self._compressed or other._compressed
+        self._merge(other._means, other._weights)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        if not self._compressed:
+            # value of the i-th smallest element, i = q * (count - 1), interpolated like pandas
+            position = q * (self.count - 1)
+            below, above = self._means[np.searchsorted(np.cumsum(self._weights),
+                                                       [math.floor(position), math.ceil(position)], side='right')]
+            return float(below + (above - below) * (position - math.floor(position)))
+        centers, means = self._curve()
+        return float(np.interp(q * self.count, centers, means))
+
+    def cdf(self, x):
+        if self.count == 0:
+            return np.nan
+        centers, means = self._curve()
+        return np.interp(x, means, centers) / self.count
+
+    def count_outside(self, lower, upper):
+        """
+        Number of values below lower or above upper.
+        """
+        if self.count == 0:
+            return 0
+        if not self._compressed:
+            return int(self._weights[(self._means < lower) | (self._means > upper)].sum())
+        outside = self.cdf(lower) + 1 - self.cdf(upper)
+        return int(round(outside * self.count))
+
+    def _curve(self):
+        centers = np.cumsum(self._weights) - self._weights / 2
+        return (np.concatenate([[0], centers, [self.count]]),
+                np.concatenate([[self._means[0]], self._means, [self._means[-1]]]))
+
+    def _merge(self, means, weights):
+        keep = (weights > 0) & ~np.isnan(means)
+        if not keep.any():
+            return
+        # equal values are collapsed into one centroid without loss
+        means, group = np.unique(np.concatenate([self._means, means[keep]]), return_inverse=True)
+        weights = np.bincount(group, weights=np.concatenate([self._weights, weights[keep]]))
+        self.count = weights.sum()
+        if means.size > 2 * self.compression:
+            # k1 scale function: centroids are small near the tails and large in the middle
+            q = (np.cumsum(weights) - weights / 2) / self.count
+            group = np.floor(self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)).astype(np.int64)
+            # keep the extreme values as their own centroid, so min and max stay exact
+            group = np.concatenate([[group[0] - 1], group[1:-1], [group[-1] + 1]])
+            _, group = np.unique(group, return_inverse=True)
+            total = np.bincount(group, weights=weights)
+            means = np.bincount(group, weights=means * weights) / total
+            weights = total
+            self._compressed = True
+        self._means, self._weights = means, weights
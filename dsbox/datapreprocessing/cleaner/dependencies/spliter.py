@@ -8,6 +8,7 @@ import logging
 _logger = logging.getLogger(__name__)
 from common_primitives import utils
 from d3m.container import DataFrame as d3m_DataFrame
+from dsbox.common.metadata_batch import MetadataBatch
 from dsbox.datapreprocessing.cleaner.dependencies.helper_funcs import HelperFunction
 
 def update_type(extends, df_origin):
@@ -22,8 +23,9 @@ def update_type(extends, df_origin):
     for key in extends:
         indices.append(new_df.columns.get_loc(key))
 
+    batch = MetadataBatch(new_df.metadata)
     for idx in indices:
-        old_metadata = dict(new_df.metadata.query((mbase.ALL_ELEMENTS, idx)))
+        old_metadata = batch.query_column(idx)
 
         numerics = pd.to_numeric(new_df.iloc[:, idx], errors='coerce')
         length = numerics.shape[0]
@@ -44,8 +46,9 @@ def update_type(extends, df_origin):
 
         old_metadata['semantic_types'] += ("https://metadata.datadrivendiscovery.org/types/Attribute",)
 
-        new_df.metadata = new_df.metadata.update((mbase.ALL_ELEMENTS, idx), old_metadata)
+        batch.update_column(idx, old_metadata)
 
+    new_df.metadata = batch.apply()
     return new_df
 
 
@@ -14,6 +14,8 @@ from d3m.metadata.hyperparams import UniformInt
 from d3m.primitive_interfaces.base import CallResult
 from d3m.primitive_interfaces.unsupervised_learning import UnsupervisedLearnerPrimitiveBase
 
+from dsbox.datapreprocessing.cleaner.dependencies.helper_funcs import HelperFunction, ENCODER_OUTPUT_TYPES
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 
 _logger = logging.getLogger(__name__)
@@ -61,6 +63,12 @@ class EncHyperparameter(hyperparams.Hyperparams):
         semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
         description="Also include primary index columns if input data has them. Applicable only if \"return_result\" is set to \"new\".",
     )
+    output_type = hyperparams.Enumeration(
+        values=ENCODER_OUTPUT_TYPES,
+        default='dense',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Return the one-hot columns as dense uint8 columns, or as pandas sparse uint8 columns (fill value 0), which take memory only for the ones.",
+    )
 
 
 class Encoder(UnsupervisedLearnerPrimitiveBase[Input, Output, EncParams, EncHyperparameter]):
@@ -100,6 +108,8 @@ class Encoder(UnsupervisedLearnerPrimitiveBase[Input, Output, EncParams, EncHype
         self._cat_columns: typing.List[str] = []
         # self._col_index = None
         self._empty_columns: typing.List[str] = []
+        self._categories: typing.Dict[str, pd.CategoricalDtype] = {}
+        self._output_names: typing.Dict[str, typing.List[str]] = {}
 
     def set_training_data(self, *, inputs: Input) -> None:
         self._input_data = inputs
@@ -172,9 +182,48 @@ class Encoder(UnsupervisedLearnerPrimitiveBase[Input, Output, EncParams, EncHype
             if temp:
                 mapping[temp[0]] = temp[1]
         self._mapping = mapping
+        self._set_categories()
         self._fitted = True
         return CallResult(None, has_finished=True)
 
+    def _set_categories(self) -> None:
+        """
+        Fitted categorical dtype of each encoded column, and the names of its output columns: one per category, then
+        the other_ bucket if the column was trimmed to n_limit values, then the nan bucket.
+        """
+        self._categories = {}
+        self._output_names = {}
+        for column_name, values in self._mapping.items():
+            categories = [x for x in values if x not in ('other_', 'nan')]
+            buckets = [x for x in values if x == 'other_'] + ['nan']
+            self._categories[column_name] = pd.CategoricalDtype(categories)
+            self._output_names[column_name] = ['{}_{}'.format(column_name, x) for x in categories + buckets]
+
+    def _encode(self, data_encode: pd.DataFrame) -> pd.DataFrame:
+        """
+        One-hot encode the columns of data_encode: the integer codes of the fitted categories are scattered into a
+        single preallocated indicator array, or a sparse matrix. Values not seen in fit go to the other_ column (or to
+        no column if there is no other_ bucket), missing and empty values to the nan column.
+        """
+        rows = []
+        columns = []
+        offset = 0
+        for column_name in self._cat_columns:
+            feature = data_encode[column_name]
+            width = len(self._output_names[column_name])
+            codes = pd.Categorical(feature, dtype=self._categories[column_name]).codes.astype(np.int64)
+            # empty strings and other false values are treated as missing, as in fit
+            missing = (feature.isnull() | ~feature.astype(bool)).values
+            codes[(codes < 0) & ~missing] = width - 2 if 'other_' in self._mapping[column_name] else -1
+            codes[missing] = width - 1
+            keep = np.flatnonzero(codes >= 0)
+            rows.append(keep)
+            columns.append(offset + codes[keep])
+            offset += width
+        names = [name for column_name in self._cat_columns for name in self._output_names[column_name]]
+        return HelperFunction.indicator_frame(np.concatenate(rows), np.concatenate(columns), names, data_encode.index,
+                                              sparse=self.hyperparams['output_type'] == 'sparse')
+
     def produce(self, *, inputs: Input, timeout: float = None, iterations: int = None) -> CallResult[Output]:
         """
         Convert and output the input data into encoded format,
@@ -196,27 +245,7 @@ class Encoder(UnsupervisedLearnerPrimitiveBase[Input, Output, EncParams, EncHype
         _logger.debug('Encoding columns: {}'.format(self._cat_columns))
 
         data_encode = self._input_data_copy[list(self._mapping.keys())]
-
-        # Get rid of false SettingWithCopyWarning
-        data_encode.is_copy = None
-        res = []
-        for column_name in self._cat_columns:
-            feature = data_encode[column_name].copy()
-            other_ = lambda x: 'Other' if (x and x not in self._mapping[column_name]) else x
-            nan_ = lambda x: x if x else np.nan
-            feature.loc[feature.notnull()] = feature[feature.notnull()].apply(other_)
-            feature = feature.apply(nan_)
-            if 'nan' not in self._mapping[column_name]:
-                self._mapping[column_name].append('nan')
-            new_column_names = ['{}_{}'.format(column_name, i) for i in self._mapping[column_name]]
-            encoded = pd.get_dummies(feature, dummy_na=True, prefix=column_name)
-            missed = [name for name in new_column_names if name not in list(encoded.columns)]
-            for m in missed:
-                # print('missing', m)
-                encoded[m] = 0
-            encoded = encoded[new_column_names]
-            res.append(encoded)
-            # data_encode.loc[:,column_name] = feature
+        encoded = self._encode(data_encode)
 
         # Drop columns that will be encoded
         # data_rest = self._input_data_copy.drop(self._mapping.keys(), axis=1)
@@ -238,15 +267,16 @@ class Encoder(UnsupervisedLearnerPrimitiveBase[Input, Output, EncParams, EncHype
         # encode data
         # encoded = container.DataFrame(pd.get_dummies(data_encode, dummy_na=True, prefix=self._cat_columns, prefix_sep='_',
         #                                        columns=self._cat_columns))
-        encoded_df = container.DataFrame(pd.concat(res, axis=1))
+        encoded_df = container.DataFrame(encoded)
 
         # update metadata for existing columns
+        batch = MetadataBatch(encoded_df.metadata)
         for index in range(len(encoded_df.columns)):
-            old_metadata = dict(encoded_df.metadata.query((mbase.ALL_ELEMENTS, index)))
-            old_metadata["structural_type"] = int
-            old_metadata["semantic_types"] = (
-                'http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/Attribute')
-            encoded_df.metadata = encoded_df.metadata.update((mbase.ALL_ELEMENTS, index), old_metadata)
+            batch.update_column(index, {
+                "structural_type": HelperFunction.indicator_structural_type(encoded_df.dtypes.iloc[index]),
+                "semantic_types": ('http://schema.org/Integer',
+                                   'https://metadata.datadrivendiscovery.org/types/Attribute')})
+        encoded_df.metadata = batch.apply()
         # update dimensional information
         encoded_df.metadata = encoded_df.metadata.update((), self._input_data_copy.metadata.query(()))
         columns_query = dict(self._input_data_copy.metadata.query((mbase.ALL_ELEMENTS,)))
@@ -274,6 +304,7 @@ class Encoder(UnsupervisedLearnerPrimitiveBase[Input, Output, EncParams, EncHype
         self._mapping = params['mapping']
         self._cat_columns = params['cat_columns']
         self._empty_columns = params['empty_columns']
+        self._set_categories()
 
     @classmethod
     def _get_columns_to_fit(cls, inputs: Input, hyperparams: EncHyperparameter):
@@ -2,6 +2,10 @@ import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 from . import missing_value_pred as mvp
 import logging
+import math
+import multiprocessing
+import sys
+import time
 
 from d3m.primitive_interfaces.supervised_learning import SupervisedLearnerPrimitiveBase
 from d3m.primitive_interfaces.base import CallResult
@@ -15,6 +19,7 @@ import d3m.metadata.base as mbase
 import common_primitives.utils as utils
 from d3m.base import utils as common_utils
 
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 
 Input = container.DataFrame
@@ -22,6 +27,106 @@ Output = container.DataFrame
 _logger = logging.getLogger(__name__)
 # store the best imputation strategy for each missing-value column in training data
 
+# smallest sample the successive halving evaluates the strategies on
+HALVING_MIN_SAMPLES = 100
+# share of the fit timeout the search may use, the rest leaves the evaluation running at the deadline time to finish
+# before the hard stop
+SEARCH_DEADLINE_FRACTION = 0.8
+
+
+class _SearchState(typing.NamedTuple):
+    """
+    What the evaluation of a candidate needs. The imputer is the process' own working copy of the data, the rest is
+    shared read-only. The evaluation samples are prefixes of sample_order.
+    """
+    imputer: mvp.IncrementalImputer
+    label: np.ndarray
+    model: typing.Any
+    scorer: typing.Any
+    verbose: bool
+    sample_order: np.ndarray
+    evaluation_method: str
+    n_folds: int
+
+
+# _SearchState of a worker process
+_worker_state = None
+
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def _evaluate_imputation(imputation_list, size, state=None):
+    """
+    Score of the model trained on the data imputed with imputation_list (one strategy per missing column), using
+    the first size rows of the evaluation sample.
+    """
+    state = state if state is not None else _worker_state
+    data_clean = state.imputer.impute(imputation_list)
+    label = state.label
+    if size < data_clean.shape[0]:
+        rows = np.sort(state.sample_order[:size])
+        data_clean = data_clean[rows]
+        label = label[rows]
+    return _evaluation(data_clean, label, state.model, state.scorer, state.verbose, state.evaluation_method,
+                       state.n_folds)
+
+
+def _evaluation(data_clean, label, model, scorer, verbose=False, evaluation_method='holdout', n_folds=3):
+    """
+    using defined model and scorer to evaluation the cleaned dataset
+
+    Parameters:
+    ----------
+    data_clean: the clean dataset, missing values imputed already
+    label: the label for data_clean
+    evaluation_method: "holdout" for a 60/40 split, "kfold" for the mean score of a n_folds cross validation
+    """
+    if evaluation_method == 'kfold':
+        from sklearn.model_selection import KFold, StratifiedKFold  # type: ignore
+        try:
+            splits = list(StratifiedKFold(n_folds, shuffle=True, random_state=0).split(data_clean, label.ravel()))
+        except ValueError:
+            if verbose:
+                _logger.info("cannot stratified sample, try random sample: ")
+            splits = list(KFold(n_folds, shuffle=True, random_state=0).split(data_clean))
+        scores = [_split_score(data_clean[train], data_clean[test], label[train], label[test], model, scorer, verbose)
+                  for train, test in splits]
+        return float(np.mean(scores))
+
+    from sklearn.model_selection import train_test_split  # type: ignore
+    try:
+        X_train, X_test, y_train, y_test = train_test_split(data_clean, label, test_size=0.4, random_state=0, stratify=label)
+    except Exception:
+        if verbose:
+            _logger.info("cannot stratified sample, try random sample: ")
+        X_train, X_test, y_train, y_test = train_test_split(data_clean, label, test_size=0.4, random_state=42)
+    return _split_score(X_train, X_test, y_train, y_test, model, scorer, verbose)
+
+
+def _split_score(X_train, X_test, y_train, y_test, model, scorer, verbose=False):
+    # remove the nan rows
+    mask_train = np.isnan(X_train).any(axis=1)  # nan rows index
+    mask_test = np.isnan(X_test).any(axis=1)
+    num_removed_test = sum(mask_test)
+    X_train = X_train[~mask_train]
+    y_train = y_train[~mask_train]
+    X_test = X_test[~mask_test]
+    y_test = y_test[~mask_test]
+
+    model = model.fit(X_train, y_train.ravel())
+    score = scorer(model, X_test, y_test)  # refer to sklearn scorer: score will be * -1 with the real score value
+    if verbose:
+        _logger.info("score is: {}".format(score))
+
+    if verbose:
+        _logger.info("===========>> max score is: {}".format(score))
+    if (num_removed_test > 0):
+        _logger.info("BUT !!!!!!!!there are {} data (total test size: {})that cannot be predicted!!!!!!\n".format(num_removed_test, mask_test.shape[0]))
+    return score
+
 
 class Params(params.Params):
     greedy_strategy: typing.Dict
@@ -59,6 +164,33 @@ class GreedyHyperparameter(hyperparams.Hyperparams):
         semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
         description="Also include primary index columns if input data has them. Applicable only if \"return_result\" is set to \"new\".",
     )
+    n_jobs = hyperparams.UniformInt(
+        lower=1,
+        upper=sys.maxsize,
+        default=1,
+        description='Specify number of processes used to evaluate the imputation strategies of a column concurrently. Default is no multiprocessing.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    evaluation_sample_size = hyperparams.UniformInt(
+        lower=0,
+        upper=sys.maxsize,
+        default=0,
+        description='Number of rows, sampled at random, the imputation strategies are evaluated on. 0 uses all the rows.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    evaluation_method = hyperparams.Enumeration(
+        values=['holdout', 'kfold'],
+        default='holdout',
+        description='Score the imputation strategies on a 60/40 holdout split, or by k-fold cross validation.',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    n_folds = hyperparams.UniformInt(
+        lower=2,
+        upper=20,
+        default=3,
+        description='Number of folds of the k-fold evaluation.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    successive_halving = hyperparams.UniformBool(
+        default=False,
+        description='Evaluate the strategies of a column on samples of growing size, keeping the better half each time, so only the best strategy is evaluated on the whole evaluation sample.',
+        semantic_types=['http://schema.org/Boolean', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
 
 
 class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, GreedyHyperparameter]):
@@ -111,6 +243,13 @@ class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, Gre
         self._has_finished = True
         self._iterations_done = True
         self._verbose = hyperparams['verbose'] if hyperparams else False
+        self._n_jobs = min(hyperparams['n_jobs'], multiprocessing.cpu_count()) if hyperparams else 1
+        self._evaluation_sample_size = hyperparams['evaluation_sample_size'] if hyperparams else 0
+        self._evaluation_method = hyperparams['evaluation_method'] if hyperparams else 'holdout'
+        self._n_folds = hyperparams['n_folds'] if hyperparams else 3
+        self._successive_halving = hyperparams['successive_halving'] if hyperparams else False
+        self._deadline = None
+        self._timed_out = False
 
     def set_params(self, *, params: Params) -> None:
         self._is_fitted = "greedy_strategy" in params
@@ -156,6 +295,10 @@ class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, Gre
         if self._is_fitted:
             return CallResult(None, self._has_finished, self._iterations_done)
 
+        # the search stops at the deadline, ahead of the hard stop, and keeps the best strategies found so far
+        self._deadline = time.time() + SEARCH_DEADLINE_FRACTION * timeout if timeout is not None else None
+        self._timed_out = False
+        self._best_imputation = {}
         if (timeout is None):
             timeout = 2**31 - 1
 
@@ -178,13 +321,19 @@ class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, Gre
                 _logger.info("=========> Greedy searched imputation:")
             self._best_imputation = self.__imputationGreedySearch(data, label)
 
-        if to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
+        if to_ctx_mrg.state == to_ctx_mrg.EXECUTED and self._timed_out:
+            _logger.info("Timed Out, using the best imputation strategies found so far")
+            self._is_fitted = True
+            self._has_finished = False
+            self._iterations_done = False
+        elif to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
             self._is_fitted = True
             self._has_finished = True
             self._iterations_done = True
         elif to_ctx_mrg.state == to_ctx_mrg.TIMED_OUT:
-            _logger.info("Timed Out...")
-            self._is_fitted = False
+            # the columns the search did not get to are imputed with the mean
+            _logger.info("Timed Out, using the best imputation strategies found before the hard stop")
+            self._is_fitted = True
             self._has_finished = False
             self._iterations_done = False
         return CallResult(None, self._has_finished, self._iterations_done)
@@ -247,13 +396,14 @@ class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, Gre
             if d3mIndex is not None:
                 start_index = 1
                 value = container.DataFrame(pd.concat([pd.DataFrame(d3mIndex, columns=["d3mIndex"]), value], axis=1))
-                index_metadata_selector = (mbase.ALL_ELEMENTS, 0)
+            batch = MetadataBatch(value.metadata)
+            if d3mIndex is not None:
                 index_metadata = {'semantic_types': ('https://metadata.datadrivendiscovery.org/types/TabularColumn', 'https://metadata.datadrivendiscovery.org/types/PrimaryKey')}
-                value.metadata = value.metadata.update(metadata=index_metadata, selector=index_metadata_selector)
+                batch.update_column(0, index_metadata)
             for each_column in range(start_index, value.shape[1]):
-                metadata_selector = (mbase.ALL_ELEMENTS, each_column)
                 metadata_each_column = {'semantic_types': ('https://metadata.datadrivendiscovery.org/types/TabularColumn', 'https://metadata.datadrivendiscovery.org/types/Attribute')}
-                value.metadata = value.metadata.update(metadata=metadata_each_column, selector=metadata_selector)
+                batch.update_column(each_column, metadata_each_column)
+            value.metadata = batch.apply()
 
 
         elif to_ctx_mrg.state == to_ctx_mrg.TIMED_OUT:
@@ -349,41 +499,62 @@ class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, Gre
         best_combo = [0] * len(missing_col_id)  # init for best combo
 
         # greedy search for the best permutation
-        iteration = 1
-        while (iteration > 0):
-            for i in range(len(permutations)):
-                max_strategy_id = permutations[i]
-
-                for strategy in range(len(self._imputation_strategies)):
-                    permutations[i] = strategy
-                    imputation_list = [self._imputation_strategies[x] for x in permutations]
-
-                    data_clean = mvp.imputeData(data, missing_col_id, imputation_list, self._verbose)
-                    if self._verbose:
-                        _logger.info("for the missing value imputation combination: {} ".format(permutations))
-                    score = self.__evaluation(data_clean, label)
-                    if (score > max_score):
-                        max_score = score
-                        max_strategy_id = strategy
-                        best_combo = permutations
-                    min_score = min(score, min_score)
-
-                permutations[i] = max_strategy_id
-
-            iteration -= 1
+        # only the column under test changes from one candidate to the next, so it is imputed in place
+        state = _SearchState(mvp.IncrementalImputer(data, missing_col_id), label, self.model, self.scorer,
+                             self._verbose, np.random.RandomState(0).permutation(data.shape[0]),
+                             self._evaluation_method, self._n_folds)
+        sizes = self.__sample_sizes(len(self._imputation_strategies), data.shape[0])
+        processes = min(self._n_jobs, len(self._imputation_strategies))
+        pool = multiprocessing.Pool(processes, _init_worker, (state,)) if processes > 1 and missing_col_id else None
+        try:
+            iteration = 1
+            while (iteration > 0):
+                for i in range(len(permutations)):
+                    max_strategy_id = permutations[i]
+
+                    candidates = []
+                    for strategy in range(len(self._imputation_strategies)):
+                        permutations[i] = strategy
+                        candidates.append([self._imputation_strategies[x] for x in permutations])
+                        if self._verbose:
+                            _logger.info("for the missing value imputation combination: {} ".format(permutations))
+                    scores = self.__score_candidates(candidates, sizes, state, pool)
+
+                    for strategy, score in enumerate(scores):
+                        if (score > max_score):
+                            max_score = score
+                            max_strategy_id = strategy
+                            best_combo = permutations
+                        min_score = min(score, min_score)
+
+                    permutations[i] = max_strategy_id
+                    # kept as the search goes, in case the hard stop interrupts it
+                    self._best_imputation = self.__strategies(col_names, missing_col_id, permutations)
+                    if self._timed_out:
+                        break
+
+                iteration -= 1
+        finally:
+            if pool is not None:
+                pool.terminate()
 
         if self._verbose:
             _logger.info("max score is {}, min score is {}\n".format(max_score, min_score))
             _logger.info("and the best score is given by the imputation combination: ")
 
-        best_imputation = {}    # key: col_name; value: imputation strategy
-        for i in range(len(best_combo)):
-            best_imputation[col_names[missing_col_id[i]]] = self._imputation_strategies[best_combo[i]]
-            if self._verbose:
-                _logger.info(self._imputation_strategies[best_combo[i]] + " for the column {}".format(col_names[missing_col_id[i]]))
+        best_imputation = self.__strategies(col_names, missing_col_id, best_combo)
+        if self._verbose:
+            for col_name, strategy in best_imputation.items():
+                _logger.info(strategy + " for the column {}".format(col_name))
 
         return best_imputation
 
+    def __strategies(self, col_names, missing_col_id, combo):
+        """
+        key: col_name; value: imputation strategy, of the imputation combination combo
+        """
+        return {col_names[missing_col_id[i]]: self._imputation_strategies[combo[i]] for i in range(len(combo))}
+
     #============================================ helper  functions ============================================
     def __isCat_95in10(self, label):
         """
@@ -423,39 +594,61 @@ class GreedyImputation(SupervisedLearnerPrimitiveBase[Input, Output, Params, Gre
 
         return data_clean
 
-    def __evaluation(self, data_clean, label):
+    def __sample_sizes(self, num_candidates, num_rows):
+        """
+        Number of rows each successive halving round evaluates the remaining candidates on, ending with the whole
+        evaluation sample.
         """
-        using defined model and scorer to evaluation the cleaned dataset
+        full = min(self._evaluation_sample_size or num_rows, num_rows)
+        if not self._successive_halving or num_candidates < 2:
+            return [full]
+        rounds = int(math.ceil(math.log2(num_candidates)))
+        return [max(full >> (rounds - k), min(full, HALVING_MIN_SAMPLES)) for k in range(rounds + 1)]
 
-        Parameters:
-        ----------
-        data_clean: the clean dataset, missing values imputed already
-        label: the label for data_clean
+    def __score_candidates(self, candidates, sizes, state, pool=None):
         """
-        from sklearn.model_selection import train_test_split  # type: ignore
-        try:
-            X_train, X_test, y_train, y_test = train_test_split(data_clean, label, test_size=0.4, random_state=0, stratify=label)
-        except Exception:
+        Scores of the imputation strategy combinations on the whole evaluation sample. With several sample sizes,
+        only the better half of the candidates of a round is evaluated in the next one, and the candidates discarded
+        on the way score -inf.
+        """
+        scores = [-float("inf")] * len(candidates)
+        alive = list(range(len(candidates)))
+        for size in sizes[:-1]:
+            round_scores = self.__evaluate_candidates([candidates[j] for j in alive], size, state, pool)
+            if self._timed_out:
+                return scores
+            # ties keep the earlier strategy
+            ranking = sorted(range(len(alive)), key=lambda k: -round_scores[k])
+            alive = sorted(alive[k] for k in ranking[:(len(alive) + 1) // 2])
             if self._verbose:
-                _logger.info("cannot stratified sample, try random sample: ")
-            X_train, X_test, y_train, y_test = train_test_split(data_clean, label, test_size=0.4, random_state=42)
-
-        # remove the nan rows
-        mask_train = np.isnan(X_train).any(axis=1)  # nan rows index
-        mask_test = np.isnan(X_test).any(axis=1)
-        num_removed_test = sum(mask_test)
-        X_train = X_train[~mask_train]
-        y_train = y_train[~mask_train]
-        X_test = X_test[~mask_test]
-        y_test = y_test[~mask_test]
-
-        model = self.model.fit(X_train, y_train.ravel())
-        score = self.scorer(model, X_test, y_test)  # refer to sklearn scorer: score will be * -1 with the real score value
-        if self._verbose:
-            _logger.info("score is: {}".format(score))
+                _logger.info("{} rows: keeping the combinations {}".format(size, [candidates[j] for j in alive]))
+        for j, score in zip(alive, self.__evaluate_candidates([candidates[j] for j in alive], sizes[-1], state, pool)):
+            scores[j] = score
+        return scores
 
-        if self._verbose:
-            _logger.info("===========>> max score is: {}".format(score))
-        if (num_removed_test > 0):
-            _logger.info("BUT !!!!!!!!there are {} data (total test size: {})that cannot be predicted!!!!!!\n".format(num_removed_test, mask_test.shape[0]))
-        return score
+    def __evaluate_candidates(self, candidates, size, state, pool=None):
+        """
+        Scores of the imputation strategy combinations on the first size rows of the evaluation sample, evaluated
+        concurrently on pool if given. When the fit deadline passes, the scores of the combinations not evaluated by
+        then are -inf and the search is marked as timed out.
+        """
+        if pool is not None:
+            results = [pool.apply_async(_evaluate_imputation, (imputation_list, size)) for imputation_list in candidates]
+            scores = []
+            for result in results:
+                remaining = None if self._deadline is None else max(self._deadline - time.time(), 0)
+                try:
+                    # past the deadline, the evaluations already finished are kept
+                    scores.append(result.get(0 if self._timed_out else remaining))
+                except multiprocessing.TimeoutError:
+                    self._timed_out = True
+                    scores.append(-float("inf"))
+            return scores
+        scores = []
+        for imputation_list in candidates:
+            if self._deadline is not None and time.time() > self._deadline:
+                self._timed_out = True
+                scores.append(-float("inf"))
+            else:
+                scores.append(_evaluate_imputation(imputation_list, size, state))
+        return scores
@@ -1,4 +1,6 @@
 import logging
+import multiprocessing
+import sys
 import typing
 
 import numpy as np  # type: ignore
@@ -20,6 +22,54 @@ Input = container.DataFrame
 Output = container.DataFrame
 _logger = logging.getLogger(__name__)
 
+# weight of the new imputation in a parallel (Jacobi) iteration, undamped Jacobi updates oscillate when columns are
+# strongly correlated
+JACOBI_RELAXATION = 0.5
+
+# imputed data the column models of a worker process are fitted on
+_worker_data = None
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _fit_column(target_col, missing_rows, verbose=False, data=None):
+    """
+    Fit the model of target_col on data, with the cells in missing_rows unknown; return the model and the imputed
+    column. data is left as it was, so the models of all the columns can be fitted on the same imputation.
+    """
+    data = data if data is not None else _worker_data
+    column = data[:, target_col].copy()
+    data[missing_rows, target_col] = np.nan
+    try:
+        data, model = mvp.bayeImpute(data, target_col, verbose)
+        return model, data[:, target_col].copy()
+    finally:
+        data[:, target_col] = column
+
+
+def _predict_column(data, target_col, missing_rows, model, verbose=False):
+    """
+    The column target_col imputed by model, data is left as it was.
+    """
+    column = data[:, target_col].copy()
+    data[missing_rows, target_col] = np.nan
+    try:
+        return mvp.transform(data, target_col, model, verbose)[:, target_col].copy()
+    finally:
+        data[:, target_col] = column
+
+
+def _converged(imputed, last_imputed, tolerance):
+    """
+    Whether the squared change of the imputed values in the last iteration is within tolerance of their squared norm.
+    """
+    distance = np.square(imputed - last_imputed).sum()
+    _logger.debug('changed distance: %s', distance)
+    return distance <= tolerance * np.square(imputed).sum()
+
 # store the regression models for each missing-value column in training data
 
 
@@ -64,6 +114,38 @@ class IterativeRegressionHyperparameter(hyperparams.Hyperparams):
         semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
         description="Also include primary index columns if input data has them. Applicable only if \"return_result\" is set to \"new\".",
     )
+    regression_engine = hyperparams.Enumeration(
+        values=['bayesian_ridge', 'gram'],
+        default='bayesian_ridge',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="How to fit the column models. 'bayesian_ridge' fits a BayesianRidge on all the rows for each column in every iteration. 'gram' fits ridge regressions from X^T X and X^T y matrices that are updated as the imputed cells change, which is much faster on long tables.",
+    )
+    ridge_alpha = hyperparams.Bounded[float](
+        lower=0,
+        upper=None,
+        default=1.0,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/TuningParameter'],
+        description="Ridge penalty of the column models, used by the 'gram' regression_engine.",
+    )
+    update_order = hyperparams.Enumeration(
+        values=['sequential', 'parallel'],
+        default='sequential',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="'sequential' re-imputes each column before fitting the model of the next one (Gauss-Seidel). 'parallel' fits the models of all the columns on the imputation of the previous iteration (Jacobi), concurrently on n_jobs processes.",
+    )
+    n_jobs = hyperparams.UniformInt(
+        lower=1,
+        upper=sys.maxsize,
+        default=1,
+        description='Specify number of processes used to fit the column models when update_order is parallel. Default is no multiprocessing.',
+        semantic_types=['http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    convergence_tolerance = hyperparams.Bounded[float](
+        lower=0,
+        upper=None,
+        default=1e-3,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Stop iterating once the squared change of the imputed values in an iteration is at most this fraction of their squared norm. 0 always runs all the iterations.",
+    )
 
 
 class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, IR_Params, IterativeRegressionHyperparameter]):
@@ -114,6 +196,11 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
         self._has_finished = True
         self._iterations_done = True
         self._verbose = hyperparams['verbose'] if hyperparams else False
+        self._regression_engine = hyperparams['regression_engine'] if hyperparams else 'bayesian_ridge'
+        self._ridge_alpha = hyperparams['ridge_alpha'] if hyperparams else 1.0
+        self._update_order = hyperparams['update_order'] if hyperparams else 'sequential'
+        self._n_jobs = min(hyperparams['n_jobs'], multiprocessing.cpu_count()) if hyperparams else 1
+        self._tolerance = hyperparams['convergence_tolerance'] if hyperparams else 1e-3
 
     def set_params(self, *, params: IR_Params) -> None:
         self._is_fitted = params['fitted']
@@ -305,15 +392,14 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
         missing_col_id = []
         numeric_data = data.apply(lambda col: pd.to_numeric(col, errors='coerce'))
         data = mvp.df2np(numeric_data, missing_col_id, self._verbose)
+        statistics = mvp.ColumnStatistics(data)
 
         # Impute numerical attributes only
         missing_col_data = data[:, missing_col_id]
 
         # If all values in a column are missing, set that column to zero
-        all_missing = np.sum(np.isnan(missing_col_data), axis=0) == missing_col_data.shape[0]
-        for col, col_missing in enumerate(all_missing):
-            if col_missing:
-                missing_col_data[:, col] = 0
+        all_missing = statistics.missing_count[missing_col_id] == data.shape[0]
+        missing_col_data[:, all_missing] = 0
 
         imputed_data = np.zeros([data.shape[0], len(missing_col_id)])
         imputed_data_lastIter = missing_col_data
@@ -323,25 +409,50 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
         counter = 0
         # mean init all missing-value columns
         init_imputation = ["mean"] * len(missing_col_id)
-        next_data = mvp.imputeData(data, missing_col_id, init_imputation, self._verbose)
+        next_data = mvp.imputeData(data, missing_col_id, init_imputation, self._verbose, statistics)
+        engine = None
+        if self._regression_engine == 'gram':
+            missing = np.zeros(data.shape, dtype=bool)
+            missing[:, missing_col_id] = np.isnan(missing_col_data)
+            engine = mvp.GramRegression(next_data, missing_col_id, missing, self._ridge_alpha)
+
+        missing_rows = [np.flatnonzero(np.isnan(missing_col_data[:, i])) for i in range(len(missing_col_id))]
 
         while (counter < epoch):
-            for i in range(len(missing_col_id)):
-                target_col = missing_col_id[i]
-                next_data[:, target_col] = missing_col_data[:, i]  # recover the column that to be imputed
+            if self._update_order == 'parallel':
+                # Jacobi: the models of all the columns are fitted on the imputation of the previous iteration
+                if engine is not None:
+                    model_list = engine.regress_all(missing_col_id, JACOBI_RELAXATION)
+                    imputed_data[:] = engine.data[:, missing_col_id]
+                else:
+                    results = self.__fit_columns(next_data, missing_col_id, missing_rows)
+                    for i, (model, column) in enumerate(results):
+                        model_list[i] = model
+                        imputed_data[:, i] = column
+                    imputed_data = (JACOBI_RELAXATION * imputed_data
+                                    + (1 - JACOBI_RELAXATION) * next_data[:, missing_col_id])
+                    next_data[:, missing_col_id] = imputed_data
+            else:
+                for i in range(len(missing_col_id)):
+                    target_col = missing_col_id[i]
+                    if engine is not None:
+                        model_list[i] = engine.regress(target_col)
+                        imputed_data[:, i] = engine.data[:, target_col]
+                        continue
+                    next_data[:, target_col] = missing_col_data[:, i]  # recover the column that to be imputed
 
-                data_clean, model_list[i] = mvp.bayeImpute(next_data, target_col, self._verbose)
-                next_data[:, target_col] = data_clean[:, target_col]    # update bayesian imputed column
-                imputed_data[:, i] = data_clean[:, target_col]    # add the imputed data
+                    next_data, model_list[i] = mvp.bayeImpute(next_data, target_col, self._verbose)  # imputes in place
+                    imputed_data[:, i] = next_data[:, target_col]    # add the imputed data
 
-                # if (is_eval):
-                #     self.__evaluation(data_clean, label)
+                    # if (is_eval):
+                    #     self.__evaluation(data_clean, label)
 
-            # if (counter > 0):
-            #     distance = np.square(imputed_data - imputed_data_lastIter).sum()
-            #     if self._verbose: print("changed distance: {}".format(distance))
+            converged = counter > 0 and _converged(imputed_data, imputed_data_lastIter, self._tolerance)
             imputed_data_lastIter = np.copy(imputed_data)
             counter += 1
+            if converged:
+                _logger.info('Iterative regression converged after %d iterations', counter)
+                break
         data[:, missing_col_id] = imputed_data_lastIter
         # convert model_list to dict
         model_dict = {}
@@ -350,6 +461,22 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
 
         return data, model_dict
 
+    def __fit_columns(self, data, missing_col_id, missing_rows):
+        """
+        Fit the models of all the missing columns on data, concurrently when n_jobs > 1; return the model and the
+        imputed column of each.
+        """
+        tasks = [(target_col, rows, self._verbose) for target_col, rows in zip(missing_col_id, missing_rows)]
+        processes = min(self._n_jobs, len(tasks))
+        if processes <= 1:
+            return [_fit_column(*task, data=data) for task in tasks]
+        with multiprocessing.Pool(processes, _init_worker, (data,)) as pool:
+            result = pool.starmap_async(_fit_column, tasks)
+            # wait in short steps, so that the timeout of fit can interrupt
+            while not result.ready():
+                result.wait(1)
+            return result.get()
+
     def __regressImpute(self, data, model_dict, iterations):
         """
         """
@@ -357,6 +484,7 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
         # 1. convert to np array and get missing value column id
         missing_col_id = []
         data = mvp.df2np(data, missing_col_id, self._verbose)
+        statistics = mvp.ColumnStatistics(data)
 
         model_list = []  # the model list
         new_missing_col_id = []  # the columns that have correspoding model
@@ -367,7 +495,7 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
             name = col_names[missing_col_id[i]]
             # if there is a column that not appears in trained model, impute it as "mean"
             if (name not in model_dict.keys()):
-                data = mvp.imputeData(data, [missing_col_id[i]], ["mean"], self._verbose)
+                data = mvp.imputeData(data, [missing_col_id[i]], ["mean"], self._verbose, statistics)
                 # mask[missing_col_id[i]] = False
                 _logger.info("fill" + name + "with mean")
                 # offset += 1
@@ -382,16 +510,31 @@ class IterativeRegressionImputation(UnsupervisedLearnerPrimitiveBase[Input, Outp
         counter = 0
         # mean init all missing-value columns
         init_imputation = ["mean"] * len(new_missing_col_id)
-        next_data = mvp.imputeData(to_impute_data, new_missing_col_id, init_imputation, self._verbose)
+        next_data = mvp.imputeData(to_impute_data, new_missing_col_id, init_imputation, self._verbose, statistics)
+
+        missing_rows = [np.flatnonzero(pd.isnull(missing_col_data[:, i])) for i in range(len(new_missing_col_id))]
+        imputed_data = next_data[:, new_missing_col_id]
 
         while (counter < epoch):
-            for i in range(len(new_missing_col_id)):
-                target_col = new_missing_col_id[i]
-                next_data[:, target_col] = missing_col_data[:, i]  # recover the column that to be imputed
+            if self._update_order == 'parallel':
+                # Jacobi: every column is predicted from the imputation of the previous iteration
+                columns = [_predict_column(next_data, target_col, rows, model, self._verbose)
+                           for target_col, rows, model in zip(new_missing_col_id, missing_rows, model_list)]
+                for target_col, column in zip(new_missing_col_id, columns):
+                    next_data[:, target_col] = (JACOBI_RELAXATION * column
+                                                + (1 - JACOBI_RELAXATION) * next_data[:, target_col])
+            else:
+                for i in range(len(new_missing_col_id)):
+                    target_col = new_missing_col_id[i]
+                    next_data[:, target_col] = missing_col_data[:, i]  # recover the column that to be imputed
 
-                next_data = mvp.transform(next_data, target_col, model_list[i], self._verbose)
+                    next_data = mvp.transform(next_data, target_col, model_list[i], self._verbose)
 
+            last_imputed, imputed_data = imputed_data, next_data[:, new_missing_col_id]
             counter += 1
+            if _converged(imputed_data, last_imputed, self._tolerance):
+                _logger.info('Iterative regression converged after %d iterations', counter)
+                break
 
         # put back to data
         # data[:, mask] = next_data
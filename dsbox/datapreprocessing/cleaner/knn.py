@@ -1,21 +1,31 @@
-import numpy as np #  type: ignore
+import logging
+import sys
+import typing
+
 import pandas as pd  #  type: ignore
-from fancyimpute import KNN as knn  #  type: ignore
 
 from . import missing_value_pred as mvp
-from d3m.primitive_interfaces.transformer import TransformerPrimitiveBase
+from d3m.primitive_interfaces.unsupervised_learning import UnsupervisedLearnerPrimitiveBase
 from d3m.primitive_interfaces.base import CallResult
 import stopit #  type: ignore
-import math
 
 from d3m import container
-from d3m.metadata import hyperparams
+from d3m.metadata import hyperparams, params
+from d3m.metadata.base import DataMetadata
 from d3m.metadata.hyperparams import UniformInt, UniformBool, Hyperparams
 
 from . import config
 
 Input = container.DataFrame
 Output = container.DataFrame
+_logger = logging.getLogger(__name__)
+
+
+class KnnParams(params.Params):
+    imputer: typing.Union[typing.Any, None]
+    numeric_column_indices: typing.Union[typing.Any, None]
+    fitted: typing.Union[typing.Any, None]
+
 
 class KnnHyperparameter(Hyperparams):
     # A reasonable upper bound would the size of the input. For now using 100.
@@ -23,19 +33,26 @@ class KnnHyperparameter(Hyperparams):
                    description='Number of neighbors',
                    semantic_types=['http://schema.org/Integer',
                                    'https://metadata.datadrivendiscovery.org/types/TuningParameter'])
+    chunk_size = UniformInt(lower=1, upper=sys.maxsize, default=1000,
+                            description='Number of rows compared with as many training rows at a time. Memory grows '
+                                        'with its square, not with the number of rows.',
+                            semantic_types=['http://schema.org/Integer',
+                                            'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
     verbose = UniformBool(default=False,
                           semantic_types=['http://schema.org/Boolean',
                                           'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
 
-class KNNImputation(TransformerPrimitiveBase[Input, Output, KnnHyperparameter]):
+class KNNImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, KnnParams, KnnHyperparameter]):
     """
     Impute the missing value using k nearest neighbors (weighted average).
-    This class is a wrapper from fancyimpute-knn
+    The neighbors are the complete rows of the training data, compared over the numerical attributes the row has.
 
     Parameters:
     ----------
     k: the number of nearest neighbors
 
+    chunk_size: the number of rows compared at a time, bounds the memory
+
     verbose: bool
         Control the verbosity
 
@@ -77,71 +94,124 @@ class KNNImputation(TransformerPrimitiveBase[Input, Output, KnnHyperparameter]):
 
         # All other attributes must be private with leading underscore
         self._train_x = None
+        self._imputer = None
+        self._numeric_column_indices: typing.List = []
+        self._is_fitted = False
         self._has_finished = False
         self._iterations_done = False
         self._verbose = hyperparams['verbose'] if hyperparams else False
         self._k = hyperparams['k'] if hyperparams else 5
+        self._chunk_size = hyperparams['chunk_size'] if hyperparams else 1000
+
+    def set_params(self, *, params: KnnParams) -> None:
+        self._is_fitted = params['fitted']
+        self._has_finished = self._is_fitted
+        self._iterations_done = self._is_fitted
+        self._imputer = params['imputer']
+        self._numeric_column_indices = params['numeric_column_indices']
+
+    def get_params(self) -> KnnParams:
+        return KnnParams(
+            imputer=self._imputer,
+            numeric_column_indices=self._numeric_column_indices,
+            fitted=self._is_fitted)
+
+    def set_training_data(self, *, inputs: Input) -> None:
+        """
+        Sets training data of this primitive.
+
+        Parameters
+        ----------
+        inputs : Input
+            The inputs.
+        """
+        self._train_x = inputs
+        self._is_fitted = False
+
+    def fit(self, *, timeout: float = None, iterations: int = None) -> CallResult[None]:
+        """
+        keep the complete rows of the numerical attributes of the training data, the neighbors to impute from
+
+        Parameters:
+        ----------
+        data: pandas dataframe
+        """
+
+        # if already fitted on current dataset, do nothing
+        if self._is_fitted:
+            return CallResult(None, self._has_finished, self._iterations_done)
+
+        if (timeout is None):
+            timeout = 2**31-1
+
+        # setup the timeout
+        with stopit.ThreadingTimeout(timeout) as to_ctx_mrg:
+            assert to_ctx_mrg.state == to_ctx_mrg.EXECUTING
+
+            attribute = DataMetadata.list_columns_with_semantic_types(
+                self._train_x.metadata, ['https://metadata.datadrivendiscovery.org/types/Attribute'])
+            numeric = DataMetadata.list_columns_with_semantic_types(
+                self._train_x.metadata, ['http://schema.org/Integer', 'http://schema.org/Float'])
+            numeric = [x for x in numeric if x in attribute]
+            numeric_data = self._train_x.iloc[:, numeric].apply(lambda col: pd.to_numeric(col, errors='coerce'))
 
+            imputer = mvp.KNNImputer(numeric_data.values, self._k, self._chunk_size)
+            if self._verbose: print("=========> knn imputation from {} complete rows".format(imputer.reference.shape[0]))
+
+        if to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
+            self._imputer = imputer
+            self._numeric_column_indices = numeric
+            self._is_fitted = True
+            self._has_finished = True
+            self._iterations_done = True
+        else:
+            self._is_fitted = False
+            self._has_finished = False
+            self._iterations_done = False
+        return CallResult(None, self._has_finished, self._iterations_done)
 
     def produce(self, *, inputs: Input, timeout: float = None, iterations: int = None) -> CallResult[Output]:
         """
         precond: run fit() before
 
-        to complete the data, based on the learned parameters, support:
-        -> greedy search
-
-        also support the untrainable methods:
-        -> iteratively regression
-        -> other
+        impute the missing values of the numerical attributes from the nearest complete training rows
 
         Parameters:
         ----------
         data: pandas dataframe
-        label: pandas series, used for the evaluation of imputation
-
-        TODO:
-        ----------
-        1. add evaluation part for __simpleImpute()
-
         """
 
+        if (not self._is_fitted):
+            # todo: specify a NotFittedError, like in sklearn
+            raise ValueError("Calling produce before fitting.")
+
         if (timeout is None):
             timeout = 2**31-1
 
-        if isinstance(inputs, pd.DataFrame):
-            data = inputs.copy()
-        else:
-            data = inputs[0].copy()
-        # record keys:
-        keys = data.keys()
-        index = data.index
+        numeric_data = inputs.iloc[:, self._numeric_column_indices].apply(
+            lambda col: pd.to_numeric(col, errors='coerce'))
+
+        if (pd.isnull(numeric_data).values.sum() == 0):    # no missing value exists
+            if self._verbose: print("Warning: no missing value in test dataset")
+            self._has_finished = True
+            return CallResult(inputs, self._has_finished, self._iterations_done)
 
         # setup the timeout
         with stopit.ThreadingTimeout(timeout) as to_ctx_mrg:
             assert to_ctx_mrg.state == to_ctx_mrg.EXECUTING
 
             # start completing data...
-            if self._verbose: print("=========> impute by fancyimpute-knn:")
-            data_clean = self.__knn(data)
+            if self._verbose: print("=========> impute by knn:")
+            data_clean = self._imputer.impute(numeric_data.values)
 
         result = None
         if to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
             self._has_finished = True
             self._iterations_done = True
-            result = pd.DataFrame(data_clean, index, keys)
+            result = inputs.copy()
+            result.iloc[:, self._numeric_column_indices] = data_clean
         elif to_ctx_mrg.state == to_ctx_mrg.TIMED_OUT:
+            _logger.info("Timed Out...")
             self._has_finished = False
             self._iterations_done = False
         return CallResult(result, self._has_finished, self._iterations_done)
-
-
-    #============================================ core function ============================================
-    def __knn(self, test_data):
-        """
-        wrap fancyimpute-knn
-        """
-        missing_col_id = []
-        test_data = mvp.df2np(test_data, missing_col_id, self._verbose)
-        if (len(missing_col_id) == 0): return test_data
-        complete_data = knn(k=self._k, verbose=(1 if self._verbose else 0)).complete(test_data)
-        return complete_data
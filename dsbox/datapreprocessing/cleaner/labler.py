@@ -11,6 +11,7 @@ from d3m.metadata import hyperparams, params
 from d3m.primitive_interfaces.base import CallResult
 
 
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 
 __all__ = ('Labler',)
@@ -147,11 +148,10 @@ class Labler(UnsupervisedLearnerPrimitiveBase[Inputs, Outputs, Params, LablerHyp
                     'https://metadata.datadrivendiscovery.org/types/Attribute')
         }
 
+        batch = MetadataBatch(outputs.metadata)
         for index in self._s_cols:
-            old_metadata = dict(outputs.metadata.query((mbase.ALL_ELEMENTS, index)))
-            old_metadata["semantic_types"] = lookup["int"]
-            old_metadata["structural_type"] = type(10)
-            outputs.metadata = outputs.metadata.update((mbase.ALL_ELEMENTS, index), old_metadata)
+            batch.update_column(index, {"semantic_types": lookup["int"], "structural_type": type(10)})
+        outputs.metadata = batch.apply()
 
         self._has_finished = True
         return CallResult(outputs, self._has_finished)
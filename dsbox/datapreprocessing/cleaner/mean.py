@@ -1,6 +1,8 @@
+import collections
 import logging
 import typing
 
+import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 
 from d3m.primitive_interfaces.unsupervised_learning import UnsupervisedLearnerPrimitiveBase
@@ -14,7 +16,9 @@ from d3m.metadata.hyperparams import UniformBool
 from d3m.metadata.base import DataMetadata
 import d3m.metadata.base as mbase
 
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
+from . import missing_value_pred as mvp
 
 import d3m.base.utils as base_utils
 
@@ -23,6 +27,33 @@ Output = container.DataFrame
 
 _logger = logging.getLogger(__name__)
 
+# produce caches the column layout of this many schemas, and the output metadata of as many schema and batch sizes
+PRODUCE_CACHE_SIZE = 128
+
+
+class _Layout(typing.NamedTuple):
+    """
+    What produce does to a schema: the numeric columns to convert to numbers, and the positions and fill values of the
+    attributes, apart from the text ones where empty strings are missing values too.
+    """
+    convert: typing.List[int]
+    numbers: typing.List[typing.Tuple[int, typing.Any]]
+    texts: typing.List[typing.Tuple[int, typing.Any]]
+
+
+def _cached(cache, key, compute):
+    """
+    Least recently used cache lookup, compute() on a miss.
+    """
+    value = cache.get(key)
+    if value is None:
+        value = cache[key] = compute()
+        if len(cache) > PRODUCE_CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return value
+
 
 # store the mean value for each column in training data
 class Params(params.Params):
@@ -111,6 +142,10 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
         self._numeric_columns: typing.List = []
         self._categoric_columns: typing.List = []
         self._verbose = hyperparams['verbose'] if hyperparams else False
+        self._layout_cache: typing.Dict = collections.OrderedDict()
+        self._metadata_cache: typing.Dict = collections.OrderedDict()
+        # id of an input metadata -> the metadata, kept so that the id is not reused, and its cache key
+        self._metadata_keys: typing.Dict = collections.OrderedDict()
 
     def set_params(self, *, params: Params) -> None:
         self._is_fitted = params['fitted']
@@ -119,6 +154,9 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
         self.mean_values = params['mean_values']
         self._numeric_columns = params['type_columns']['numeric_columns']
         self._categoric_columns = params['type_columns']['categoric_columns']
+        self._layout_cache.clear()
+        self._metadata_cache.clear()
+        self._metadata_keys.clear()
 
     def get_params(self) -> Params:
         return Params(
@@ -191,6 +229,9 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
             self._is_fitted = False
             self._iterations_done = False
             self._has_finished = False
+        self._layout_cache.clear()
+        self._metadata_cache.clear()
+        self._metadata_keys.clear()
 
         _logger.debug('Fit is_fitted %s', str(self._is_fitted))
         return CallResult(None, self._has_finished, self._iterations_done)
@@ -213,58 +254,26 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
         #     self._has_finished = True
         #     return CallResult(inputs, self._has_finished, self._iterations_done)
 
-        if (timeout is None):
-            timeout = 2 ** 31 - 1
-
         if isinstance(inputs, pd.DataFrame):
-            data = inputs.copy()
+            data = inputs
         else:
-            data = inputs[0].copy()
+            data = inputs[0]
+
+        if self._verbose:
+            print("=========> impute by mean value of the attribute:")
+
+        if timeout is None:
+            # no timer thread, produce is often called on a handful of rows
+            self._has_finished = True
+            self._iterations_done = True
+            return CallResult(self.__impute(data), self._has_finished, self._iterations_done)
 
         # setup the timeout
         with stopit.ThreadingTimeout(timeout) as to_ctx_mrg:
             assert to_ctx_mrg.state == to_ctx_mrg.EXECUTING
 
             # start completing data...
-            if self._verbose:
-                print("=========> impute by mean value of the attribute:")
-
-            data.iloc[:, self._numeric_columns] = data.iloc[:, self._numeric_columns].apply(
-                lambda col: pd.to_numeric(col, errors='coerce'))
-
-            # assume the features of testing data are same with the training data
-            # therefore, only use the mean_values to impute, should get a clean dataset
-            attribute = DataMetadata.list_columns_with_semantic_types(
-                data.metadata, ['https://metadata.datadrivendiscovery.org/types/Attribute'])
-
-            # try:
-            for col in attribute:
-                if str(inputs.dtypes[inputs.columns[col]]) != "object":
-                    if data.iloc[:, col].isnull().sum() != 0:
-                        data.iloc[:, col].fillna(self.mean_values[data.columns[col]], inplace=True)
-                else:
-                    for i in range(data.shape[0]):
-                        if data.iloc[i, col] == "" or pd.isnull(data.iloc[i, col]):
-                            data.iloc[i, col] = self.mean_values[data.columns[col]]
-            # except:
-            #     import pdb
-            #     pdb.set_trace()
-            data_clean = data
-
-            # Update metadata
-            for col in self._numeric_columns:
-                old_metadata = dict(data_clean.metadata.query((mbase.ALL_ELEMENTS, col)))
-                dtype = data_clean.iloc[:, col].dtype
-                if str(dtype).lower().startswith("int"):
-                    if "http://schema.org/Integer" not in old_metadata['semantic_types']:
-                        old_metadata['semantic_types'] += ("http://schema.org/Integer",)
-                    old_metadata["structural_type"] = type(10)
-                elif str(dtype).lower().startswith("float"):
-                    if "http://schema.org/Float" not in old_metadata['semantic_types']:
-                        old_metadata['semantic_types'] += ("http://schema.org/Float",)
-                    old_metadata["structural_type"] = type(10.2)
-
-                data_clean.metadata = data_clean.metadata.update((mbase.ALL_ELEMENTS, col), old_metadata)
+            data_clean = self.__impute(data)
 
         value = None
         if to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
@@ -277,6 +286,78 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
             self._iterations_done = False
         return CallResult(value, self._has_finished, self._iterations_done)
 
+    def __impute(self, data):
+        """
+        Return a copy of data where the missing values of the attributes are filled with the fitted values, and the
+        metadata of the numeric columns is updated.
+
+        The column layout and the output metadata are cached by column names, dtypes and input metadata, so that a
+        batch with a known schema only pays for one np.where on the columns that miss values.
+        """
+        table_metadata, columns_metadata = _cached(self._metadata_keys, id(data.metadata),
+                                                   lambda: (data.metadata,) + self.__metadata_key(data))[1:]
+        schema = (tuple(data.columns), tuple(data.dtypes), columns_metadata)
+        layout = _cached(self._layout_cache, schema, lambda: self.__layout(data))
+
+        columns = [column.values for _, column in data.items()]
+        for col in layout.convert:
+            columns[col] = pd.to_numeric(columns[col], errors='coerce')
+
+        # assume the features of testing data are same with the training data
+        # therefore, only use the mean_values to impute, should get a clean dataset
+        for col, value in layout.numbers:
+            missing = pd.isnull(columns[col])
+            if missing.any():
+                columns[col] = np.where(missing, value, columns[col])
+        for col, value in layout.texts:
+            missing = pd.isnull(columns[col]) | (columns[col] == "")
+            if missing.any():
+                columns[col] = np.where(missing, value, columns[col])
+
+        data_clean = container.DataFrame(dict(enumerate(columns)), index=data.index, generate_metadata=False)
+        data_clean.columns = data.columns
+        # the output dtypes follow from the input ones, only the table metadata, with the number of rows, is missing
+        # from the schema
+        data_clean.metadata = _cached(self._metadata_cache, (data.shape[0], table_metadata) + schema,
+                                      lambda: self.__output_metadata(data, data_clean))
+        return data_clean
+
+    @staticmethod
+    def __metadata_key(data):
+        """
+        The table metadata and the tuple of the metadata of every column, frozen and hashable.
+        """
+        return (data.metadata.query(()),
+                tuple(data.metadata.query((mbase.ALL_ELEMENTS, col)) for col in range(data.shape[1])))
+
+    def __layout(self, data):
+        attribute = DataMetadata.list_columns_with_semantic_types(
+            data.metadata, ['https://metadata.datadrivendiscovery.org/types/Attribute'])
+        convert = [col for col in self._numeric_columns if str(data.dtypes.iloc[col]) == "object"]
+        numbers = []
+        texts = []
+        for col in attribute:
+            name = data.columns[col]
+            if name not in self.mean_values:
+                continue
+            if str(data.dtypes.iloc[col]) == "object" and col not in convert:
+                texts.append((col, self.mean_values[name]))
+            else:
+                numbers.append((col, self.mean_values[name]))
+        return _Layout(convert, numbers, texts)
+
+    def __output_metadata(self, data, data_clean):
+        batch = MetadataBatch(data.metadata)
+        for col in self._numeric_columns:
+            dtype = data_clean.dtypes.iloc[col]
+            if str(dtype).lower().startswith("int"):
+                batch.add_semantic_types(col, "http://schema.org/Integer")
+                batch.update_column(col, {"structural_type": type(10)})
+            elif str(dtype).lower().startswith("float"):
+                batch.add_semantic_types(col, "http://schema.org/Float")
+                batch.update_column(col, {"structural_type": type(10.2)})
+        return batch.apply()
+
     @classmethod
     def _get_columns_to_fit(cls, inputs: Input, hyperparams: MeanHyperparameter):
         if not hyperparams['use_semantic_types']:
@@ -320,13 +401,11 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
 
         _logger.debug('numeric columns %s', str(self._numeric_columns))
 
-        # Convert selected columns to_numeric, then compute column mean, then convert to_dict
-        self.mean_values = self._train_x.iloc[:, self._numeric_columns].apply(
-            lambda col: pd.to_numeric(col, errors='coerce')).mean(axis=0).to_dict()
-
-        for name in self.mean_values.keys():
-            if pd.isnull(self.mean_values[name]):
-                self.mean_values[name] = 0.0
+        # Convert selected columns to_numeric, then compute the column means, columns without values get 0
+        numeric_data = self._train_x.iloc[:, self._numeric_columns].apply(
+            lambda col: pd.to_numeric(col, errors='coerce'))
+        means = mvp.ColumnStatistics(numeric_data.values).values('mean')
+        self.mean_values = dict(zip(numeric_data.columns, means.tolist()))
 
         # Mode for categorical columns
         self._categoric_columns = DataMetadata.list_columns_with_semantic_types(
@@ -336,17 +415,9 @@ class MeanImputation(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, Mea
 
         _logger.debug('categorical columns %s', str(self._categoric_columns))
 
-        mode_values = self._train_x.iloc[:, self._categoric_columns].mode(axis=0).iloc[0].to_dict()
-        for name in mode_values.keys():
-            if pd.isnull(mode_values[name]):
-                # mode is nan
-                rest = self._train_x[name].dropna()
-                if rest.shape[0] == 0:
-                    # every value is nan
-                    mode = 0
-                else:
-                    mode = rest.mode().iloc[0]
-                mode_values[name] = mode
+        categoric_data = self._train_x.iloc[:, self._categoric_columns]
+        modes = mvp.ColumnStatistics(categoric_data.values).values('popular')
+        mode_values = dict(zip(categoric_data.columns, modes.tolist()))
         self.mean_values.update(mode_values)
 
         if self._verbose:
@@ -1,30 +1,71 @@
-import pandas as pd
-from fancyimpute import mice
+import logging
+import time
+import typing
+
+import pandas as pd  # type: ignore
 
 from . import missing_value_pred as mvp
-from d3m.primitive_interfaces.transformer import TransformerPrimitiveBase
+from d3m.primitive_interfaces.unsupervised_learning import UnsupervisedLearnerPrimitiveBase
 from d3m.primitive_interfaces.base import CallResult
-import stopit
-import math
+import stopit  # type: ignore
 
 from d3m import container
-from d3m.metadata import hyperparams
-from d3m.metadata.hyperparams import UniformBool, Hyperparams
+from d3m.metadata import hyperparams, params
+from d3m.metadata.base import DataMetadata
+from d3m.metadata.hyperparams import UniformBool, UniformInt, Hyperparams
 
 from . import config
 
 Input = container.DataFrame
 Output = container.DataFrame
+_logger = logging.getLogger(__name__)
+
+
+class MiceParams(params.Params):
+    chained_equations: typing.Union[typing.Any, None]
+    numeric_column_indices: typing.Union[typing.Any, None]
+    fitted: typing.Union[typing.Any, None]
+
 
 class MiceHyperparameter(Hyperparams):
     verbose = UniformBool(default=False,
                           semantic_types=['http://schema.org/Boolean',
                                           'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
-
-class MICE(TransformerPrimitiveBase[Input, Output, MiceHyperparameter]):
+    ridge_alpha = hyperparams.Bounded[float](
+        lower=0,
+        upper=None,
+        default=1.0,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/TuningParameter'],
+        description="Ridge penalty of the column models.",
+    )
+    produce_iterations = UniformInt(
+        lower=0, upper=100, default=5,
+        description='Number of sweeps of the fitted column models over the missing columns of the data to impute, '
+                    'when produce is not given iterations. 0 imputes with the training means.',
+        semantic_types=['http://schema.org/Integer',
+                        'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    warm_start = UniformBool(
+        default=False,
+        description='Start fitting on new training data from the imputation of the models already fitted, instead '
+                    'of the column means, so that fewer iterations are needed.',
+        semantic_types=['http://schema.org/Boolean',
+                        'https://metadata.datadrivendiscovery.org/types/ControlParameter'])
+    latency_budget = hyperparams.Bounded[float](
+        lower=0,
+        upper=None,
+        default=0,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Seconds each produce call may spend on the model sweeps. When they are used up the remaining "
+                    "sweeps are skipped and the imputation so far is returned. 0 means no budget.",
+    )
+
+
+class MICE(UnsupervisedLearnerPrimitiveBase[Input, Output, MiceParams, MiceHyperparameter]):
     """
-    Impute the missing value using MICE.
-    This class is a wrapper from fancyimpute-mice
+    Impute the missing value using MICE (multiple imputation by chained equations).
+    fit learns a ridge regression of every numerical attribute on all the others, by chained equations on the training
+    data. produce imputes new data with the training means, then sweeps the learned models over its missing columns,
+    without fitting again.
 
     Parameters:
     ----------
@@ -68,73 +109,138 @@ class MICE(TransformerPrimitiveBase[Input, Output, MiceHyperparameter]):
 
         # All other attributes must be private with leading underscore
         self._train_x = None
+        self._chained_equations = None
+        self._numeric_column_indices: typing.List = []
+        self._is_fitted = False
         self._has_finished = False
         self._iterations_done = False
         self._verbose = hyperparams['verbose'] if hyperparams else False
+        self._ridge_alpha = hyperparams['ridge_alpha'] if hyperparams else 1.0
+        self._produce_iterations = hyperparams['produce_iterations'] if hyperparams else 5
+        self._warm_start = hyperparams['warm_start'] if hyperparams else False
+        self._latency_budget = hyperparams['latency_budget'] if hyperparams else 0
+
+    def set_params(self, *, params: MiceParams) -> None:
+        self._is_fitted = params['fitted']
+        self._has_finished = self._is_fitted
+        self._iterations_done = self._is_fitted
+        self._chained_equations = params['chained_equations']
+        self._numeric_column_indices = params['numeric_column_indices']
+
+    def get_params(self) -> MiceParams:
+        return MiceParams(
+            chained_equations=self._chained_equations,
+            numeric_column_indices=self._numeric_column_indices,
+            fitted=self._is_fitted)
+
+    def set_training_data(self, *, inputs: Input) -> None:
+        """
+        Sets training data of this primitive.
+
+        Parameters
+        ----------
+        inputs : Input
+            The inputs.
+        """
+        self._train_x = inputs
+        self._is_fitted = False
+
+    def fit(self, *, timeout: float = None, iterations: int = None) -> CallResult[None]:
+        """
+        learn the chained column models on the numerical attributes of the training data
+
+        Parameters:
+        ----------
+        iterations: number of chained equation sweeps over the training data, 10 by default
+        """
+
+        # if already fitted on current dataset, do nothing
+        if self._is_fitted:
+            return CallResult(None, self._has_finished, self._iterations_done)
+
+        if (timeout is None):
+            timeout = 2**31-1
+        if (iterations is None):
+            iterations = 10
+
+        # setup the timeout
+        with stopit.ThreadingTimeout(timeout) as to_ctx_mrg:
+            assert to_ctx_mrg.state == to_ctx_mrg.EXECUTING
+
+            attribute = DataMetadata.list_columns_with_semantic_types(
+                self._train_x.metadata, ['https://metadata.datadrivendiscovery.org/types/Attribute'])
+            numeric = DataMetadata.list_columns_with_semantic_types(
+                self._train_x.metadata, ['http://schema.org/Integer', 'http://schema.org/Float'])
+            numeric = [x for x in numeric if x in attribute]
+            numeric_data = self._train_x.iloc[:, numeric].apply(lambda col: pd.to_numeric(col, errors='coerce'))
+
+            # the previous models only fit data with the same columns
+            warm_start = None
+            if self._warm_start and self._chained_equations is not None and numeric == self._numeric_column_indices:
+                warm_start = self._chained_equations
 
+            if self._verbose: print("=========> mice fitting with {} iterations:".format(iterations))
+            chained_equations = mvp.ChainedEquations.fit(numeric_data.values, iterations, self._ridge_alpha,
+                                                         warm_start)
+
+        if to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
+            self._chained_equations = chained_equations
+            self._numeric_column_indices = numeric
+            self._is_fitted = True
+            self._has_finished = True
+            self._iterations_done = True
+        else:
+            self._is_fitted = False
+            self._has_finished = False
+            self._iterations_done = False
+        return CallResult(None, self._has_finished, self._iterations_done)
 
     def produce(self, *, inputs: Input, timeout: float = None, iterations: int = None) -> CallResult[Output]:
         """
         precond: run fit() before
 
-        to complete the data, based on the learned parameters, support:
-        -> greedy search
-
-        also support the untrainable methods:
-        -> iteratively regression
-        -> other
+        impute the missing values of the numerical attributes with the fitted column models
 
         Parameters:
         ----------
         data: pandas dataframe
-        label: pandas series, used for the evaluation of imputation
-
-        TODO:
-        ----------
-        1. add evaluation part for __simpleImpute()
-
+        iterations: number of model sweeps, produce_iterations by default
         """
 
+        if (not self._is_fitted):
+            # todo: specify a NotFittedError, like in sklearn
+            raise ValueError("Calling produce before fitting.")
+
+        deadline = time.perf_counter() + self._latency_budget if self._latency_budget else None
         if (timeout is None):
             timeout = 2**31-1
         if (iterations is None):
-            iterations = 100   # default value for mice
+            iterations = self._produce_iterations
 
-        if isinstance(inputs, pd.DataFrame):
-            data = inputs.copy()
-        else:
-            data = inputs[0].copy()
-        # record keys:
-        keys = data.keys()
-        index = data.index
+        numeric_data = inputs.iloc[:, self._numeric_column_indices].apply(
+            lambda col: pd.to_numeric(col, errors='coerce'))
+
+        if (pd.isnull(numeric_data).values.sum() == 0):    # no missing value exists
+            if self._verbose: print("Warning: no missing value in test dataset")
+            self._has_finished = True
+            return CallResult(inputs, self._has_finished, self._iterations_done)
 
         # setup the timeout
         with stopit.ThreadingTimeout(timeout) as to_ctx_mrg:
             assert to_ctx_mrg.state == to_ctx_mrg.EXECUTING
 
             # start completing data...
-            if self._verbose: print("=========> impute by fancyimpute-mice:")
-            data_clean = self.__mice(data, iterations)
+            if self._verbose: print("=========> impute by mice:")
+            data_clean = self._chained_equations.apply(numeric_data.values, iterations, deadline)
 
         value = None
         if to_ctx_mrg.state == to_ctx_mrg.EXECUTED:
             self._has_finished = True
             self._iterations_done = True
-            value =pd.DataFrame(data_clean, index, keys)
+            value = inputs.copy()
+            value.iloc[:, self._numeric_column_indices] = data_clean
         elif to_ctx_mrg.state == to_ctx_mrg.TIMED_OUT:
+            _logger.info("Timed Out...")
             self._has_finished = False
             self._iterations_done = False
         return CallResult(value, self._has_finished, self._iterations_done)
-
-
-
-    #============================================ core function ============================================
-    def __mice(self, test_data, iterations):
-        """
-        wrap fancyimpute-mice
-        """
-        missing_col_id = []
-        test_data = mvp.df2np(test_data, missing_col_id, self._verbose)
-        if (len(missing_col_id) == 0): return test_data
-        complete_data = mice(n_imputations=iterations, verbose=(1 if self._verbose else 0)).complete(test_data)
-        return complete_data
@@ -1,86 +1,213 @@
+import logging
+import time
+import warnings
+
 import pandas as pd  # type: ignore
 import numpy as np  # type: ignore
 
+_logger = logging.getLogger(__name__)
+
+
+STRATEGIES = ["zero", "new", "mean", "min", "max", "popular"]
+
 
 def popular_value(array):
     """
+    The most frequent value of array, the smallest one on ties; None if array is empty.
     array: 1D array
     """
-    cate = dict()
-    for cell in array:
-        if (cell in cate):
-            cate[cell] += 1
-        else:
-            cate[cell] = 1
+    array = np.asarray(array)
+    if array.size == 0:
+        return None
+    try:
+        values, counts = np.unique(array, return_counts=True)
+    except TypeError:
+        # values of types that cannot be ordered together
+        return pd.Series(array).mode().iloc[0]
+    return values[np.argmax(counts)]
+
+
+def _nan_mode(values):
+    """
+    The most frequent non-nan value of each column of a float matrix, the smallest one on ties; nan for the columns
+    with no value. One sort for all the columns: the runs of equal values are numbered over the whole matrix and
+    counted with a single bincount.
+    """
+    num_rows, num_cols = values.shape
+    if num_rows == 0:
+        return np.full(num_cols, np.nan)
+    ordered = np.sort(values, axis=0)  # nan last
+    observed = ~np.isnan(ordered)
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[1:] = ordered[1:] != ordered[:-1]
+    # column major, so every column starts a new run
+    runs = np.cumsum(starts.ravel(order='F')).reshape(ordered.shape, order='F')
+    run_counts = np.bincount(runs.ravel(order='F'), weights=observed.ravel(order='F'))
+    best_rows = np.argmax(run_counts[runs], axis=0)
+    return ordered[best_rows, np.arange(num_cols)]
+
+
+class ColumnStatistics:
+    """
+    Missing value mask and per column statistics of a matrix, shared by the imputers.
 
-    max_freq = 0
-    popular = None
-    for key in cate.keys():
-        if (cate[key] > max_freq):
-            popular = key
+    Each statistic is computed for all the columns at once, the first time it is asked for. The mean, min and max
+    only use the numeric values; the columns with no value get 0 for every statistic.
+    """
 
-    return popular
+    def __init__(self, data):
+        self.data = np.asarray(data)
+        if self.data.ndim == 1:
+            self.data = self.data.reshape(-1, 1)
+        self.missing = pd.isnull(self.data)
+        self.missing_count = self.missing.sum(axis=0)
+        self.missing_col_id = np.flatnonzero(self.missing_count).tolist()
+        self._numeric = None
+        self._values = dict()
+
+    def numeric(self):
+        """
+        The data as floats, the values that are not numbers as nan.
+        """
+        if self._numeric is None:
+            try:
+                self._numeric = self.data.astype(float)
+            except (TypeError, ValueError):
+                self._numeric = np.column_stack(
+                    [pd.to_numeric(self.data[:, i], errors='coerce') for i in range(self.data.shape[1])]
+                ).astype(float).reshape(self.data.shape)
+        return self._numeric
+
+    def values(self, strategy):
+        """
+        The value strategy fills the missing cells of each column with, "mean", "min", "max", "zero", "new" or
+        "popular".
+        """
+        if strategy not in self._values:
+            self._values[strategy] = self._compute(strategy)
+        return self._values[strategy]
+
+    def fill_value(self, col_id, strategy):
+        return self.values(strategy)[col_id]
+
+    def _compute(self, strategy):
+        num_cols = self.data.shape[1]
+        if strategy in ("zero", "new"):
+            # 0 is the value that never happens in our categorical map
+            return np.zeros(num_cols)
+        if strategy == "popular" and self.data.dtype.kind == 'O':
+            result = np.empty(num_cols, dtype=object)
+            for i in range(num_cols):
+                value = popular_value(self.data[~self.missing[:, i], i])
+                result[i] = 0 if value is None else value
+            return result
+
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            # all nan columns
+            warnings.simplefilter('ignore', RuntimeWarning)
+            numeric = self.numeric()
+            if strategy == "mean":
+                result = np.nanmean(numeric, axis=0)
+            elif strategy == "min":
+                result = np.nanmin(numeric, axis=0) if numeric.shape[0] else np.full(num_cols, np.nan)
+            elif strategy == "max":
+                result = np.nanmax(numeric, axis=0) if numeric.shape[0] else np.full(num_cols, np.nan)
+            elif strategy == "popular":
+                result = _nan_mode(numeric)
+            else:
+                raise ValueError("no such impute strategy: {}".format(strategy))
+        result[np.isnan(result)] = 0
+        if strategy != "mean" and self.data.dtype.kind in 'biu':
+            result = result.astype(self.data.dtype)
+        return result
+
+
+def fill_value(data, value="zero"):
+    """
+    The value the strategy fills the missing cells of a column with.
+    INPUT:
+    data: numpy array, 1D
+    value:    string: "mean", "min", "max", "zero", "new", "popular"
+    """
+    return ColumnStatistics(data).fill_value(0, value)
 
 
 def myImputer(data, value="zero", verbose=False):
     """
     INPUT:
-    data: numpy array, matrix
+    data: numpy array, vector or matrix, the missing cells of each column are filled with its own value
     value:    string: "mean", "min", "max", "zero", "gaussian"
     """
-    index = pd.isnull(data)
-
-    data_imputed = np.copy(data)
-    data_drop = data[np.logical_not(index)]   #drop nan from data
-    inputed_value = 0
-    if (value == "zero"):
-        inputed_value = 0
-    elif (value == "mean"):
-        inputed_value = np.mean(data_drop)
-    elif (value == "max"):
-        inputed_value = np.max(data_drop)
-    elif (value == "min"):
-        inputed_value = np.min(data_drop)
-    elif (value == "new"):
-        inputed_value = 0   # 0 is the value that never happens in our categorical map
-    elif (value == "popular"):
-        inputed_value = popular_value(data_drop)
     # special type of imputed, just return after imputation
-    elif (value == "knn"):
-        from fancyimpute import KNN
-        data_clean = KNN(k=5).complete(data)
+    if (value == "knn"):
+        data_clean = KNNImputer(data, k=5).impute(data)
         return data_clean
-    else:
-        raise ValueError("no such impute strategy: {}".format(value))
-
-    if np.isnan(inputed_value):
-        inputed_value = 0
 
-    data_imputed[index] = inputed_value
+    statistics = ColumnStatistics(data)
+    data_imputed = np.copy(statistics.data)
+    inputed_value = statistics.values(value)
+    rows, cols = np.nonzero(statistics.missing)
+    data_imputed[rows, cols] = inputed_value[cols]
+    data_imputed = data_imputed.reshape(np.shape(data))
 
     if verbose: print("imputed missing value: {}".format(inputed_value))
     return data_imputed
 
 
-def imputeData(data, missing_col_id, imputation_strategies, verbose=False):
+def imputeData(data, missing_col_id, imputation_strategies, verbose=False, statistics=None):
     """
     impute the data using permutations array.
     INPUT:
     data: numpy array, matrix
     value:    string: "mean", "min", "max", "zero", "gaussian"
+    statistics: ColumnStatistics of data, when already computed
     """
+    if statistics is None:
+        statistics = ColumnStatistics(data)
     data_clean = np.copy(data)
-    for i in range(len(imputation_strategies)):
-        strategy = imputation_strategies[i]
-        col_id = missing_col_id[i]
-        data_clean[:,col_id] = myImputer(data[:,col_id], strategy)
+    for col_id, strategy in zip(missing_col_id, imputation_strategies):
+        data_clean[statistics.missing[:, col_id], col_id] = statistics.fill_value(col_id, strategy)
+        if verbose: print("imputed missing value: {}".format(statistics.fill_value(col_id, strategy)))
 
     return data_clean
 
 
+class IncrementalImputer:
+    """
+    One imputed working copy of data, for trying imputation strategy combinations that differ in a few columns.
+
+    The missing cells and the fill value of each (column, strategy) are computed once. Imputing with a new
+    combination only rewrites the missing cells of the columns whose strategy changed, in place. The copy is column
+    major, so a column is contiguous.
+    """
+
+    def __init__(self, data, missing_col_id, statistics=None):
+        self.data = np.array(data, order='F')
+        self.missing_col_id = list(missing_col_id)
+        self.statistics = ColumnStatistics(data) if statistics is None else statistics
+        self._missing_rows = {col_id: np.flatnonzero(self.statistics.missing[:, col_id])
+                              for col_id in self.missing_col_id}
+        self._strategies = {col_id: None for col_id in self.missing_col_id}
+
+    def fill_value(self, col_id, strategy):
+        return self.statistics.fill_value(col_id, strategy)
+
+    def impute(self, imputation_strategies):
+        """
+        The working copy imputed with imputation_strategies, one per missing column. Do not modify it.
+        """
+        for col_id, strategy in zip(self.missing_col_id, imputation_strategies):
+            if self._strategies[col_id] != strategy:
+                value = self.fill_value(col_id, strategy)
+                self.data[self._missing_rows[col_id], col_id] = value
+                self._strategies[col_id] = strategy
+        return self.data
+
+
 def bayeImpute(data, target_col, verbose=False):
     '''
     currently, BayesianRidge.
+    impute the missing cells of target_col in place, using the other columns as features;
     return the imputated data, and model coefficient
     '''
 
@@ -90,74 +217,354 @@ def bayeImpute(data, target_col, verbose=False):
     # model = LinearRegression()
     # model = RandomForestRegressor()
 
-    original_data = np.copy(data)
-
     target = data[:, target_col]
-    data = np.delete(data, obj=target_col, axis=1)  #remove the missing-value column
     mv_mask = pd.isnull(target)
-    if verbose: print("number of imputated cells: {}".format(sum(pd.isnull(original_data[:,target_col]))))
+    features = np.arange(data.shape[1]) != target_col
+    if verbose: print("number of imputated cells: {}".format(np.count_nonzero(mv_mask)))
 
-    x_test = data[mv_mask]
-    x_train = data[~mv_mask]
     y_train = target[~mv_mask]
 
     # special case in fit:
     # check if valid to regression: wether only one value exist in target.
     # If happen, use default "mean" method (which is all same)
-    is_other_value = False in (y_train == y_train[0])
-    if (not is_other_value):
+    if (y_train.size == 0 or np.all(y_train == y_train[0])):
         model = "mean"
-        original_data[mv_mask, target_col] = y_train[0] * len(mv_mask)
-        return original_data, model
-    # import pdb
-    # pdb.set_trace()
-    model.fit(x_train, y_train)
-    result = model.predict(x_test)
+        data[mv_mask, target_col] = y_train[0] if y_train.size else 0
+        return data, model
+
+    model.fit(data[np.ix_(~mv_mask, features)], y_train)
+    result = model.predict(data[np.ix_(mv_mask, features)])
     # special case in predict:
     # if the model goes wrong: predicts nan value. using mean method instead
     if (pd.isnull(result).sum() > 0):
         if verbose: print("Warning: model gets nan value, using mean instead")
         model = "mean"
-        original_data[:, target_col] = myImputer(original_data[:, target_col], model)
-        return original_data, model
+        data[:, target_col] = myImputer(target, model)
+        return data, model
 
-    original_data[mv_mask, target_col] = result  # put the imputation result back to original data, following the index
+    data[mv_mask, target_col] = result  # put the imputation result back to original data, following the index
 
     # print("coefficient: {}".format(model.coef_))
-    return original_data, model
+    return data, model
 
 
 def transform(data, target_col, model, verbose=False):
     '''
-    currently, BayesianRidge.
-    return the imputated data, and model coefficient
+    impute the missing cells of target_col in place with a model from bayeImpute or GramRegression;
+    return the imputated data
     '''
 
-    original_data = np.copy(data)
-
     target = data[:, target_col]
-    data = np.delete(data, obj=target_col, axis=1)  #remove the missing-value column
     mv_mask = pd.isnull(target)
-    if verbose: print("number of imputated cells: {}".format(sum(pd.isnull(original_data[:,target_col]))))
-
-    x_test = data[mv_mask]
-    x_train = data[~mv_mask]
-    y_train = target[~mv_mask]
+    if verbose: print("number of imputated cells: {}".format(np.count_nonzero(mv_mask)))
+    if not mv_mask.any():
+        return data
 
     if not model=='mean':
-        result = model.predict(x_test)
+        features = np.arange(data.shape[1]) != target_col
+        result = model.predict(data[np.ix_(mv_mask, features)])
 
     # special case in predict:
     # if the model goes wrong: predicts nan value. using mean method instead
     if (model == 'mean' or pd.isnull(result).sum() > 0):
         if verbose: print("Warning: model gets nan value, using mean instead")
         model = "mean"
-        original_data[:,target_col] = myImputer(original_data[:,target_col], model)
-        return original_data
-    original_data[mv_mask, target_col] = result  # put the imputation result back to original data, following the index
+        data[:, target_col] = myImputer(target, model)
+        return data
+    data[mv_mask, target_col] = result  # put the imputation result back to original data, following the index
 
     # print("coefficient: {}".format(model.coef_))
-    return original_data
+    return data
+
+
+class LinearModel:
+    """
+    Linear regression model fitted by GramRegression, predicts like the sklearn models.
+    """
+
+    def __init__(self, coef, intercept):
+        self.coef_ = coef
+        self.intercept_ = intercept
+
+    def predict(self, X):
+        return np.dot(X, self.coef_) + self.intercept_
+
+
+class GramRegression:
+    """
+    Iterative ridge regression imputation of the missing columns of a matrix, each on all the other columns.
+
+    The regression of a column only depends on X^T X and X^T y over the rows where the column is observed, so one
+    Gram matrix per missing column is kept, with a constant column for the intercept. Re-imputing a column only
+    changes its missing cells; the Gram matrices of the other columns get a low rank update over those rows, and each
+    regression is a (d+1)x(d+1) solve instead of a fit over all the rows.
+    """
+
+    def __init__(self, data, missing_col_id, missing, alpha=1.0):
+        """
+        data: numpy array, matrix, already imputed (e.g. with the mean)
+        missing_col_id: the columns to regress
+        missing: mask of the cells to impute, same shape as data
+        alpha: ridge penalty, the intercept is not penalised
+        """
+        num_rows, num_cols = data.shape
+        self.data = np.empty((num_rows, num_cols + 1), order='F')
+        self.data[:, :num_cols] = data
+        self.data[:, num_cols] = 1
+        self.missing_col_id = list(missing_col_id)
+        self.alpha = alpha
+        self._missing_rows = {col_id: np.flatnonzero(missing[:, col_id]) for col_id in self.missing_col_id}
+        self._observed = ~missing[:, self.missing_col_id]
+        self._constant = dict()
+        self._gram = np.empty((len(self.missing_col_id), num_cols + 1, num_cols + 1))
+        gram = np.dot(self.data.T, self.data)
+        for i, col_id in enumerate(self.missing_col_id):
+            rows = self.data[self._missing_rows[col_id]]
+            self._gram[i] = gram - np.dot(rows.T, rows)
+            observed = self.data[self._observed[:, i], col_id]
+            if observed.size == 0 or np.all(observed == observed[0]):
+                self._constant[col_id] = observed[0] if observed.size else 0
+
+    def regress(self, target_col):
+        """
+        Fit the regression of target_col on the current imputation and re-impute its missing cells; return the
+        model, or "mean" when the observed values are all the same.
+        """
+        model, values = self._fit(target_col)
+        self._set_column(target_col, values)
+        return model
+
+    def regress_all(self, target_cols, relaxation=1.0):
+        """
+        Jacobi variant of regress: the models of all target_cols are fitted on the current imputation before any of
+        the columns is re-imputed. The new imputed values are weighted by relaxation against the current ones.
+        """
+        fitted = [self._fit(target_col) for target_col in target_cols]
+        for target_col, (_, values) in zip(target_cols, fitted):
+            current = self.data[self._missing_rows[target_col], target_col]
+            self._set_column(target_col, relaxation * values + (1 - relaxation) * current)
+        return [model for model, _ in fitted]
+
+    def _fit(self, target_col):
+        """
+        The model of target_col and its predictions for the missing cells.
+        """
+        rows = self._missing_rows[target_col]
+        if target_col in self._constant:
+            return "mean", np.full(rows.size, self._constant[target_col])
+
+        features = np.arange(self.data.shape[1]) != target_col
+        gram = self._gram[self.missing_col_id.index(target_col)]
+        a = gram[np.ix_(features, features)]
+        penalty = np.full(a.shape[0], float(self.alpha))
+        penalty[-1] = 0  # the intercept
+        a[np.diag_indices_from(a)] += penalty
+        b = gram[features, target_col]
+        try:
+            coef = np.linalg.solve(a, b)
+        except np.linalg.LinAlgError:
+            coef = np.linalg.lstsq(a, b, rcond=None)[0]
+
+        result = np.dot(self.data[np.ix_(rows, features)], coef)
+        if pd.isnull(result).any():
+            _logger.debug('Regression of column %d predicts nan, using the mean instead', target_col)
+            mean = fill_value(np.delete(self.data[:, target_col], rows), "mean")
+            return "mean", np.full(rows.size, mean)
+        return LinearModel(coef[:-1], coef[-1]), result
+
+    def imputed(self):
+        """
+        The imputed matrix, without the intercept column. Do not modify it.
+        """
+        return self.data[:, :-1]
+
+    def _set_column(self, col_id, values):
+        rows = self._missing_rows[col_id]
+        if rows.size == 0:
+            return
+        delta = values - self.data[rows, col_id]
+        # the changed cells, in the rows where each of the missing columns is observed
+        change = self._observed[rows] * delta[:, np.newaxis]
+        change[:, self.missing_col_id.index(col_id)] = 0  # its own Gram matrix only has observed rows
+        update = np.dot(change.T, self.data[rows])
+        self._gram[:, col_id, :] += update
+        self._gram[:, :, col_id] += update
+        self._gram[:, col_id, col_id] += np.dot(change.T, delta)
+        self.data[rows, col_id] = values
+
+
+class ChainedEquations:
+    """
+    Fitted chained equations (MICE): a linear model of every column on all the other columns, kept as one coefficient
+    matrix. New rows are imputed with the column means, then with sweeps of the models over their missing columns.
+    """
+
+    def __init__(self, coefficients, intercepts, means):
+        """
+        coefficients: d x d matrix, column j holds the model of column j, with a zero diagonal
+        intercepts, means: one per column
+        """
+        self.coefficients = coefficients
+        self.intercepts = intercepts
+        self.means = means
+
+    @classmethod
+    def fit(cls, data, iterations=10, alpha=1.0, warm_start=None):
+        """
+        Fit the chained models on data: ridge regressions of the missing columns, updated in iterations Gauss-Seidel
+        sweeps, then of every column on the final imputation. The imputation starts from the column means, or from
+        the imputation of the warm_start models.
+        """
+        data = np.asarray(data, dtype=float)
+        num_cols = data.shape[1]
+        statistics = ColumnStatistics(data)
+        means = statistics.values("mean")
+        if warm_start is not None:
+            initial = warm_start.apply(data)
+        else:
+            initial = imputeData(data, statistics.missing_col_id, ["mean"] * len(statistics.missing_col_id),
+                                 statistics=statistics)
+        engine = GramRegression(initial, range(num_cols), statistics.missing, alpha)
+        for _ in range(iterations):
+            for col_id in statistics.missing_col_id:
+                engine.regress(col_id)
+
+        coefficients = np.zeros((num_cols, num_cols))
+        intercepts = means.copy()
+        for col_id in range(num_cols):
+            model = engine.regress(col_id)
+            if isinstance(model, LinearModel):
+                coefficients[np.arange(num_cols) != col_id, col_id] = model.coef_
+                intercepts[col_id] = model.intercept_
+        return cls(coefficients, intercepts, means)
+
+    def apply(self, data, iterations=1, deadline=None):
+        """
+        data with its missing cells imputed, as a new float matrix. The sweeps stop at deadline (a time.perf_counter()
+        value), leaving the imputation as it is then.
+        """
+        data = np.array(data, dtype=float)
+        missing = np.isnan(data)
+        data[missing] = np.broadcast_to(self.means, data.shape)[missing]
+        missing_rows = [(col_id, np.flatnonzero(missing[:, col_id])) for col_id in np.flatnonzero(missing.any(axis=0))]
+        for _ in range(iterations):
+            for col_id, rows in missing_rows:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return data
+                data[rows, col_id] = np.dot(data[rows], self.coefficients[:, col_id]) + self.intercepts[col_id]
+        return data
+
+
+# rows sharing a missing value pattern are searched with a KD-tree over their observed features when there are enough
+# of them to pay for building it, and few enough features for the tree to beat the blockwise search
+KD_TREE_MIN_ROWS = 100
+KD_TREE_MAX_FEATURES = 10
+
+
+class KNNImputer:
+    """
+    k nearest neighbours imputation against the complete rows of a reference (training) matrix.
+
+    The distance from a row to a reference row only uses the features the row has. The missing cells are filled with
+    the inverse distance weighted mean of the k nearest reference rows, the rows with no feature at all get the
+    reference column means.
+
+    The rows that share a missing value pattern with many others are searched with a KD-tree over the observed
+    features. The others are searched blockwise, chunk_size rows against chunk_size reference rows at a time,
+    keeping the running k nearest, so memory is bounded by the chunk size and not by the number of rows.
+    """
+
+    def __init__(self, reference, k=5, chunk_size=1000):
+        reference = np.asarray(reference, dtype=float)
+        self.means = ColumnStatistics(reference).values("mean")
+        self.reference = reference[~np.isnan(reference).any(axis=1)]
+        self.k = k
+        self.chunk_size = chunk_size
+        if self.reference.shape[0] < k:
+            _logger.warning('Only %d complete rows to impute from, k is %d', self.reference.shape[0], k)
+
+    def impute(self, data):
+        """
+        data with its missing cells imputed, as a new float matrix.
+        """
+        from sklearn.neighbors import KDTree  # type: ignore
+
+        data = np.array(data, dtype=float)
+        missing = np.isnan(data)
+        rows = np.flatnonzero(missing.any(axis=1))
+        k = min(self.k, self.reference.shape[0])
+        if k == 0:
+            data[missing] = np.broadcast_to(self.means, data.shape)[missing]
+            return data
+
+        patterns, pattern_rows = np.unique(missing[rows], axis=0, return_inverse=True)
+        pattern_rows = pattern_rows.ravel()
+        blockwise = []
+        for i, pattern in enumerate(patterns):
+            group = rows[pattern_rows == i]
+            features = np.flatnonzero(~pattern)
+            if group.size < KD_TREE_MIN_ROWS or not 0 < features.size <= KD_TREE_MAX_FEATURES:
+                blockwise.append(group)
+                continue
+            tree = KDTree(self.reference[:, features])
+            for start in range(0, group.size, self.chunk_size):
+                chunk = group[start:start + self.chunk_size]
+                distances, neighbours = tree.query(data[np.ix_(chunk, features)], k=k)
+                self._impute_rows(data, missing, chunk, np.square(distances), neighbours)
+
+        blockwise = np.sort(np.concatenate(blockwise)) if blockwise else rows[:0]
+        for start in range(0, blockwise.size, self.chunk_size):
+            chunk = blockwise[start:start + self.chunk_size]
+            observed = ~missing[chunk]
+            distances, neighbours = self._nearest(np.where(observed, data[chunk], 0), observed, k)
+            self._impute_rows(data, missing, chunk, distances, neighbours)
+        return data
+
+    def _impute_rows(self, data, missing, rows, distances, neighbours):
+        """
+        Fill the missing cells of rows from their nearest reference rows, given their squared distances.
+        """
+        observed = ~missing[rows]
+        estimate = np.tile(self.means, (rows.size, 1))
+        weights = 1 / np.maximum(np.sqrt(distances), 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        has_features = observed.any(axis=1)
+        estimate[has_features] = np.einsum('rk,rkd->rd', weights[has_features],
+                                           self.reference[neighbours[has_features]])
+        data[rows] = np.where(observed, data[rows], estimate)
+
+    def _nearest(self, query, observed, k):
+        """
+        Squared distances and indices of the k nearest reference rows of each query row, over its observed features.
+        """
+        num_rows = query.shape[0]
+        # |q - r|^2 = |q|^2 - 2 q.r + |r|^2 over the observed features of q; |q|^2 does not change the order
+        query = -2 * query
+        observed = observed.astype(float)
+        best_distances = np.full((num_rows, 0), np.inf)
+        best_neighbours = np.zeros((num_rows, 0), dtype=int)
+        for start in range(0, self.reference.shape[0], self.chunk_size):
+            block = self.reference[start:start + self.chunk_size]
+            distances = np.dot(query, block.T)
+            distances += np.dot(observed, np.square(block).T)
+            neighbours = _smallest(distances, k) + start
+            distances = np.take_along_axis(distances, neighbours - start, axis=1)
+            distances = np.hstack([best_distances, distances])
+            neighbours = np.hstack([best_neighbours, neighbours])
+            keep = _smallest(distances, k)
+            best_distances = np.take_along_axis(distances, keep, axis=1)
+            best_neighbours = np.take_along_axis(neighbours, keep, axis=1)
+        best_distances += np.square(query / 2).sum(axis=1)[:, np.newaxis]
+        return np.maximum(best_distances, 0), best_neighbours
+
+
+def _smallest(values, k):
+    """
+    Column indices of the k smallest values of each row, in no particular order.
+    """
+    if values.shape[1] <= k:
+        return np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    return np.argpartition(values, k - 1, axis=1)[:, :k]
 
 
 def df2np(data, missing_col_id=[], verbose=False):
@@ -165,18 +572,11 @@ def df2np(data, missing_col_id=[], verbose=False):
     helper function: convert dataframe to np array;
         in the meanwhile, provide the id for missing column
     """
-    counter = 0
-
     # 1. get the id for missing value column
-    missing_col_name = []
-    for col_name in data:
-        num = sum(pd.isnull(data[col_name]))
-        if (num > 0):
-            missing_col_id.append(counter)
-            missing_col_name.append(col_name)
-        counter += 1
-
-    if verbose: print("missing column name: {}".format(missing_col_name))
+    missing = pd.isnull(data).values.any(axis=0)
+    missing_col_id.extend(np.flatnonzero(missing).tolist())
+
+    if verbose: print("missing column name: {}".format(list(data.columns[missing])))
 
     data = data.values  #convert to np array
 
@@ -11,6 +11,7 @@ from d3m.base import utils as d3m_utils
 from d3m.metadata.base import DataMetadata
 from common_primitives import utils
 
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 
 __all__ = ('ToNumeric',)
@@ -94,16 +95,16 @@ class ToNumeric(transformer.TransformerPrimitiveBase[Inputs, Outputs, Hyperparam
         _logger.debug(f'converting columns: {columns_to_use}')
         _logger.debug(f'converting columns: {inputs.iloc[:, columns_to_use].columns}')
         output = inputs.copy()
+        batch = MetadataBatch(output.metadata)
         for col in columns_to_use:
             output.iloc[:, col] = pd.to_numeric(output.iloc[:, col])
             column_metadata = output.metadata.query((metadata_base.ALL_ELEMENTS, col))
             semantic_type = column_metadata.get('semantic_types', None)
             if 'http://schema.org/Integer' in semantic_type:
-                output.metadata = output.metadata.update((metadata_base.ALL_ELEMENTS, col), {'structural_type': int})
+                batch.update_column(col, {'structural_type': int})
             elif 'http://schema.org/Float' in semantic_type:
-                output.metadata = output.metadata.update((metadata_base.ALL_ELEMENTS, col), {'structural_type': float})
-            # What to do with missing values?
-            # has_missing_value = pd.isnull(output.iloc[:, col]).sum() > 0
+                batch.update_column(col, {'structural_type': float})
+        output.metadata = batch.apply()
         if self.hyperparams['drop_non_numeric_columns']:
             _logger.debug(f'dropping columns: {list(np.where(output.dtypes == object)[0])}')
             _logger.debug(f'dropping columns: {output.iloc[:, list(np.where(output.dtypes == object)[0])].columns}')
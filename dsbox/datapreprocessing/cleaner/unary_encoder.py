@@ -10,6 +10,8 @@ from d3m.metadata import base as mbase
 from d3m.metadata import hyperparams, params
 from d3m.primitive_interfaces.base import CallResult
 from d3m.primitive_interfaces.unsupervised_learning import UnsupervisedLearnerPrimitiveBase
+from dsbox.datapreprocessing.cleaner.dependencies.helper_funcs import HelperFunction, ENCODER_OUTPUT_TYPES
+from dsbox.common.metadata_batch import MetadataBatch
 from . import config
 
 Input = container.DataFrame
@@ -61,6 +63,12 @@ class UEncHyperparameter(hyperparams.Hyperparams):
         semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
         description="Also include primary index columns if input data has them. Applicable only if \"return_result\" is set to \"new\".",
     )
+    output_type = hyperparams.Enumeration(
+        values=ENCODER_OUTPUT_TYPES,
+        default='dense',
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Return the unary columns as dense int columns, or as pandas sparse uint8 columns (fill value 0), which take memory only for the ones.",
+    )
 
 
 ## reference: https://github.com/scikit-learn/scikit-learn/issues/8136
@@ -280,10 +288,16 @@ class UnaryEncoder(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, UEncH
         return CallResult(None, has_finished=True, iterations_done=1)
 
     def __encode_column(self, col):
-        unary = pd.DataFrame(col)
-        for v in self._mapping[col.name]:
-            unary[col.name+"_"+str(v)] = (col >= v).astype(int)
-        return unary.drop(col.name, axis=1)
+        values = col.values
+        rows = []
+        columns = []
+        for index, v in enumerate(self._mapping[col.name]):
+            hits = np.flatnonzero(values >= v)
+            rows.append(hits)
+            columns.append(np.full(hits.size, index))
+        names = [col.name+"_"+str(v) for v in self._mapping[col.name]]
+        return HelperFunction.indicator_frame(np.concatenate(rows), np.concatenate(columns), names, col.index,
+                                              sparse=self.hyperparams['output_type'] == 'sparse', dtype=int)
 
     def produce(self, *, inputs: Input, timeout: float = None, iterations: int = None) -> CallResult[Output]:
         """
@@ -338,12 +352,13 @@ class UnaryEncoder(UnsupervisedLearnerPrimitiveBase[Input, Output, Params, UEncH
         encoded = d3m_DataFrame(pd.concat(res, axis=1))
 
         # update metadata for existing columns
+        batch = MetadataBatch(encoded.metadata)
         for index in range(len(encoded.columns)):
-            old_metadata = dict(encoded.metadata.query((mbase.ALL_ELEMENTS, index)))
-            old_metadata["structural_type"] = int
-            old_metadata["semantic_types"] = (
-                'http://schema.org/Integer', 'https://metadata.datadrivendiscovery.org/types/Attribute')
-            encoded.metadata = encoded.metadata.update((mbase.ALL_ELEMENTS, index), old_metadata)
+            batch.update_column(index, {
+                "structural_type": HelperFunction.indicator_structural_type(encoded.dtypes.iloc[index]),
+                "semantic_types": ('http://schema.org/Integer',
+                                   'https://metadata.datadrivendiscovery.org/types/Attribute')})
+        encoded.metadata = batch.apply()
         # after extracting the traget columns, remove these columns from dataFrame
         data_else = data.remove_columns(self._cat_col_index)
         result = data_else.horizontal_concat(encoded)
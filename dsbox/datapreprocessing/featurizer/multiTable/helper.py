@@ -1,25 +1,198 @@
+import collections
+import hashlib
 import re
 import logging
+import typing
+
+import numpy as np
+import pandas as pd
+
 _logger = logging.getLogger(__name__)
 
+# aggregates of the child columns per value of their key, all computed by one groupby().agg pass
+NUMERIC_AGGREGATES = ['count', 'sum', 'mean', 'min', 'max', 'nunique']
+OTHER_AGGREGATES = ['count', 'nunique']
+# largest ratio of the rows of a join to the rows of the table joined to, above it the child table is aggregated
+MAX_ROW_GROWTH = 1.0
+# number of join plans, key counts, aggregates and indexed tables kept between calls, least recently used dropped
+ARTIFACT_CACHE_SIZE = 64
+
+
+class JoinStep(typing.NamedTuple):
+    """
+    A join of a plan: the key column of the joined table, as table_name+"_"+column_name, and whether its aggregates
+    are joined instead of its rows.
+    """
+    table_key: str
+    aggregate: bool
+
+
+def fingerprint(table: pd.DataFrame) -> str:
+    """
+    Hash of the content of table, its column names and values but not its index.
+    """
+    digest = hashlib.sha1(pd.util.hash_pandas_object(table, index=False).values.tobytes())
+    digest.update(repr(list(table.columns)).encode())
+    return digest.hexdigest()
+
+
+def join_cardinality(keys: pd.Series, foreign_key_counts: pd.Series) -> int:
+    """
+    Number of rows of the left join of keys with a foreign key column, from the number of rows of each value of the
+    foreign key as value_counts() gives them: each row of keys once per row with the same value, or once when there
+    is none.
+    """
+    return int(keys.map(foreign_key_counts).fillna(1).sum())
+
+
+def plan_joins(rows: int, estimates: typing.List[typing.Tuple[str, int, int]],
+               max_row_growth: float) -> typing.List[JoinStep]:
+    """
+    Order of the joins to a table of rows rows, from (table_key, rows of its join alone, cells of the joined table)
+    for every joined table. The joins that add the fewest rows come first, the smallest tables first among them, so
+    that the intermediate results stay small. The growth of the joins is taken as independent, and a join that would
+    take the result over max_row_growth times rows joins the aggregates of its table instead.
+    """
+    plan = []
+    planned_rows = rows
+    for table_key, join_rows, _ in sorted(estimates, key=lambda estimate: (estimate[1], estimate[2], estimate[0])):
+        growth = join_rows / rows if rows else 1.0
+        aggregate = planned_rows * growth > max_row_growth * rows
+        if not aggregate:
+            planned_rows *= growth
+        plan.append(JoinStep(table_key, aggregate))
+    return plan
+
+
+def aggregate_table(table: pd.DataFrame, key_column_name: str, table_name: str,
+                    count_columns: typing.Collection[str] = ()) -> pd.DataFrame:
+    """
+    Aggregates of the columns of table per value of its key column, indexed by the sorted key values: the number of
+    rows, as table_name+"_"+key_column_name+"_COUNT", then for every other column the count and the number of distinct
+    values and, for the columns whose values are all numbers, the sum, mean, min and max, as
+    table_name+"_"+column_name+"_"+AGGREGATE. The columns of count_columns, such as the primary key of the table, are
+    identifiers rather than quantities and get the count only. Rows without a key are left out.
+    """
+    codes, keys = pd.factorize(table[key_column_name], sort=True)
+    # sorted codes, so that the groups are contiguous and come out in the order of the keys
+    order = np.argsort(codes, kind='mergesort')
+    order = order[codes[order] >= 0]
+    codes = codes[order]
+
+    values = {}
+    functions = {}
+    for column_name in table.columns:
+        if column_name == key_column_name:
+            continue
+        column = table[column_name].iloc[order].reset_index(drop=True)
+        if column_name in count_columns:
+            values[column_name] = column
+            functions[column_name] = ['count']
+            continue
+        # text columns are mostly told by their first value, without parsing all of them
+        first = column.dropna()[:1]
+        numbers = None
+        if len(first) and pd.to_numeric(first, errors='coerce').count():
+            numbers = pd.to_numeric(column, errors='coerce')
+        if numbers is not None and numbers.count() == column.count():
+            values[column_name] = numbers
+            functions[column_name] = NUMERIC_AGGREGATES
+        else:
+            values[column_name] = column
+            functions[column_name] = OTHER_AGGREGATES
+
+    result = pd.DataFrame(index=keys)
+    result[table_name + "_" + str(key_column_name) + "_COUNT"] = np.bincount(codes, minlength=len(keys))
+    if values:
+        aggregated = pd.DataFrame(values).groupby(codes, sort=False).agg(functions)
+        aggregated.columns = [table_name + "_" + str(column_name) + "_" + function.upper()
+                              for column_name, function in aggregated.columns]
+        aggregated.index = keys
+        result = pd.concat([result, aggregated], axis=1)
+    return result
+
+
+def join_aggregates(result: pd.DataFrame, aggregates: typing.Dict[str, typing.List[pd.DataFrame]]) -> pd.DataFrame:
+    """
+    result with aggregates joined to it: for every key column of result, its aggregates side by side, aligned once to
+    the key values of all the rows. The counts of the keys without child rows are 0, and the counts stay integers.
+    """
+    if not aggregates:
+        return result
+    joined = [result]
+    for key_column_name, frames in aggregates.items():
+        frame = frames[0] if len(frames) == 1 else pd.concat(frames, axis=1)
+        frame = frame.reindex(result[key_column_name].values)
+        counts = [column for column in frame.columns if column.endswith(("_COUNT", "_NUNIQUE"))]
+        # reindex turns the counts of the missing keys into NaN and the columns into floats
+        frame[counts] = frame[counts].fillna(0).astype(np.int64)
+        frame.index = result.index
+        joined.append(frame)
+    return pd.concat(joined, axis=1)
+
+
 class Aggregator(object):
     """
     procedure:
     1. starting from the master table. do a forward(), which find all the outcoming tables, ready to do step 3.
-    2. all the forwarded tables, do a backward(), which aggreates all incoming tables, using groupby count()
+    2. all the forwarded tables, do a backward(), which aggreates all incoming tables, with aggregate_table()
     3. master table joins all the aggreated tables.
 
     naming conventions:
-    1. for step 2, the resulted columns are renamed as: belonged_table_name+"_"+column_name+"_COUNT"
+    1. for step 2, the resulted columns are renamed as: belonged_table_name+"_"+column_name+"_"+AGGREGATE, where
+       AGGREGATE is one of COUNT, NUNIQUE, SUM, MEAN, MIN, MAX
     2. for step 1, the resulted columns (joined back to master table) are renamed as: table_name+"_"+column_name
+
+    The joins to a table are done in the order of plan_joins(), from the table sizes and the key counts. A join that
+    would give more than max_row_growth times the rows of the table joined to joins the aggregates of the child table
+    instead of its rows.
+
+    The join plans, key counts, aggregates and indexed tables depend only on the joined tables, and are kept in cache,
+    by the fingerprints of these tables, so that they are computed once for all the calls with the same tables: a
+    call with new rows of the master table only joins them. The plan is computed on the first call and reused, so that
+    the calls give the same columns.
     """
 
-    def __init__(self, relations, data, verbose):
+    def __init__(self, relations, data, verbose, max_row_growth=MAX_ROW_GROWTH, cache=None, fingerprints=None,
+                 key_columns=None):
         self.visited = set() # set of table names, store the tables that already in the queue (to be processed)
         self.delimiter = "_"
         self.relations = relations
         self.tables = data  # dict, key: name; value : pandas.DataFrame
         self.verbose = verbose
+        self.max_row_growth = max_row_growth
+        self.cache = cache if cache is not None else collections.OrderedDict()  # key: tuple; value: artifact
+        self.fingerprints = fingerprints if fingerprints is not None else {}  # key: table name; value: fingerprint
+        # table_name+"_"+column_name of the primary keys and index columns, aggregated by their count only
+        self.key_columns = key_columns if key_columns is not None else set()
+
+    def fingerprint(self, table_name):
+        """
+        Fingerprint of a table, computed once per call
+        """
+        if table_name not in self.fingerprints:
+            self.fingerprints[table_name] = fingerprint(self.tables[table_name])
+        return self.fingerprints[table_name]
+
+    def count_columns(self, table_name, table):
+        """
+        Columns of table that are key columns of the table table_name, see aggregate_table()
+        """
+        return tuple(column_name for column_name in table.columns
+                     if table_name + self.delimiter + str(column_name) in self.key_columns)
+
+    def cached(self, key, compute):
+        """
+        The artifact of the cache with key, computed and kept when it is not there
+        """
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        value = compute()
+        self.cache[key] = value
+        while len(self.cache) > ARTIFACT_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return value
 
     def get_names(self, tableCol):
         """
@@ -41,70 +214,100 @@ class Aggregator(object):
         Output:
             result: Pandas.DataFrame, big featurized table (join)
         """
-        maximum_allow_table_size = 3 * pow(10,7)
         table_name, key_column_name = self.get_names(curt_table)
         k_tables = self.get_forward_tables(table_name)
         if self.verbose: _logger.info ("current forward tables: {}".format(k_tables))
         result = self.tables[table_name]
 
         table_name_set = {}  # prevent: same table (name) happen; key is table name; value if the number of occurence
+        joins = {}  # key: table_key; value: (foreign table name, foreign table key, central table key, source)
         for table_key in k_tables:
-            if self.verbose: _logger.info ("current forward table: {}".format(table_key))
             foreign_table_name = re.split(self.delimiter, table_key)[0] + self.delimiter[:-1]
             if (foreign_table_name in table_name_set.keys()):
                 table_name_set[foreign_table_name] += 1
                 foreign_table_name += str(table_name_set[foreign_table_name])
             else:
                 table_name_set[foreign_table_name] = 0
-
             foreign_table_key = re.split(self.delimiter, table_key)[1]
-            table = self.backward(table_key)
-            table_size = table.shape[0] * table.shape[1]
-            # only continue when the target join table size is less than the maximum allow table size
-            if (table_size > maximum_allow_table_size):
+            # join back to central table, need to find the corresponding column name
+            central_table_key = self.get_corresponding_column_name(table_name, table_key)
+            joins[table_key] = (foreign_table_name, foreign_table_key, central_table_key, self.backward_source(table_key))
+
+        def plan():
+            estimates = []
+            for table_key, (foreign_table_name, foreign_table_key, central_table_key, source) in joins.items():
+                table = self.backward(table_key)
+                counts = self.cached(('counts', foreign_table_key) + source, table[foreign_table_key].value_counts)
+                estimates.append((table_key, join_cardinality(result[central_table_key], counts), table.size))
+            return plan_joins(len(result), estimates, self.max_row_growth)
+
+        aggregates = {}  # key column of the central table -> aggregates to join on it
+        steps = self.cached(('plan', curt_table) + tuple(source for *_, source in joins.values()), plan)
+        for table_key, aggregate in steps:
+            if self.verbose: _logger.info ("current forward table: {}".format(table_key))
+            foreign_table_name, foreign_table_key, central_table_key, source = joins[table_key]
+            if self.verbose: _logger.info("central_table_key is: {}".format(central_table_key)) # name of primary-foreign key
+            if self.verbose: _logger.info("foreign_table_key is: {}".format(foreign_table_key))
+            if aggregate:
+                _logger.info("Joining %s would give too many rows, joining its aggregates instead.", table_key)
+                table = self.backward(table_key)
+                count_columns = self.count_columns(self.get_names(table_key)[0], table)
+                aggregates.setdefault(central_table_key, []).append(self.cached(
+                    ('aggregate', foreign_table_name, foreign_table_key, count_columns) + source,
+                    lambda: aggregate_table(table, foreign_table_key, foreign_table_name, count_columns)))
+                continue
+
+            def index_table():
+                table = self.backward(table_key)
                 if self.verbose: _logger.info ("backward finished")
                 table = table.rename(columns = lambda x : foreign_table_name+"_"+x)
                 ## DEBUG code: check the intermediate tables
                 if self.verbose: table.to_csv("./backwarded_table_"+foreign_table_name, index=False)
+                return table.set_index(foreign_table_name+"_"+foreign_table_key)
 
-                # join back to central table, need to find the corresponding column name
-                central_table_key = self.get_corresponding_column_name(table_name, table_key)
-                if self.verbose: _logger.info("central_table_key is: {}".format(central_table_key)) # name of primary-foreign key
-                if self.verbose: _logger.info("foreign_table_key is: {}".format(foreign_table_key))
-                table_reindex = table.set_index(foreign_table_name+"_"+foreign_table_key)
-                result_reindex = result.set_index(central_table_key)
-                result_return = result_reindex.join(other=table_reindex, rsuffix="_COPY")
+            table_reindex = self.cached(('index', foreign_table_name, foreign_table_key) + source, index_table)
+            result = result.join(other=table_reindex, on=central_table_key, rsuffix="_COPY")
 
-        return result_return
+        return join_aggregates(result, aggregates)
 
+    def backward_source(self, curt_table):
+        """
+        Input:
+            curt_table: String, name of table. eg. `account.csv_account_id`
+        Output:
+            tuple, the key column and the fingerprints of the tables backward() joins for it
+        """
+        central_table_name, column_name = self.get_names(curt_table)
+        table_names = [central_table_name] + [self.get_names(table_key)[0]
+                                              for table_key in self.get_backward_tables(central_table_name)]
+        return (curt_table,) + tuple(self.fingerprint(table_name) for table_name in table_names)
 
     def backward(self, curt_table):
         """
         Input:
             curt_table: String, name of table. eg. `account.csv_account_id`
         Output:
-            result: Pandas.DataFrame, big featurized table (join of groupby count)
+            result: Pandas.DataFrame, big featurized table (join of the aggregates of the backward tables)
         """
+        return self.cached(('backward',) + self.backward_source(curt_table), lambda: self._backward(curt_table))
+
+    def _backward(self, curt_table):
         central_table_name, column_name = self.get_names(curt_table)
         k_tables = self.get_backward_tables(central_table_name)
         result = self.tables[central_table_name]
         if self.verbose:
             _logger.info ("backward tables: {}".format(k_tables))
 
+        aggregates = {}  # key column of the central table -> aggregates to join on it
         for table_key in k_tables:
-            # aggregated result of : groupby + count()
             if self.verbose: _logger.info ("current backward table: {}".format(table_key))
             table_name, column_name = self.get_names(table_key)
-            table = self.tables[table_name]
-            rr = table.groupby(column_name).count()      # after groupby count(), the index of r will be `column_name` automatically
-            rr = rr.rename(columns = lambda x : table_name+"_"+x+"_COUNT")
-            #result = result.rename(columns = lambda x : table_name+"_"+x)
             # join back to central table, need to find the corresponding column name
             central_table_key = self.get_corresponding_column_name(central_table_name, table_key)
             if self.verbose: _logger.info("central_table_key is: {}".format(central_table_key)) # name of primary-foreign key
-            result = result.join(other=rr, on=central_table_key) # no need to set_index for r, because its index is alreayd column_name
+            aggregates.setdefault(central_table_key, []).append(self.aggregate(table_name, column_name))
 
-        return result
+        return join_aggregates(result, aggregates)
 
     def backward_new(self, curt_table):
         """
@@ -117,30 +320,62 @@ class Aggregator(object):
         k_tables = self.get_backward_tables(central_table_name)
         result = self.tables[central_table_name]
         result = result.rename(columns = lambda x : central_table_name + "_" + x)
+        primary_key_column_name = central_table_name + "_" + central_column_name
+        aggregates = {}  # key column of the central table -> aggregates to join on it
 
         if self.verbose:
             _logger.info ("backward tables: {}".format(k_tables))
 
-        for table_key in k_tables:
-            # aggregated result of : groupby + count()
+        def plan():
+            estimates = []
+            for table_key in k_tables:
+                table_name, column_name = self.get_names(table_key)
+                table = self.tables[table_name]
+                counts = self.cached(('counts', table_key, self.fingerprint(table_name)),
+                                     table[column_name].value_counts)
+                estimates.append((table_key, join_cardinality(result[primary_key_column_name], counts), table.size))
+            return plan_joins(len(result), estimates, self.max_row_growth)
+
+        sources = tuple((table_key, self.fingerprint(self.get_names(table_key)[0])) for table_key in k_tables)
+        for table_key, aggregate in self.cached(('plan', curt_table) + sources, plan):
             if self.verbose: _logger.info ("current backward table: {}".format(table_key))
             table_name, column_name = self.get_names(table_key)
-            table = self.tables[table_name]
-            primary_key_column_name = central_table_name + "_" + central_column_name
+            if aggregate:
+                _logger.info("Joining %s would give too many rows, joining its aggregates instead.", table_key)
+                aggregates.setdefault(primary_key_column_name, []).append(self.aggregate(table_name, column_name))
+                continue
+
+            def index_table():
+                # The backward table may use a different name
+                # foreign_key_column_name = table_name + "_" + central_column_name
+                foreign_key_column_name = table_name + "_" + column_name
 
-            # The backward table may use a different name
-            # foreign_key_column_name = table_name + "_" + central_column_name
-            foreign_key_column_name = table_name + "_" + column_name
+                table = self.tables[table_name]
+                table = table.rename(columns = lambda x : table_name + "_" + x)
+                table = table.rename(columns = {foreign_key_column_name : primary_key_column_name})
+                return table.set_index(primary_key_column_name)
 
-            table = table.rename(columns = lambda x : table_name + "_" + x)
-            table = table.rename(columns = {foreign_key_column_name : primary_key_column_name})
-            table = table.set_index(primary_key_column_name)
+            table = self.cached(('index', table_key, primary_key_column_name, self.fingerprint(table_name)),
+                                index_table)
             # join back to central table, need to find the corresponding column name
             #central_table_key = self.get_corresponding_column_name(central_table_name, table_key)
             if self.verbose: _logger.info("central_table_key is: {}".format(central_column_name)) # name of primary-foreign key
             result = result.join(other=table,on = primary_key_column_name, rsuffix="_COPY", how = "left")
             result = result.rename(columns = {primary_key_column_name+"_COPY" : primary_key_column_name})
-        return result
+        return join_aggregates(result, aggregates)
+
+    def aggregate(self, table_name, column_name):
+        """
+        Input:
+            table_name: String, eg. `loan.csv`
+            column_name: String, key column of the table, eg. `account_id`
+        Output:
+            Pandas.DataFrame, aggregates of the table per key value, see aggregate_table()
+        """
+        table = self.tables[table_name]
+        count_columns = self.count_columns(table_name, table)
+        return self.cached(('aggregate', table_name, column_name, count_columns, self.fingerprint(table_name)),
+                           lambda: aggregate_table(table, column_name, table_name, count_columns))
 
     def get_corresponding_column_name(self, table1, table2_col):
         """
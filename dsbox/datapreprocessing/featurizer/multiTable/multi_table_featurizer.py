@@ -1,6 +1,8 @@
+import collections
 import logging
 import re
 import time
+import typing
 
 import stopit  # type: ignore
 import pandas as pd
@@ -11,7 +13,8 @@ from d3m.metadata import hyperparams
 from d3m import container
 from d3m.metadata import base as metadata_base
 
-from .helper import Aggregator
+from .helper import ARTIFACT_CACHE_SIZE, Aggregator, fingerprint
+from .relation_matrix_all import discover_foreign_keys
 from . import config
 
 Inputs = container.Dataset
@@ -26,12 +29,39 @@ class MultiTableFeaturizationHyperparams(hyperparams.Hyperparams):
         semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
         description="Display the track of detail processing steps or not",
     )
+    discover_relations = hyperparams.Hyperparameter[bool](
+        default=False,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="When the metadata has no foreign key, find the relations from the values: a column, other than "
+                    "a key or a target, whose values are values of a primary key column of another table, other than "
+                    "its d3mIndex, refers to it",
+    )
+    relation_containment = hyperparams.Bounded[float](
+        lower=0,
+        upper=1,
+        default=1.0,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Smallest share of the distinct values of a column found in a key column for it to be a "
+                    "discovered foreign key",
+    )
+    max_row_growth = hyperparams.Bounded[float](
+        lower=1,
+        upper=None,
+        default=1.0,
+        semantic_types=['https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+        description="Largest ratio of the rows of a join to the rows of the table joined to, estimated from the key "
+                    "counts. A table whose join would give more rows is aggregated per key value before it is joined",
+    )
 
 
 class MultiTableFeaturization(FeaturizationTransformerPrimitiveBase[Inputs, Outputs, MultiTableFeaturizationHyperparams]):
     """
     Generate a featurized table from multiple-table dataset using aggregation. It will automatically detect foriegn key
     relationships among multiple tables, and join the tables into one table using aggregation.
+
+    The relations, the join plan and the aggregates of the joined tables are kept between produce calls, by the
+    column names, the column metadata and the content of the tables, so that producing on new rows of the main table, as at test time,
+    only joins these rows.
     """
     __author__ = 'USC ISI'
     metadata = hyperparams.base.PrimitiveMetadata({
@@ -66,6 +96,11 @@ class MultiTableFeaturization(FeaturizationTransformerPrimitiveBase[Inputs, Outp
         self._has_finished = False
         self._iterations_done = False
         self._verbose = self.hyperparams['VERBOSE']
+        # key: column names and metadata of the tables; value: main resource id, column metadata, relations and, when
+        # they were discovered from the values, the fingerprints of the tables they were discovered from. Least
+        # recently used dropped, as the artifacts of the Aggregator.
+        self._relations_cache: collections.OrderedDict = collections.OrderedDict()
+        self._artifacts: collections.OrderedDict = collections.OrderedDict()  # see Aggregator
 
     def produce(self, *, inputs: Inputs, timeout: float = None, iterations: int = None) -> CallResult[Outputs]:
 
@@ -96,7 +131,102 @@ class MultiTableFeaturization(FeaturizationTransformerPrimitiveBase[Inputs, Outp
         core calculations
         """
         data = inputs.copy()
+        fingerprints: typing.Dict[str, str] = {}  # key: resource id; value: fingerprint, computed once per call
+
+        def table_fingerprint(resource_id):
+            if resource_id not in fingerprints:
+                fingerprints[resource_id] = fingerprint(data[resource_id])
+            return fingerprints[resource_id]
+
+        schema = self._schema(inputs, data)
+        cached = self._relations_cache.get(schema)
+        if cached is not None and all(table_fingerprint(resource_id) == value
+                                      for resource_id, value in cached[3].items()):
+            self._relations_cache.move_to_end(schema)
+            main_resource_id, all_metadata, relations, _ = cached
+        else:
+            main_resource_id, all_metadata, relations, discovered = self._find_relations(inputs, data)
+            sources = {}
+            if discovered:
+                sources = {resource_id: table_fingerprint(resource_id)
+                           for resource_id in data.keys() if resource_id != main_resource_id}
+            self._relations_cache[schema] = (main_resource_id, all_metadata, relations, sources)
+            self._relations_cache.move_to_end(schema)
+            while len(self._relations_cache) > ARTIFACT_CACHE_SIZE:
+                self._relations_cache.popitem(last=False)
+
+        # if no foreign key relationships found, return inputs directly
+        if len(relations) == 0:
+            _logger.info("No table-based foreign_key relationship found in the dataset, will return the original dataset.")
+            _logger.info("[INFO] No table-based foreign_key relationship found in the dataset, will return the original dataset.")
+            return inputs
+
+        # step 3: featurization
+        start = time.clock()
+        _logger.info("[INFO] Multi-table join start.")
+        # the primary keys and the row index are aggregated by their count only
+        key_columns = {
+            resource_column_name for resource_column_name, column_metadata in all_metadata.items()
+            if 'https://metadata.datadrivendiscovery.org/types/PrimaryKey' in column_metadata.get('semantic_types', ())
+            or column_metadata.get('name') == 'd3mIndex'
+        }
+        aggregator = Aggregator(relations, data, self._verbose, self.hyperparams['max_row_growth'],
+                                self._artifacts, fingerprints, key_columns)
+        for each_relation in relations:
+            # if the target table found in second placfe of the set
+            if main_resource_id in each_relation[1]:
+                big_table = aggregator.backward_new(each_relation[1])
+                break
+            # if the target table found in first placfe of the set
+            if main_resource_id in each_relation[0]:
+                big_table = aggregator.forward(each_relation[0])
+                break
+        finish = time.clock()
+        _logger.info("[INFO] Multi-table join finished, totally take ", finish-start, 'seconds.')
+        big_table = container.DataFrame(pd.DataFrame(big_table), generate_metadata=True)
+        # add back metadata
+        for index in range(len(big_table.columns)):
+            if big_table.columns[index] in all_metadata:
+                old_metadata = all_metadata[big_table.columns[index]]
+            else:
+                # aggregate of a child table
+                dtype = big_table.dtypes.iloc[index]
+                if pd.api.types.is_integer_dtype(dtype):
+                    column_type = 'http://schema.org/Integer'
+                elif pd.api.types.is_numeric_dtype(dtype):
+                    column_type = 'http://schema.org/Float'
+                else:
+                    column_type = 'http://schema.org/Text'
+                old_metadata = {'semantic_types': (column_type,
+                                                   'https://metadata.datadrivendiscovery.org/types/Attribute')}
+            big_table.metadata = big_table.metadata.update((metadata_base.ALL_ELEMENTS, index), old_metadata)
+
+        # import pdb
+        # pdb.set_trace()
+        return big_table
+
+    @staticmethod
+    def _schema(inputs: Inputs, data: Inputs) -> tuple:
+        """
+        What the relations are found from, frozen and hashable: per resource, its column names, its semantic types and
+        the metadata of every column, but not the number of rows
+        """
+        return tuple(
+            (resource_id,
+             tuple(data[resource_id].columns),
+             inputs.metadata.query((resource_id,)).get('semantic_types', ()),
+             tuple(inputs.metadata.query((resource_id, metadata_base.ALL_ELEMENTS, column_index))
+                   for column_index in range(data[resource_id].shape[1])))
+            for resource_id in data.keys())
+
+    def _find_relations(self, inputs: Inputs, data: Inputs) -> tuple:
+        """
+        main resource id, metadata of every column by resource_id+"_"+column name, relations and whether they were
+        discovered from the values
+        """
+        main_resource_id = None
         relations = []
+        discovered = False
         # step 1: Generate the relation sets
         # search in each dataset and find the foreign key relationship
         all_metadata = {}
@@ -135,11 +265,28 @@ class MultiTableFeaturization(FeaturizationTransformerPrimitiveBase[Inputs, Outp
                     each_relation = (target_column_name, resource_column_name)
                     relations.append(each_relation)
 
-        # if no foreign key relationships found, return inputs directly
-        if len(relations) == 0:
-            _logger.info("No table-based foreign_key relationship found in the dataset, will return the original dataset.")
-            _logger.info("[INFO] No table-based foreign_key relationship found in the dataset, will return the original dataset.")
-            return inputs
+        if len(relations) == 0 and self.hyperparams['discover_relations']:
+            discovered = True
+            # only primary keys are referenced, but not the row index every table has
+            primary_keys = {
+                resource_column_name for resource_column_name, column_metadata in all_metadata.items()
+                if 'https://metadata.datadrivendiscovery.org/types/PrimaryKey' in
+                column_metadata.get('semantic_types', ()) and column_metadata.get('name') != 'd3mIndex'
+            }
+            # a primary key or a target is not a foreign key, even if its values happen to be in a key column
+            not_foreign_keys = {
+                'https://metadata.datadrivendiscovery.org/types/PrimaryKey',
+                'https://metadata.datadrivendiscovery.org/types/Target',
+                'https://metadata.datadrivendiscovery.org/types/TrueTarget',
+                'https://metadata.datadrivendiscovery.org/types/SuggestedTarget',
+            }
+            relations = [
+                (target_column_name, resource_column_name)
+                for target_column_name, resource_column_name in discover_foreign_keys(
+                    data, self.hyperparams['relation_containment'], referenced_keys=primary_keys)
+                if not not_foreign_keys.intersection(all_metadata[resource_column_name].get('semantic_types', ()))
+            ] if primary_keys else []
+            _logger.info("Discovered %d foreign key relations from the values.", len(relations))
 
         # step 2.5: a fix (based on the problem occurred in `uu3_world_development_indicators` dataset)
         if _logger.getEffectiveLevel() <= 10:
@@ -155,31 +302,7 @@ class MultiTableFeaturization(FeaturizationTransformerPrimitiveBase[Inputs, Outp
             _logger.debug('Corrected Relations')
             for target_column_name, resource_column_name in relations:
                 _logger.debug('  Target_column=%s Resource_column=%s', target_column_name, resource_column_name)
-
-        # step 3: featurization
-        start = time.clock()
-        _logger.info("[INFO] Multi-table join start.")
-        aggregator = Aggregator(relations, data, self._verbose)
-        for each_relation in relations:
-            # if the target table found in second placfe of the set
-            if main_resource_id in each_relation[1]:
-                big_table = aggregator.backward_new(each_relation[1])
-                break
-            # if the target table found in first placfe of the set
-            if main_resource_id in each_relation[0]:
-                big_table = aggregator.forward(each_relation[0])
-                break
-        finish = time.clock()
-        _logger.info("[INFO] Multi-table join finished, totally take ", finish-start, 'seconds.')
-        big_table = container.DataFrame(pd.DataFrame(big_table), generate_metadata=True)
-        # add back metadata
-        for index in range(len(big_table.columns)):
-            old_metadata = all_metadata[big_table.columns[index]]
-            big_table.metadata = big_table.metadata.update((metadata_base.ALL_ELEMENTS, index), old_metadata)
-
-        # import pdb
-        # pdb.set_trace()
-        return big_table
+        return main_resource_id, all_metadata, relations, discovered
 
     def _relations_correction(self, relations):
         """
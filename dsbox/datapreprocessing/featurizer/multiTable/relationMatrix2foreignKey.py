@@ -49,8 +49,6 @@ def relationMat2foreignKey(dataset, relation_matrix):
             val = relation_matrix[col_i][col_j]
             #val_opp = relation_matrix[col_j][col_i]
             if (val == 1):
-                import pdb
-                pdb.set_trace()
                 # one hard-coded rule appied here: master_col should contains no nan values, no duplicates
                 split = re.split("_", col_i)
                 filename = split[0]
@@ -1,59 +1,224 @@
-import pandas as pd
-from os import listdir
+import logging
 import time
+import typing
+
+import numpy as np
+import pandas as pd
 from d3m import container
-import logging
+
 Inputs = container.Dataset
 _logger = logging.getLogger(__name__)
 
-def get_relation_matrix(data:Inputs, relations: tuple):
+# number of smallest value hashes kept per column to rule out pairs before the exact check
+SKETCH_SIZE = 256
+# dependent columns compared with all the columns of their kind at a time, bounds the memory of the pruning
+PRUNING_CHUNK_SIZE = 1024
+
+_MAX_HASH = np.iinfo(np.uint64).max
+
+
+class ColumnProfile(typing.NamedTuple):
+    """
+    A column as seen by the inclusion dependency search: its key (table + "_" + column name), its table, the kind of
+    its values (columns of different kinds are never compared) and the sorted unique hashes of its non-null values.
     """
-    Parameter: 
-    tables_names: list of strings, the other table file names
+    key: str
+    table: str
+    kind: str
+    hashes: np.ndarray
+    rows: int
 
-    Return:
-    relation_matrix
+
+def _kind(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'number'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    return 'text'
+
+
+def column_profile(table: str, column_name: str, column: pd.Series) -> ColumnProfile:
+    kind = _kind(column.dtype)
+    values = column.dropna().values
+    if kind == 'number':
+        # so that 1 and 1.0 are the same value
+        values = values.astype(np.float64)
+    elif kind == 'text':
+        values = np.asarray(values, dtype=object)
+    hashes = np.unique(pd.util.hash_array(values)) if len(values) else np.empty(0, dtype=np.uint64)
+    return ColumnProfile(table + "_" + str(column_name), table, kind, hashes, len(column))
+
+
+def column_profiles(data: Inputs) -> typing.List[ColumnProfile]:
+    profiles = []
+    for table, frame in data.items():
+        if not isinstance(frame, pd.DataFrame):
+            continue
+        for column_index, column_name in enumerate(frame.columns):
+            profiles.append(column_profile(table, column_name, frame.iloc[:, column_index]))
+    return profiles
+
+
+def containment(dependent: np.ndarray, referenced: np.ndarray) -> float:
+    """
+    Share of the sorted unique values of dependent found in the sorted unique values of referenced.
+    """
+    if len(dependent) == 0 or len(referenced) == 0:
+        return 0.0
+    positions = np.searchsorted(referenced, dependent)
+    positions[positions == len(referenced)] = 0
+    return float(np.count_nonzero(referenced[positions] == dependent)) / len(dependent)
+
+
+def _sketch_allows(dependent: np.ndarray, referenced: np.ndarray, threshold: float) -> bool:
+    """
+    Whether the SKETCH_SIZE smallest hashes of the two columns allow a containment of at least threshold.
+
+    All the hashes of referenced below the largest one in its sketch are in the sketch, so the hashes of dependent
+    below it and below the largest one of its own sketch are a uniform sample of dependent whose containment is exact.
+    """
+    dependent_sketch = dependent[:SKETCH_SIZE]
+    referenced_sketch = referenced[:SKETCH_SIZE]
+    bound = min(dependent_sketch[-1] if len(dependent) > SKETCH_SIZE else _MAX_HASH,
+                referenced_sketch[-1] if len(referenced) > SKETCH_SIZE else _MAX_HASH)
+    sample = dependent_sketch[dependent_sketch <= bound]
+    if len(sample) == 0:
+        return True
+    found = containment(sample, referenced_sketch)
+    if threshold >= 1:
+        return found == 1
+    return found >= threshold - 2 / np.sqrt(len(sample))
+
+
+def _holding(hashes: np.ndarray, owners: np.ndarray, values: np.ndarray, columns: int) -> np.ndarray:
+    """
+    Matrix of whether column j holds values[i], from the sorted hashes of all the columns and the column of each.
+    """
+    first = np.searchsorted(hashes, values, 'left')
+    counts = np.searchsorted(hashes, values, 'right') - first
+    rows = np.repeat(np.arange(len(values)), counts)
+    # positions first[i], first[i] + 1, ... first[i] + counts[i] - 1 for every i
+    positions = np.arange(len(rows)) + np.repeat(first - np.cumsum(counts) + counts, counts)
+    held = np.zeros((len(values), columns), dtype=bool)
+    held[rows, owners[positions]] = True
+    return held
+
+
+def _candidate_pairs(profiles: typing.List[ColumnProfile], threshold: float, min_distinct: int,
+                     referenced_keys: typing.Optional[typing.Set[str]]) -> typing.Iterator[typing.Tuple[int, int]]:
+    """
+    Pairs (dependent, referenced) of columns of the same kind, in different tables, whose number of distinct values
+    and, for a full inclusion, whose smallest and largest hashes allow the inclusion.
+    """
+    by_kind: typing.Dict[str, typing.List[int]] = {}
+    for index, profile in enumerate(profiles):
+        if len(profile.hashes) >= min_distinct:
+            by_kind.setdefault(profile.kind, []).append(index)
+
+    for members in by_kind.values():
+        members = np.array(members)
+        tables = np.array([profiles[i].table for i in members], dtype=object)
+        _, tables = np.unique(tables, return_inverse=True)
+        distinct = np.array([len(profiles[i].hashes) for i in members])
+        lowest = np.array([profiles[i].hashes[0] for i in members], dtype=np.uint64)
+        highest = np.array([profiles[i].hashes[-1] for i in members], dtype=np.uint64)
+        referable = np.array([referenced_keys is None or profiles[i].key in referenced_keys for i in members])
+        if threshold >= 1:
+            # all the hashes of the referable columns, sorted, to find the columns holding a given hash
+            hashes = [profiles[i].hashes if referable[position] else profiles[i].hashes[:0]
+                      for position, i in enumerate(members)]
+            owners = np.repeat(np.arange(len(members)), [len(column_hashes) for column_hashes in hashes])
+            hashes = np.concatenate(hashes)
+            order = np.argsort(hashes, kind='mergesort')
+            hashes = hashes[order]
+            owners = owners[order]
+
+        for start in range(0, len(members), PRUNING_CHUNK_SIZE):
+            rows = slice(start, start + PRUNING_CHUNK_SIZE)
+            allowed = ((tables[rows, None] != tables[None, :]) & referable[None, :] &
+                       (distinct[None, :] >= threshold * distinct[rows, None]))
+            if threshold >= 1:
+                # a referenced column holds the smallest and the largest hash of the dependent one
+                allowed &= _holding(hashes, owners, lowest[rows], len(members))
+                allowed &= _holding(hashes, owners, highest[rows], len(members))
+            for dependent, referenced in zip(*np.nonzero(allowed)):
+                yield members[start + dependent], members[referenced]
+
+
+def find_inclusion_dependencies(data: Inputs, threshold: float = 1.0, min_distinct: int = 2,
+                                profiles: typing.List[ColumnProfile] = None,
+                                referenced_keys: typing.Set[str] = None) -> typing.List[typing.Tuple[str, str, float]]:
+    """
+    Inclusion dependencies between the columns of different tables: (dependent, referenced, containment) for every
+    pair of columns of the same kind where at least threshold of the distinct values of dependent are values of
+    referenced. Columns with fewer than min_distinct distinct values are left out, and only the columns in
+    referenced_keys, if given, are referenced.
+
+    The pairs are pruned by kind and number of distinct values and, for a full inclusion, by whether the referenced
+    column holds the smallest and the largest hash of the dependent one. A sketch of the smallest hashes of each
+    column rules out more pairs, and only the remaining ones are checked exactly.
     """
-    
     start_time = time.time()
+    if profiles is None:
+        profiles = column_profiles(data)
+    _logger.info("=====>> %d columns profiled: %s", len(profiles), time.time() - start_time)
+
+    dependencies = []
+    candidates = 0
+    for dependent, referenced in _candidate_pairs(profiles, threshold, min_distinct, referenced_keys):
+        candidates += 1
+        dependent_hashes = profiles[dependent].hashes
+        referenced_hashes = profiles[referenced].hashes
+        if not _sketch_allows(dependent_hashes, referenced_hashes, threshold):
+            continue
+        value = containment(dependent_hashes, referenced_hashes)
+        if value >= threshold:
+            dependencies.append((profiles[dependent].key, profiles[referenced].key, value))
+    _logger.info("=====>> %d inclusion dependencies out of %d candidate pairs: %s", len(dependencies), candidates,
+                 time.time() - start_time)
+    return dependencies
+
+
+def discover_foreign_keys(data: Inputs, threshold: float = 1.0, min_distinct: int = 2,
+                          referenced_keys: typing.Set[str] = None) -> typing.List[typing.Tuple[str, str]]:
+    """
+    Foreign key relations found from the values, in the format of the relations of the multi-table featurizer:
+    (referenced column, foreign key column). The referenced column has to be a key of its table, without duplicates
+    nor missing values, one of referenced_keys if given, and to contain at least threshold of the distinct values of
+    the foreign key column.
+    """
+    profiles = column_profiles(data)
+    unique = {profile.key for profile in profiles if len(profile.hashes) == profile.rows and
+              (referenced_keys is None or profile.key in referenced_keys)}
+    return [(referenced, dependent)
+            for dependent, referenced, _ in find_inclusion_dependencies(data, threshold, min_distinct, profiles, unique)]
+
+
+def get_relation_matrix(data: Inputs, relations: tuple = (), threshold: float = 1.0) -> pd.DataFrame:
+    """
+    Parameter:
+    data: the tables, by name
+    relations: known (referenced column, foreign key column) relations, set to 1 without being checked
+    threshold: the smallest containment kept in the matrix, the other cells are 0
+
+    Return:
+    relation_matrix: relation_matrix[i][j] is the share of the distinct values of column i found in column j
+    """
+    profiles = column_profiles(data)
+    relation_matrix_index = [profile.key for profile in profiles]
+    values = np.zeros((len(profiles), len(profiles)))
+    position = {key: index for index, key in enumerate(relation_matrix_index)}
+
+    for dependent, referenced, value in find_inclusion_dependencies(data, threshold, 1, profiles):
+        values[position[referenced], position[dependent]] = value
+    for referenced, dependent in relations:
+        if referenced in position and dependent in position:
+            values[position[referenced], position[dependent]] = 1.0
+
+    return pd.DataFrame(values, index=relation_matrix_index, columns=relation_matrix_index)
 
-    all_tables = data # dict, key: name; value : pandas.DataFrame
-    all_tables_col = {} # dict, key: table + "_" + col_name ; value : set of the column
-    #counter = 0
-
-    for x in all_tables.keys():
-        for col_name in all_tables[x].keys():
-            key = x + "_" + col_name
-            all_tables_colSet[key] = set(all_tables[x][col_name])
-
-    _logger.info("=====>> data readin finished: {}".format(time.time() - start_time))
-
-    # 1. define the relation_matrix: index and link
-    relation_matrix_index = list(all_tables_colSet.keys())  # list of columns name (index)
-    # source2index = {}         # dict, key: (table_name, col_name), value: index in matrix
-            
-    relation_matrix = pd.DataFrame(index=relation_matrix_index, columns=relation_matrix_index)
-    # 2. calculate
-    # table1 is assumed to be the master table, which will be columns_id in relation_matrix
-    for table1 in all_tables:
-        for table2 in all_tables:
-            start_time = time.time()
-            if (table1 == table2): continue
-            # compute all column pairs
-            for col_name1 in all_tables[table1].keys():
-                for col_name2 in all_tables[table2].keys():
-                    # col1 = all_tables[table1][col_name1]
-                    # col2 = all_tables[table2][col_name2]
-                    # i = source2index[(table1, col_name1)]
-                    # j = source2index[(table2, col_name2)]
-                    i = table1 + "_" + col_name1
-                    j = table2 + "_" + col_name2
-                    seti = all_tables_colSet[i]
-                    setj = all_tables_colSet[j]
-                    
-                    relation_matrix[i][j] = cal_relation_val_fromset(seti, setj)
-            _logger.info("=====>> {} vs {} finished: {}".format(table1, table2, time.time() - start_time))       
-    return relation_matrix
 
 def cal_relation_val_fromset(s_i, s_j):
     return len(s_i.intersection(s_j))/float(len(s_i))
@@ -0,0 +1,84 @@
+"""
+test program for Denormalize, a TransformerPrimitive joining the resources of a dataset
+"""
+import os
+import unittest
+
+import pandas as pd
+
+import d3m.metadata.base as mbase
+from d3m import container
+from d3m.container.dataset import D3MDatasetLoader
+
+from dsbox.datapreprocessing.cleaner.denormalize import Denormalize, DenormalizeHyperparams as hyper_DE
+
+# global variables
+dataset_file_path = "dsbox/unit_tests/resources/two_table_data/datasetDoc.json"
+
+dataset = D3MDatasetLoader()
+dataset = dataset.load('file://{dataset_doc_path}'.format(dataset_doc_path=os.path.abspath(dataset_file_path)))
+
+
+class TestDenormalize(unittest.TestCase):
+
+    def produce(self, **hyperparams):
+        primitive = Denormalize(hyperparams=hyper_DE.defaults().replace(hyperparams))
+        return primitive.produce(inputs=dataset).value
+
+    def test_join(self):
+        """
+        every row gets the columns of the customer its foreign key refers to
+        """
+        result = self.produce()
+        self.assertEqual(list(result.keys()), ['learningData'])
+        table = result['learningData']
+        self.assertIsInstance(table, container.DataFrame)
+
+        customers = dataset['customers'].set_index('customerId')
+        self.assertEqual(table.shape, (dataset['learningData'].shape[0], 6))
+        for i in range(table.shape[0]):
+            customer = dataset['learningData']['customer'].iloc[i]
+            self.assertEqual(table.iloc[i, 1], customer)
+            self.assertEqual(table.iloc[i, 2], customers.loc[customer, 'city'])
+            self.assertEqual(table.iloc[i, 3], customers.loc[customer, 'age'])
+
+        # the joined key is no longer a primary key, but an attribute as the foreign key was
+        semantic_types = result.metadata.query(('learningData', mbase.ALL_ELEMENTS, 1))['semantic_types']
+        self.assertNotIn('https://metadata.datadrivendiscovery.org/types/PrimaryKey', semantic_types)
+        self.assertIn('https://metadata.datadrivendiscovery.org/types/Attribute', semantic_types)
+
+    def test_columnar(self):
+        """
+        the columnar mode should give the same table, types and metadata as the join by join mode
+        """
+        expected = self.produce()
+        result = self.produce(columnar=True)
+
+        expected_table = expected['learningData']
+        table = result['learningData']
+        self.assertEqual(type(table), type(expected_table))
+        pd.testing.assert_frame_equal(pd.DataFrame(table), pd.DataFrame(expected_table), check_names=False)
+
+        self.assertEqual(result.metadata.query(()), expected.metadata.query(()))
+        for selector in [('learningData',), ('learningData', mbase.ALL_ELEMENTS)]:
+            self.assertEqual(result.metadata.query(selector), expected.metadata.query(selector))
+        for column_index in range(table.shape[1]):
+            selector = ('learningData', mbase.ALL_ELEMENTS, column_index)
+            self.assertEqual(result.metadata.query(selector), expected.metadata.query(selector), msg=str(selector))
+
+    def test_keep_semantic_types(self):
+        """
+        the columns without any of keep_semantic_types are not materialized
+        """
+        result = self.produce(columnar=True, keep_semantic_types=(
+            'https://metadata.datadrivendiscovery.org/types/SuggestedTarget',
+            'https://metadata.datadrivendiscovery.org/types/PrimaryKey'))
+        table = result['learningData']
+        self.assertIsInstance(table, container.DataFrame)
+        self.assertEqual(table.shape, (dataset['learningData'].shape[0], 2))
+        self.assertEqual([result.metadata.query(('learningData', mbase.ALL_ELEMENTS, i))['name'] for i in range(2)],
+                         ['d3mIndex', 'class'])
+
+
+if __name__ == '__main__':
+    unittest.main()
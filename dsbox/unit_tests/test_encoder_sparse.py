@@ -0,0 +1,80 @@
+"""
+test program for the sparse output of Encoder, fed to IQRScaler
+"""
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import d3m.metadata.base as mbase
+from d3m.container.dataset import D3MDatasetLoader
+
+from dsbox.datapreprocessing.cleaner import Encoder, EncHyperparameter, IQRScaler, IQRHyperparams
+
+from dsbox.datapreprocessing.cleaner.denormalize import Denormalize, DenormalizeHyperparams as hyper_DE
+from common_primitives.dataset_to_dataframe import DatasetToDataFramePrimitive, Hyperparams as hyper_DD
+from common_primitives.extract_columns_semantic_types import ExtractColumnsBySemanticTypesPrimitive
+
+h_DE = hyper_DE.defaults()
+h_DD = hyper_DD.defaults()
+
+h_cat = {'semantic_types': ('https://metadata.datadrivendiscovery.org/types/CategoricalData',), 'use_columns': (), 'exclude_columns': ()}
+
+primitive_0 = Denormalize(hyperparams=h_DE)
+primitive_1 = DatasetToDataFramePrimitive(hyperparams=h_DD)
+
+primitive_3 = ExtractColumnsBySemanticTypesPrimitive(hyperparams=h_cat)
+
+# global variables
+dataset_file_path = "dsbox/unit_tests/resources/38_sick_data/datasetDoc.json"
+
+dataset = D3MDatasetLoader()
+dataset = dataset.load('file://{dataset_doc_path}'.format(dataset_doc_path=os.path.abspath(dataset_file_path)))
+
+result0 = primitive_0.produce(inputs=dataset)
+result1 = primitive_1.produce(inputs=result0.value)
+
+# the categorical attributes only, so that every column of the encoded frame is sparse
+X = primitive_3.produce(inputs=result1.value).value
+
+
+class TestEncoderSparse(unittest.TestCase):
+
+    def setUp(self):
+        self.enough_time = 100
+        encoder = Encoder(hyperparams=EncHyperparameter.defaults().replace({'output_type': 'sparse'}))
+        encoder.set_training_data(inputs=X)
+        encoder.fit(timeout=self.enough_time)
+        self.encoded = encoder.produce(inputs=X, timeout=self.enough_time).value
+
+    def test_structural_type(self):
+        """
+        the structural type of the sparse columns should be the type of their values
+        """
+        for index, column_name in enumerate(self.encoded.columns):
+            self.assertIsInstance(self.encoded.dtypes.iloc[index], pd.SparseDtype)
+            structural_type = self.encoded.metadata.query((mbase.ALL_ELEMENTS, index))['structural_type']
+            self.assertEqual(structural_type, np.uint8, msg="column: {}".format(column_name))
+            # the ones and the zeros (the fill value) alike
+            self.assertTrue(all(isinstance(value, structural_type) for value in self.encoded.iloc[:, index]),
+                            msg="column: {}".format(column_name))
+
+    def test_scaler(self):
+        """
+        IQRScaler should scale the sparse columns and label the results as floats
+        """
+        scaler = IQRScaler(hyperparams=IQRHyperparams.defaults())
+        scaler.set_training_data(inputs=self.encoded)
+        scaler.fit(timeout=self.enough_time)
+        result = scaler.produce(inputs=self.encoded, timeout=self.enough_time).value
+
+        self.assertEqual(result.shape, self.encoded.shape)
+        self.assertEqual(pd.isnull(result).sum().sum(), 0)
+        for index in range(result.shape[1]):
+            self.assertEqual(result.metadata.query((mbase.ALL_ELEMENTS, index))['structural_type'], float)
+            self.assertIsInstance(result.iloc[0, index], float)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+"""
+test program for importing the cleaner primitives, which d3m checks when each primitive class is defined
+"""
+import importlib
+import unittest
+
+from d3m.primitive_interfaces.base import PrimitiveBase
+
+
+class TestImport(unittest.TestCase):
+
+    def test_cleaner(self):
+        cleaner = importlib.import_module('dsbox.datapreprocessing.cleaner')
+        for name in cleaner.__all__:
+            value = getattr(cleaner, name)
+            if isinstance(value, type) and issubclass(value, PrimitiveBase):
+                # the primitive metadata is built from the public methods and their arguments
+                self.assertIn('python_path', value.metadata.query(), msg=name)
+
+
+if __name__ == '__main__':
+    unittest.main()
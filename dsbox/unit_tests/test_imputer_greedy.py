@@ -3,6 +3,10 @@ test program for GreedyImputation, a SupervisedLearnerPrimitive imputer
 """
 import sys
 import os
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from unittest import mock
 
 sys.path.append("../")
 
@@ -17,6 +21,7 @@ def text2int(col):
 import pandas as pd
 
 from dsbox.datapreprocessing.cleaner import GreedyImputation, GreedyHyperparameter
+from dsbox.datapreprocessing.cleaner import greedy
 
 # global variables
 from d3m.container.dataset import D3MDatasetLoader, Dataset, CSVLoader
@@ -74,6 +79,62 @@ class TestGreedy(unittest.TestCase):
         self.assertEqual(imputer._has_finished, True)
         self.assertEqual(imputer._iterations_done, True)
 
+    def test_n_jobs(self):
+        """
+        evaluating the strategies in parallel should select the same strategies as the serial search
+        """
+        results = []
+        for n_jobs in [1, 2]:
+            imputer = GreedyImputation(hyperparams=GreedyHyperparameter.defaults().replace({'n_jobs': n_jobs}))
+            imputer.set_training_data(inputs=X, outputs=Y)
+            imputer.fit(timeout=self.enough_time)
+            results.append(imputer.get_params()['greedy_strategy'])
+        self.assertEqual(results[0], results[1])
+
+    def test_sampled_evaluation(self):
+        """
+        evaluating on a sample, by k-fold and with successive halving should still pick a strategy for every column
+        """
+        imputer = GreedyImputation(hyperparams=GreedyHyperparameter.defaults().replace(
+            {'evaluation_sample_size': 1000, 'evaluation_method': 'kfold', 'successive_halving': True}))
+        imputer.set_training_data(inputs=X, outputs=Y)
+        imputer.fit(timeout=self.enough_time)
+        self.assertEqual(imputer._has_finished, True)
+        strategies = imputer.get_params()['greedy_strategy']
+        self.assertTrue(set(strategies.values()) <= {"mean", "max", "min", "zero"})
+
+    def test_short_timeout(self):
+        """
+        a search cut short by the timeout should keep the strategies found so far, the other columns get the mean
+        """
+        for n_jobs in [1, 2]:
+            imputer = GreedyImputation(hyperparams=GreedyHyperparameter.defaults().replace({'n_jobs': n_jobs}))
+            imputer.set_training_data(inputs=X, outputs=Y)
+            imputer.fit(timeout=0.5)
+            self.assertEqual(imputer._is_fitted, True)
+            strategies = imputer.get_params()['greedy_strategy']
+            self.assertTrue(set(strategies.values()) <= {"mean", "max", "min", "zero"})
+            self.assertIsNotNone(imputer.produce(inputs=X, timeout=self.enough_time).value)
+
+    def test_timeout_keeps_finished(self):
+        """
+        the combinations evaluated in parallel before the deadline keep their scores, the others score -inf
+        """
+        release = threading.Event()
+
+        def evaluate(imputation_list, size, state=None):
+            if imputation_list == ["slow"]:
+                release.wait(10)
+            return len(imputation_list[0])
+
+        imputer = GreedyImputation(hyperparams=GreedyHyperparameter.defaults())
+        imputer._deadline = time.time() + 1
+        with mock.patch.object(greedy, '_evaluate_imputation', evaluate), ThreadPool(2) as pool:
+            scores = imputer._GreedyImputation__evaluate_candidates([["slow"], ["mean"], ["zero"]], 10, None, pool)
+            release.set()
+        self.assertEqual(scores, [-float("inf"), 4, 4])
+        self.assertTrue(imputer._timed_out)
+
     # def test_run(self):
     #     """
     #     normal usage run test
@@ -1,85 +1,138 @@
-# """
-# test program for KNN, a TransformerPrimitive imputer
-# """
-# import sys
-#
-# sys.path.append("../")
-#
-#
-# def text2int(col):
-#     """
-#     convert column value from text to integer codes (0,1,2...)
-#     """
-#     return pd.DataFrame(col.astype('category').cat.codes, columns=[col.name])
-#
-#
-# import pandas as pd
-#
-# from dsbox.datapreprocessing.cleaner import KNNImputation, KnnHyperparameter
-#
-# # global variables
-# data_name = "data.csv"
-# label_name = "targets.csv"  # make sure your label target is in the second column of this file
-# data = pd.read_csv(data_name, index_col='d3mIndex')
-# missing_value_mask = pd.isnull(data)
-# label = text2int(pd.read_csv(label_name, index_col='d3mIndex')["Class"])
-# hp = KnnHyperparameter.sample()
-#
-# import unittest
-#
-#
-# class TestMean(unittest.TestCase):
-#
-#     def setUp(self):
-#         self.imputer = KNNImputation(hyperparams=hp)
-#
-#     def test_init(self):
-#         self.assertEqual(self.imputer._has_finished, False)
-#         self.assertEqual(self.imputer._iterations_done, False)
-#
-#     def test_run(self):
-#         result = self.imputer.produce(inputs=data, timeout=10).value
-#         self.helper_impute_result_check(data, result)
-#         self.assertEqual(self.imputer._has_finished, True)
-#         self.assertEqual(self.imputer._iterations_done, True)
-#
-#     def test_timeout(self):
-#         result = self.imputer.produce(inputs=data, timeout=0.0001).value
-#         self.assertEqual(self.imputer._has_finished, False)
-#         self.assertEqual(self.imputer._iterations_done, False)
-#
-#     def test_noMV(self):
-#         """
-#         test on the dataset has no missing values
-#         """
-#         result = self.imputer.produce(inputs=data, timeout=10).value
-#         result2 = self.imputer.produce(inputs=result, timeout=10).value  # result contains no missing value
-#
-#         self.assertEqual(result.equals(result2), True)
-#
-#     def helper_impute_result_check(self, data, result):
-#         """
-#         check if the imputed reuslt valid
-#         now, check for:
-#         1. contains no nan anymore
-#         2. orignal non-nan value should remain the same
-#         """
-#         # check 1
-#         self.assertEqual(pd.isnull(result).sum().sum(), 0)
-#
-#         # check 2
-#         # the original non-missing values must keep unchanged
-#         # to check, cannot use pd equals, since the imputer may convert:
-#         # 1 -> 1.0
-#         # have to do loop checking
-#         missing_value_mask = pd.isnull(data)
-#         for col_name in data:
-#             data_non_missing = data[~missing_value_mask[col_name]][col_name]
-#             result_non_missing = result[~missing_value_mask[col_name]][col_name]
-#             for i in data_non_missing.index:
-#                 self.assertEqual(data_non_missing[i] == result_non_missing[i], True,
-#                                  msg="not equals in column: {}".format(col_name))
-#
-#
-# if __name__ == '__main__':
-#     unittest.main()
+"""
+test program for KNNImputation, an UnsupervisedLearnerPrimitive imputer
+"""
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import d3m.metadata.base as mbase
+from d3m import container
+
+from dsbox.datapreprocessing.cleaner import KNNImputation, KnnHyperparameter
+from dsbox.datapreprocessing.cleaner import missing_value_pred as mvp
+
+ATTRIBUTE = 'https://metadata.datadrivendiscovery.org/types/Attribute'
+FLOAT = 'http://schema.org/Float'
+
+
+def make_table(rows, seed=0):
+    """
+    a d3mIndex, three correlated numeric attributes and a text attribute, with metadata
+    """
+    random = np.random.RandomState(seed)
+    base = random.randn(rows)
+    frame = pd.DataFrame({
+        'd3mIndex': np.arange(rows),
+        'x0': base + 0.1 * random.randn(rows),
+        'x1': 2 * base + 0.1 * random.randn(rows),
+        'x2': random.randn(rows),
+        'name': random.choice(['a', 'b', 'c'], rows),
+    })
+    data = container.DataFrame(frame, generate_metadata=True)
+    data.metadata = data.metadata.add_semantic_type((mbase.ALL_ELEMENTS, 0),
+                                                    'https://metadata.datadrivendiscovery.org/types/PrimaryKey')
+    for col in (1, 2, 3):
+        data.metadata = data.metadata.add_semantic_type((mbase.ALL_ELEMENTS, col), FLOAT)
+    for col in (1, 2, 3, 4):
+        data.metadata = data.metadata.add_semantic_type((mbase.ALL_ELEMENTS, col), ATTRIBUTE)
+    return data
+
+
+def with_missing(data, cells):
+    """
+    a copy of data with the cells (rows, column) missing
+    """
+    result = data.copy()
+    for rows, col in cells:
+        result.iloc[rows, col] = np.nan
+    return result
+
+
+def brute_force(train, test, k):
+    """
+    the inverse distance weighted mean of the k nearest complete training rows, over the features each row has
+    """
+    reference = train[~np.isnan(train).any(axis=1)]
+    result = test.copy()
+    for row in np.flatnonzero(np.isnan(test).any(axis=1)):
+        observed = ~np.isnan(test[row])
+        distances = np.sqrt(np.square(reference[:, observed] - test[row, observed]).sum(axis=1))
+        nearest = np.argsort(distances)[:k]
+        weights = 1 / np.maximum(distances[nearest], 1e-6)
+        result[row, ~observed] = (weights / weights.sum()).dot(reference[nearest][:, ~observed])
+    return result
+
+
+class TestKNN(unittest.TestCase):
+
+    def setUp(self):
+        self.enough_time = 100
+        self.train = with_missing(make_table(500), [(slice(0, 500, 10), 2)])
+        # 150 rows missing x0 share a pattern and are searched with the KD-tree, the few others blockwise
+        self.test = with_missing(make_table(300, seed=1), [(slice(0, 150), 1), (slice(150, 160), 2),
+                                                           (slice(160, 165), 3), (slice(165, 170), 1),
+                                                           (slice(165, 170), 2)])
+
+    def impute(self, train, test, **hyperparams):
+        imputer = KNNImputation(hyperparams=KnnHyperparameter.defaults().replace(hyperparams))
+        imputer.set_training_data(inputs=train)
+        imputer.fit(timeout=self.enough_time)
+        self.assertTrue(imputer._has_finished)
+        return imputer.produce(inputs=test, timeout=self.enough_time).value
+
+    def numbers(self, data):
+        return data.iloc[:, [1, 2, 3]].values.astype(float)
+
+    def test_run(self):
+        result = self.impute(self.train, self.test)
+        self.assertEqual(result.shape, self.test.shape)
+        self.assertEqual(pd.isnull(result).sum().sum(), 0)
+
+        # the observed cells, and the columns that are not numeric attributes, are kept
+        observed = ~pd.isnull(self.test).values
+        self.assertTrue((result.values[observed] == self.test.values[observed]).all())
+        self.assertEqual(result.metadata.query((mbase.ALL_ELEMENTS, 4)),
+                         self.test.metadata.query((mbase.ALL_ELEMENTS, 4)))
+
+    def test_paths(self):
+        """
+        the KD-tree and the blockwise search find the same neighbours as a brute force search
+        """
+        expected = brute_force(self.numbers(self.train), self.numbers(self.test), 5)
+        np.testing.assert_allclose(self.numbers(self.impute(self.train, self.test)), expected)
+        with mock.patch.object(mvp, 'KD_TREE_MIN_ROWS', len(self.test) + 1):
+            np.testing.assert_allclose(self.numbers(self.impute(self.train, self.test)), expected)
+
+    def test_chunk_size(self):
+        expected = self.numbers(self.impute(self.train, self.test))
+        for chunk_size in (1, 7, 64):
+            np.testing.assert_allclose(self.numbers(self.impute(self.train, self.test, chunk_size=chunk_size)),
+                                       expected, err_msg="chunk_size={}".format(chunk_size))
+
+    def test_no_complete_rows(self):
+        """
+        without a complete training row, the missing cells get the means of the training columns
+        """
+        train = with_missing(make_table(100), [(slice(0, 100, 2), 1), (slice(1, 100, 2), 2)])
+        result = self.impute(train, self.test)
+        means = np.nanmean(self.numbers(train), axis=0)
+        missing = pd.isnull(self.test.iloc[:, [1, 2, 3]]).values
+        np.testing.assert_allclose(self.numbers(result)[missing], np.broadcast_to(means, missing.shape)[missing])
+
+    def test_params(self):
+        imputer = KNNImputation(hyperparams=KnnHyperparameter.defaults())
+        with self.assertRaises(ValueError):
+            imputer.produce(inputs=self.test)
+        imputer.set_training_data(inputs=self.train)
+        imputer.fit(timeout=self.enough_time)
+
+        imputer2 = KNNImputation(hyperparams=KnnHyperparameter.defaults())
+        imputer2.set_params(params=imputer.get_params())
+        pd.testing.assert_frame_equal(imputer2.produce(inputs=self.test, timeout=self.enough_time).value,
+                                      imputer.produce(inputs=self.test, timeout=self.enough_time).value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,7 @@ def text2int(col):
 import pandas as pd
 import os
 
+import d3m.metadata.base as mbase
 from d3m.container.dataset import D3MDatasetLoader, Dataset, CSVLoader
 
 from dsbox.datapreprocessing.cleaner import MeanImputation, MeanHyperparameter
@@ -153,6 +154,25 @@ class TestMean(unittest.TestCase):
         result = imputer.produce(inputs=X[0:20], timeout=self.enough_time).value
         self.helper_impute_result_check(X[0:20], result)
 
+    def test_metadata_change(self):
+        """
+        batches with the same columns and dtypes but different metadata should not share the cached layout
+        """
+        imputer = MeanImputation(hyperparams=hp)
+        imputer.set_training_data(inputs=X)
+        imputer.fit(timeout=self.enough_time)
+        result = imputer.produce(inputs=X, timeout=self.enough_time).value
+        self.helper_impute_result_check(X, result)
+
+        # T3 is no longer an attribute, so it keeps its missing values
+        data2 = X.copy()
+        data2.metadata = X.metadata.remove_semantic_type(
+            (mbase.ALL_ELEMENTS, X.columns.get_loc("T3")), 'https://metadata.datadrivendiscovery.org/types/Attribute')
+        result2 = imputer.produce(inputs=data2, timeout=self.enough_time).value
+        self.assertTrue((pd.isnull(result2["T3"]) | (result2["T3"] == "")).any())
+        self.assertNotIn('https://metadata.datadrivendiscovery.org/types/Attribute', result2.metadata.query(
+            (mbase.ALL_ELEMENTS, X.columns.get_loc("T3")))['semantic_types'])
+
     def helper_impute_result_check(self, data, result):
         """
         check if the imputed reuslt valid
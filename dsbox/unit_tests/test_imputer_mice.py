@@ -1,85 +1,155 @@
-# """
-# test program for MICE, a TransformerPrimitive imputer
-# """
-# import sys
-#
-# sys.path.append("../")
-#
-#
-# def text2int(col):
-#     """
-#     convert column value from text to integer codes (0,1,2...)
-#     """
-#     return pd.DataFrame(col.astype('category').cat.codes, columns=[col.name])
-#
-#
-# import pandas as pd
-#
-# from dsbox.datapreprocessing.cleaner import MICE, MiceHyperparameter
-#
-# # global variables
-# data_name = "data.csv"
-# label_name = "targets.csv"  # make sure your label target is in the second column of this file
-# data = pd.read_csv(data_name, index_col='d3mIndex')
-# missing_value_mask = pd.isnull(data)
-# label = text2int(pd.read_csv(label_name, index_col='d3mIndex')["Class"])
-# hp = MiceHyperparameter.sample()
-#
-# import unittest
-#
-#
-# class TestMice(unittest.TestCase):
-#
-#     def setUp(self):
-#         self.imputer = MICE(hyperparams=hp)
-#
-#     def test_init(self):
-#         self.assertEqual(self.imputer._has_finished, False)
-#         self.assertEqual(self.imputer._iterations_done, False)
-#
-#     def test_run(self):
-#         result = self.imputer.produce(inputs=data, timeout=10).value
-#         self.helper_impute_result_check(data, result)
-#         self.assertEqual(self.imputer._has_finished, True)
-#         self.assertEqual(self.imputer._iterations_done, True)
-#
-#     def test_timeout(self):
-#         result = self.imputer.produce(inputs=data, timeout=0.00001).value
-#         self.assertEqual(self.imputer._has_finished, False)
-#         self.assertEqual(self.imputer._iterations_done, False)
-#
-#     def test_noMV(self):
-#         """
-#         test on the dataset has no missing values
-#         """
-#         result = self.imputer.produce(inputs=data, timeout=10).value
-#         result2 = self.imputer.produce(inputs=result, timeout=10).value  # result contains no missing value
-#
-#         self.assertEqual(result.equals(result2), True)
-#
-#     def helper_impute_result_check(self, data, result):
-#         """
-#         check if the imputed reuslt valid
-#         now, check for:
-#         1. contains no nan anymore
-#         2. orignal non-nan value should remain the same
-#         """
-#         # check 1
-#         self.assertEqual(pd.isnull(result).sum().sum(), 0)
-#
-#         # check 2
-#         # the original non-missing values must keep unchanged
-#         # to check, cannot use pd equals, since the imputer may convert:
-#         # 1 -> 1.0
-#         # have to do loop checking
-#         missing_value_mask = pd.isnull(data)
-#         for col_name in data:
-#             data_non_missing = data[~missing_value_mask[col_name]][col_name]
-#             result_non_missing = result[~missing_value_mask[col_name]][col_name]
-#             for i in data_non_missing.index:
-#                 self.assertEqual(data_non_missing[i] == result_non_missing[i], True,
-#                                  msg="not equals in column: {}".format(col_name))
-#
-#
-# if __name__ == '__main__':
-#     unittest.main()
+"""
+test program for MICE, an UnsupervisedLearnerPrimitive imputer
+"""
+import itertools
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import d3m.metadata.base as mbase
+from d3m import container
+
+from dsbox.datapreprocessing.cleaner import MICE, MiceHyperparameter
+from dsbox.datapreprocessing.cleaner import missing_value_pred as mvp
+
+ATTRIBUTE = 'https://metadata.datadrivendiscovery.org/types/Attribute'
+FLOAT = 'http://schema.org/Float'
+
+
+def make_table(rows, seed=0):
+    """
+    a d3mIndex, three numeric attributes, the first two nearly proportional, and a text attribute, with metadata
+    """
+    random = np.random.RandomState(seed)
+    base = random.randn(rows)
+    frame = pd.DataFrame({
+        'd3mIndex': np.arange(rows),
+        'x0': base + 0.05 * random.randn(rows),
+        'x1': 2 * base + 0.05 * random.randn(rows),
+        'x2': random.randn(rows),
+        'name': random.choice(['a', 'b', 'c'], rows),
+    })
+    data = container.DataFrame(frame, generate_metadata=True)
+    data.metadata = data.metadata.add_semantic_type((mbase.ALL_ELEMENTS, 0),
+                                                    'https://metadata.datadrivendiscovery.org/types/PrimaryKey')
+    for col in (1, 2, 3):
+        data.metadata = data.metadata.add_semantic_type((mbase.ALL_ELEMENTS, col), FLOAT)
+    for col in (1, 2, 3, 4):
+        data.metadata = data.metadata.add_semantic_type((mbase.ALL_ELEMENTS, col), ATTRIBUTE)
+    return data
+
+
+def with_missing(data, cells):
+    """
+    a copy of data with the cells (rows, column) missing
+    """
+    result = data.copy()
+    for rows, col in cells:
+        result.iloc[rows, col] = np.nan
+    return result
+
+
+class TestMice(unittest.TestCase):
+
+    def setUp(self):
+        self.enough_time = 100
+        self.complete = make_table(200, seed=1)
+        self.train = with_missing(make_table(500), [(slice(0, 500, 5), 1), (slice(2, 500, 7), 2)])
+        # missing values in the two proportional columns, never both in the same row
+        self.test = with_missing(self.complete, [(slice(0, 200, 4), 1), (slice(1, 200, 4), 2)])
+        self.missing = pd.isnull(self.test.iloc[:, [1, 2, 3]]).values
+
+    def imputer(self, **hyperparams):
+        imputer = MICE(hyperparams=MiceHyperparameter.defaults().replace(hyperparams))
+        imputer.set_training_data(inputs=self.train)
+        imputer.fit(timeout=self.enough_time)
+        self.assertTrue(imputer._has_finished)
+        return imputer
+
+    def numbers(self, data):
+        return data.iloc[:, [1, 2, 3]].values.astype(float)
+
+    def means(self):
+        return np.broadcast_to(np.nanmean(self.numbers(self.train), axis=0), self.missing.shape)[self.missing]
+
+    def test_run(self):
+        result = self.imputer().produce(inputs=self.test, timeout=self.enough_time).value
+        self.assertEqual(result.shape, self.test.shape)
+        self.assertEqual(pd.isnull(result).sum().sum(), 0)
+
+        # the observed cells, and the columns that are not numeric attributes, are kept
+        observed = ~pd.isnull(self.test).values
+        self.assertTrue((result.values[observed] == self.test.values[observed]).all())
+
+        # each of the proportional columns is imputed from the other, much closer than by the mean
+        errors = np.abs(self.numbers(result) - self.numbers(self.complete))[self.missing]
+        mean_errors = np.abs(self.means() - self.numbers(self.complete)[self.missing])
+        self.assertLess(errors.mean(), 0.2 * mean_errors.mean())
+
+    def test_produce_iterations(self):
+        """
+        with no sweep of the models, the missing cells get the training means
+        """
+        result = self.imputer(produce_iterations=0).produce(inputs=self.test, timeout=self.enough_time).value
+        np.testing.assert_allclose(self.numbers(result)[self.missing], self.means())
+
+        result = self.imputer().produce(inputs=self.test, timeout=self.enough_time, iterations=0).value
+        np.testing.assert_allclose(self.numbers(result)[self.missing], self.means())
+
+    def test_latency_budget(self):
+        # no time for any sweep
+        result = self.imputer(latency_budget=1e-9).produce(inputs=self.test, timeout=self.enough_time).value
+        np.testing.assert_allclose(self.numbers(result)[self.missing], self.means())
+
+        # a clock that ticks once per call: the deadline is set at 0, the column updates are checked at 1, 2, 3...,
+        # so that a budget of 2.5 leaves time for the updates of the two missing columns, a single sweep. The rows
+        # missing both columns change with every sweep.
+        test = with_missing(self.test, [(slice(2, 200, 8), 1), (slice(2, 200, 8), 2)])
+        imputer = self.imputer(latency_budget=2.5)
+        with mock.patch('time.perf_counter', side_effect=itertools.count()):
+            result = imputer.produce(inputs=test, timeout=self.enough_time).value
+        expected = self.imputer().produce(inputs=test, timeout=self.enough_time, iterations=1).value
+        np.testing.assert_allclose(self.numbers(result), self.numbers(expected))
+        unlimited = self.imputer().produce(inputs=test, timeout=self.enough_time).value
+        self.assertFalse(np.allclose(self.numbers(result), self.numbers(unlimited)))
+
+    def test_warm_start(self):
+        """
+        fitting again starts from the models already fitted, when warm_start is set and the columns are the same
+        """
+        for warm_start in (False, True):
+            imputer = self.imputer(warm_start=warm_start)
+            previous = imputer.get_params()['chained_equations']
+            imputer.set_training_data(inputs=with_missing(make_table(300, seed=2), [(slice(0, 300, 3), 2)]))
+            with mock.patch.object(mvp.ChainedEquations, 'fit', wraps=mvp.ChainedEquations.fit) as fit:
+                imputer.fit(timeout=self.enough_time, iterations=1)
+            self.assertIs(fit.call_args[0][3], previous if warm_start else None)
+            self.assertIsNot(imputer.get_params()['chained_equations'], previous)
+
+            result = imputer.produce(inputs=self.test, timeout=self.enough_time).value
+            self.assertEqual(pd.isnull(result).sum().sum(), 0)
+
+        # other columns, the previous models do not apply
+        imputer = self.imputer(warm_start=True)
+        train = self.train.remove_columns([3])
+        imputer.set_training_data(inputs=train)
+        with mock.patch.object(mvp.ChainedEquations, 'fit', wraps=mvp.ChainedEquations.fit) as fit:
+            imputer.fit(timeout=self.enough_time)
+        self.assertIsNone(fit.call_args[0][3])
+
+    def test_params(self):
+        imputer = MICE(hyperparams=MiceHyperparameter.defaults())
+        with self.assertRaises(ValueError):
+            imputer.produce(inputs=self.test)
+
+        imputer = self.imputer()
+        imputer2 = MICE(hyperparams=MiceHyperparameter.defaults())
+        imputer2.set_params(params=imputer.get_params())
+        pd.testing.assert_frame_equal(imputer2.produce(inputs=self.test, timeout=self.enough_time).value,
+                                      imputer.produce(inputs=self.test, timeout=self.enough_time).value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+test program for MultiTableFeaturization, a TransformerPrimitive joining the tables of a dataset, and its helper
+"""
+import collections
+import os
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import d3m.metadata.base as mbase
+from d3m.container.dataset import D3MDatasetLoader
+
+from dsbox.datapreprocessing.featurizer.multiTable import multi_table_featurizer
+from dsbox.datapreprocessing.featurizer.multiTable.helper import Aggregator, JoinStep, aggregate_table, plan_joins
+from dsbox.datapreprocessing.featurizer.multiTable.multi_table_featurizer import MultiTableFeaturization, \
+    MultiTableFeaturizationHyperparams
+
+# global variables
+dataset_file_path = "dsbox/unit_tests/resources/two_table_data/datasetDoc.json"
+
+dataset = D3MDatasetLoader()
+dataset = dataset.load('file://{dataset_doc_path}'.format(dataset_doc_path=os.path.abspath(dataset_file_path)))
+
+
+class TestAggregate(unittest.TestCase):
+
+    def setUp(self):
+        # transactions of accounts, with their own primary key; the names have no "_", which separates them in the keys
+        self.trans = pd.DataFrame({
+            'd3mIndex': ['0', '1', '2', '3', '4'],
+            'account': ['a', 'b', 'a', 'a', 'b'],
+            'amount': ['10', '20', '30', '40', '50'],
+            'kind': ['x', 'y', 'x', 'z', 'y'],
+        })
+        self.account = pd.DataFrame({'account': ['a', 'b', 'c'], 'district': ['1', '2', '1']})
+
+    def test_aggregate_table(self):
+        result = aggregate_table(self.trans, 'account', 'trans', count_columns=('d3mIndex',))
+        self.assertEqual(list(result.index), ['a', 'b'])
+        self.assertEqual(list(result['trans_account_COUNT']), [3, 2])
+        self.assertEqual(list(result['trans_amount_SUM']), [80, 70])
+        self.assertEqual(list(result['trans_kind_NUNIQUE']), [2, 1])
+        # the primary key is counted, but not summed or averaged
+        self.assertEqual(list(result['trans_d3mIndex_COUNT']), [3, 2])
+        self.assertEqual([column for column in result.columns if column.startswith('trans_d3mIndex')],
+                         ['trans_d3mIndex_COUNT'])
+
+    def test_aggregator_key_columns(self):
+        """
+        the key columns of the metadata are aggregated by their count only
+        """
+        data = {'trans': self.trans, 'account': self.account}
+        relations = [('account_account', 'trans_account')]
+        aggregator = Aggregator(relations, data, False, key_columns={'trans_d3mIndex', 'account_account'})
+        # five transactions of three accounts, aggregated rather than joined
+        result = aggregator.forward('account_account')
+        self.assertEqual(result.shape[0], 3)
+        self.assertEqual(list(result['trans_d3mIndex_COUNT']), [3, 2, 0])
+        self.assertNotIn('trans_d3mIndex_SUM', result.columns)
+        self.assertEqual(list(result['trans_amount_MAX'][:2]), [40, 50])
+
+        aggregator = Aggregator(relations, data, False)
+        self.assertIn('trans_d3mIndex_SUM', aggregator.forward('account_account').columns)
+
+    def test_plan(self):
+        """
+        the joins adding the fewest rows come first, and the one that would grow the table too much is aggregated
+        """
+        self.assertEqual(plan_joins(10, [('x', 30, 100), ('y', 10, 50), ('z', 10, 20)], 1.0),
+                         [JoinStep('z', False), JoinStep('y', False), JoinStep('x', True)])
+        self.assertEqual(plan_joins(10, [('x', 30, 100)], 3.0), [JoinStep('x', False)])
+
+        data = {'trans': self.trans, 'account': self.account}
+        relations = [('account_account', 'trans_account')]
+        # the five transactions of a and b, and c without any, make six rows
+        result = Aggregator(relations, data, False, max_row_growth=2.0).forward('account_account')
+        self.assertEqual(result.shape[0], 6)
+        self.assertIn('trans_amount', result.columns)
+
+        cache = collections.OrderedDict()
+        result = Aggregator(relations, data, False, cache=cache).forward('account_account')
+        self.assertEqual(result.shape[0], 3)
+        self.assertIn('trans_amount_SUM', result.columns)
+        plans = [value for key, value in cache.items() if key[0] == 'plan']
+        self.assertEqual(plans, [[JoinStep('trans_account', True)]])
+
+
+class TestMultiTableFeaturization(unittest.TestCase):
+
+    def setUp(self):
+        self.enough_time = 100
+        self.primitive = MultiTableFeaturization(hyperparams=MultiTableFeaturizationHyperparams.defaults())
+
+    def produce(self, inputs):
+        return self.primitive.produce(inputs=inputs, timeout=self.enough_time).value
+
+    def main_rows(self, rows):
+        """
+        the dataset with the given rows of the main table only, as at test time
+        """
+        inputs = dataset.copy()
+        inputs['learningData'] = inputs['learningData'].iloc[rows].reset_index(drop=True)
+        inputs.metadata = inputs.metadata.update(('learningData',), {'dimension': {'length': len(rows)}})
+        return inputs
+
+    def test_produce(self):
+        result = self.produce(dataset)
+        self.assertEqual(result.shape[0], dataset['learningData'].shape[0])
+        self.assertEqual(list(result.columns[:4]), ['learningData_d3mIndex', 'learningData_customer',
+                                                    'learningData_amount', 'learningData_class'])
+        customers = dataset['customers'].set_index('customerId')
+        for i in range(result.shape[0]):
+            customer = result['learningData_customer'].iloc[i]
+            self.assertEqual(result['customers_city'].iloc[i], customers.loc[customer, 'city'])
+
+        # the metadata of the columns is the metadata of the columns they come from
+        class_column = list(result.columns).index('learningData_class')
+        self.assertIn('https://metadata.datadrivendiscovery.org/types/SuggestedTarget',
+                      result.metadata.query((mbase.ALL_ELEMENTS, class_column))['semantic_types'])
+
+    def test_cache_reuse(self):
+        """
+        a second produce with the same tables and metadata finds neither the relations nor the artifacts again
+        """
+        expected = self.produce(dataset)
+        artifacts = dict(self.primitive._artifacts)
+        with mock.patch.object(MultiTableFeaturization, '_find_relations') as find_relations:
+            result = self.produce(dataset)
+        find_relations.assert_not_called()
+        pd.testing.assert_frame_equal(pd.DataFrame(result), pd.DataFrame(expected))
+        for key, value in self.primitive._artifacts.items():
+            self.assertIs(value, artifacts[key], msg=str(key))
+
+    def test_metadata_change(self):
+        """
+        the relations and the column metadata are found again when the metadata of the tables changes
+        """
+        self.produce(dataset)
+        inputs = dataset.copy()
+        inputs.metadata = inputs.metadata.add_semantic_type(
+            ('learningData', mbase.ALL_ELEMENTS, 2), 'https://metadata.datadrivendiscovery.org/types/CategoricalData')
+        result = self.produce(inputs)
+        amount_column = list(result.columns).index('learningData_amount')
+        self.assertIn('https://metadata.datadrivendiscovery.org/types/CategoricalData',
+                      result.metadata.query((mbase.ALL_ELEMENTS, amount_column))['semantic_types'])
+
+    def test_cache_size(self):
+        with mock.patch.object(multi_table_featurizer, 'ARTIFACT_CACHE_SIZE', 2):
+            for index in range(4):
+                inputs = dataset.copy()
+                inputs.metadata = inputs.metadata.update(('learningData', mbase.ALL_ELEMENTS, 2),
+                                                         {'description': str(index)})
+                self.produce(inputs)
+            self.assertEqual(len(self.primitive._relations_cache), 2)
+
+    def test_test_time_produce(self):
+        """
+        producing on new rows of the main table only joins them, to the artifacts of the joined table kept from the
+        first produce
+        """
+        expected = self.produce(dataset)
+        artifacts = dict(self.primitive._artifacts)
+        rows = [3, 7, 11, 19]
+        with mock.patch.object(MultiTableFeaturization, '_find_relations') as find_relations:
+            result = self.produce(self.main_rows(rows))
+        find_relations.assert_not_called()
+        self.assertEqual(result.shape[0], len(rows))
+        pd.testing.assert_frame_equal(pd.DataFrame(result).reset_index(drop=True),
+                                      pd.DataFrame(expected).iloc[rows].reset_index(drop=True))
+        for key, value in artifacts.items():
+            self.assertIs(self.primitive._artifacts.get(key), value, msg=str(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+test program for the cache of profiling results shared by the profiler and the cleaning featurizer
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from dsbox.datapreprocessing.cleaner.dependencies import profile_cache
+
+
+class TestProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.value = {'columns': list(range(100))}
+        self.size = len(pickle.dumps(self.value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_fingerprint(self):
+        table = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+        key = profile_cache.table_fingerprint(table)
+        self.assertEqual(profile_cache.table_fingerprint(table.copy()), key)
+        self.assertEqual(profile_cache.table_fingerprint(table.set_index(table['b'])), key)
+        self.assertNotEqual(profile_cache.table_fingerprint(table.assign(a=[1, 2, 4])), key)
+        self.assertNotEqual(profile_cache.table_fingerprint(table, None, 'hyperparams'), key)
+
+    def test_memory(self):
+        cache = profile_cache.ProfileCache(10 * self.size)
+        self.assertIsNone(cache.get('key'))
+        cache.put('key', self.value)
+        result = cache.get('key')
+        self.assertEqual(result, self.value)
+        # a copy, so that the caller can change it
+        result['columns'].append(100)
+        self.assertEqual(cache.get('key'), self.value)
+
+    def test_memory_eviction(self):
+        cache = profile_cache.ProfileCache(2 * self.size)
+        cache.put('a', self.value)
+        cache.put('b', self.value)
+        # a is now the most recently used
+        cache.get('a')
+        cache.put('c', self.value)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+
+        # larger than the cache
+        cache.put('big', list(range(10 * self.size)))
+        self.assertIsNone(cache.get('big'))
+
+    def test_disk(self):
+        directory = os.path.join(self.directory, 'cache')
+        cache = profile_cache.ProfileCache(10 * self.size, directory)
+        self.assertEqual(cache.directory, directory)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+        cache.put('key', self.value)
+        self.assertTrue(os.path.exists(os.path.join(directory, 'key.pkl')))
+
+        # a new cache, as in another process, reads the entry from the disk
+        cache = profile_cache.ProfileCache(10 * self.size, directory)
+        self.assertIsNone(cache.get('other'))
+        self.assertEqual(cache.get('key'), self.value)
+
+        cache.clear()
+        self.assertEqual(os.listdir(directory), [])
+        self.assertIsNone(cache.get('key'))
+
+    def test_disk_eviction(self):
+        cache = profile_cache.ProfileCache(2 * self.size, self.directory)
+        for index, key in enumerate(['a', 'b']):
+            cache.put(key, self.value)
+            os.utime(cache._path(key), (index, index))
+        cache.put('c', self.value)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['b.pkl', 'c.pkl'])
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), 'no file owners')
+    def test_shared_directory(self):
+        """
+        a directory that other users can write to is not used, the entries stay in memory
+        """
+        os.chmod(self.directory, 0o777)
+        cache = profile_cache.ProfileCache(10 * self.size, self.directory)
+        self.assertIsNone(cache.directory)
+        cache.put('key', self.value)
+        self.assertEqual(cache.get('key'), self.value)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_get_cache(self):
+        self.assertIsNone(profile_cache.get_cache('none', 100))
+        self.assertIsNone(profile_cache.get_cache('memory', 100).directory)
+        cache = profile_cache.get_cache('disk', 100, self.directory)
+        self.assertEqual(cache.directory, self.directory)
+        self.assertIs(profile_cache.get_cache('disk', 200, self.directory), cache)
+        self.assertEqual(cache.max_bytes, 200)
+        with self.assertRaises(ValueError):
+            profile_cache.get_cache('file', 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+test program for the chunked profiling of the profiler, against the in-memory profiling
+"""
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from dsbox.datapreprocessing.cleaner.data_profile import _profile_column
+from dsbox.datapreprocessing.cleaner.dependencies import feature_compute_stream as fc_stream
+
+features = ["number_of_missing_values", "ratio_of_missing_values", "number_of_distinct_values",
+            "ratio_of_distinct_values", "most_common_raw_values"]
+
+numeric_features = features + ["number_of_numeric_values", "ratio_of_numeric_values",
+                               "number_of_positive_numeric_values", "number_of_negative_numeric_values",
+                               "number_of_numeric_values_equal_0"]
+
+text_features = numeric_features + ["number_of_values_containing_numeric_char",
+                                    "ratio_of_values_containing_numeric_char", "number_of_distinct_tokens",
+                                    "ratio_of_distinct_tokens", "number_of_distinct_tokens_split_by_punctuation",
+                                    "number_of_tokens_split_by_punctuation_containing_numeric_char"]
+
+
+def chunks(frame, chunk_size):
+    return (frame.iloc[start:start + chunk_size] for start in range(0, frame.shape[0], chunk_size))
+
+
+class TestProfilerChunked(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.RandomState(0)
+        self.column = pd.Series(random.rand(1000) < 0.3, name='flag')
+
+        # every block of 20 rows has a missing value, so that every chunk read by read_csv is float
+        numbers = np.round(random.randn(200) * 10, 2)
+        numbers[::7] = np.nan
+        texts = pd.Series(random.choice(['red car', 'blue-car 2', 'a b', 'x1 y2', '3 3'], 200))
+        texts[::11] = np.nan
+        self.csv = pd.DataFrame({'number': numbers, 'text': texts}).to_csv(index=False)
+
+    def assert_features(self, result, expected, feature_list, message):
+        for feature in feature_list:
+            self.assertEqual(feature in result, feature in expected, "{} {}".format(feature, message))
+            if feature in expected and feature.startswith("most_common_"):
+                self.assert_top(result[feature], expected[feature], "{} {}".format(feature, message))
+            elif feature in expected:
+                self.assertEqual(result[feature], expected[feature], "{} {}".format(feature, message))
+
+    def assert_top(self, result, expected, message):
+        """
+        the order of the values with the same count, and which of them make the top k, is up to value_counts
+        """
+        self.assertEqual([x['count'] for x in result], [x['count'] for x in expected], message)
+        lowest = expected[-1]['count']
+        self.assertEqual({x['name'] for x in result if x['count'] > lowest},
+                         {x['name'] for x in expected if x['count'] > lowest}, message)
+
+    def assert_csv(self, csv, feature_list):
+        whole = pd.read_csv(io.StringIO(csv))
+        for chunk_size in (20, 50, 137):
+            result = fc_stream.profile_chunks(pd.read_csv(io.StringIO(csv), chunksize=chunk_size), feature_list, 10)
+            for index, column_name in enumerate(whole):
+                expected = _profile_column(whole[column_name], feature_list, 10, 3)
+                self.assert_features(result[index], expected, feature_list,
+                                     "column={} chunk_size={}".format(column_name, chunk_size))
+
+    def test_bool_column(self):
+        expected = _profile_column(self.column, features, 10, 3)
+        for chunk_size in (50, 137, 500):
+            result = fc_stream.profile_chunks(chunks(self.column.to_frame(), chunk_size), features, 10)[0]
+            for feature in features:
+                self.assertIn(feature, result, "chunk_size={}".format(chunk_size))
+                self.assertEqual(result[feature], expected[feature], "{} chunk_size={}".format(feature, chunk_size))
+
+    def test_numeric_and_text_columns(self):
+        self.assert_csv(self.csv, text_features)
+
+    def test_numbers_then_text(self):
+        """
+        a column read as numbers by the first chunks and as text by a later one should be profiled as text
+        """
+        values = [str(1 + i % 4) for i in range(40)] + ['a', 'b'] * 10
+        self.assert_csv(pd.DataFrame({'mixed': values}).to_csv(index=False), text_features)
+        result = fc_stream.profile_chunks(pd.read_csv(io.StringIO(pd.DataFrame({'mixed': values}).to_csv(index=False)),
+                                                      chunksize=20), features, 10)[0]
+        self.assertEqual(result["number_of_missing_values"], 0)
+        self.assertEqual(result["number_of_distinct_values"], 6)
+
+    def test_text_then_numbers(self):
+        values = ['a b', 'c-1'] * 10 + [str(i % 5) for i in range(40)]
+        self.assert_csv(pd.DataFrame({'mixed': values}).to_csv(index=False), text_features)
+
+    def test_bool_then_text(self):
+        values = ['True', 'False'] * 20 + ['maybe'] * 20
+        self.assert_csv(pd.DataFrame({'mixed': values}).to_csv(index=False), features)
+
+
+if __name__ == '__main__':
+    unittest.main()
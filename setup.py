@@ -18,6 +18,7 @@ setup(name='dsbox-primitives',
       license='MIT',
       packages=[
                 'dsbox',
+                'dsbox.common',
                 'dsbox.datapreprocessing',
                 'dsbox.datapreprocessing.cleaner',
                 'dsbox.datapostprocessing',
@@ -37,7 +38,9 @@ setup(name='dsbox-primitives',
               'classification.lstm.DSBOX = dsbox.datapreprocessing.featurizer.image:LSTM',
               'data_cleaning.cleaning_featurizer.DSBOX = dsbox.datapreprocessing.cleaner:CleaningFeaturizer',
               'data_cleaning.column_fold.DSBOX = dsbox.datapreprocessing.cleaner:FoldColumns',
+              'data_cleaning.k_neighbors.DSBOX = dsbox.datapreprocessing.cleaner:KNNImputation',
               'data_cleaning.label_encoder.DSBOX = dsbox.datapreprocessing.cleaner:Labler',
+              'data_cleaning.MiceImputation.DSBOX = dsbox.datapreprocessing.cleaner:MICE',
               'data_preprocessing.dataframe_to_tensor.DSBOX = dsbox.datapreprocessing.featurizer.image:DataFrameToTensor',
               'data_preprocessing.do_nothing.DSBOX = dsbox.datapreprocessing.featurizer.pass:DoNothing',
               'data_preprocessing.do_nothing_for_dataset.DSBOX = dsbox.datapreprocessing.featurizer.pass:DoNothingForDataset',